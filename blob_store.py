@@ -0,0 +1,67 @@
+"""
+评审文本块存储
+按内容寻址（SHA-256）把较长的评审文本压缩后写入磁盘，结果记录中只保留引用，
+导出时再逐条读取，运行期间驻留内存不随评审文本总量增长。
+"""
+
+import os
+import zlib
+import hashlib
+
+# 引用格式：blob:<sha256>
+BLOB_PREFIX = 'blob:'
+
+# 短于该长度的文本直接保留在结果记录中
+DEFAULT_MIN_CHARS = 1024
+
+def get_default_blob_dir():
+    """默认文本库目录（REVIEW_BLOB_DIR 环境变量，默认与脚本同目录）"""
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    return os.getenv('REVIEW_BLOB_DIR') or os.path.join(script_dir, "评审文本库")
+
+def is_blob_ref(value):
+    return isinstance(value, str) and value.startswith(BLOB_PREFIX) and len(value) == len(BLOB_PREFIX) + 64
+
+class BlobStore:
+    """
+    内容寻址的压缩文本库
+
+    文本按 SHA-256 存放在 <root>/<前两位>/<其余位>.z，相同内容只写一次；
+    先写临时文件再原子替换，多个进程同时写入同一文本也不会产生损坏的文件。
+    """
+
+    def __init__(self, root=None, min_chars=DEFAULT_MIN_CHARS, level=6):
+        self.root = root or get_default_blob_dir()
+        self.min_chars = min_chars
+        self.level = level
+
+    def _path(self, digest):
+        return os.path.join(self.root, digest[:2], digest[2:] + '.z')
+
+    def put(self, text):
+        """写入文本并返回引用；短文本原样返回"""
+        if not isinstance(text, str) or len(text) < self.min_chars:
+            return text
+        data = text.encode('utf-8')
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            temp_path = f"{path}.{os.getpid()}.tmp"
+            with open(temp_path, 'wb') as f:
+                f.write(zlib.compress(data, self.level))
+            os.replace(temp_path, path)
+        return BLOB_PREFIX + digest
+
+    def get(self, ref):
+        """按引用读取文本"""
+        with open(self._path(ref[len(BLOB_PREFIX):]), 'rb') as f:
+            return zlib.decompress(f.read()).decode('utf-8')
+
+    def resolve(self, value):
+        """引用替换为文本，其余值原样返回"""
+        return self.get(value) if is_blob_ref(value) else value
+
+    def resolve_row(self, row):
+        """返回把引用替换为文本后的结果记录副本"""
+        return {key: self.resolve(value) for key, value in row.items()}
@@ -0,0 +1,340 @@
+"""
+token 与费用预算
+按模型实时累计每次调用的提示/输出 token 与估算费用，并按运行与接口两级上限逐级收紧：
+- 用量达到上限的 BUDGET_THROTTLE_AT（默认 70%）后限流：相邻两次调用至少间隔 BUDGET_THROTTLE_DELAY 秒
+- 达到 BUDGET_DOWNGRADE_AT（默认 85%）后改用更便宜的快速模型（CASCADE_FAST_MODEL）
+- 达到上限后拒绝新的调用；运行级上限由评审流程在需求/接口边界停止并写出检查点，下次运行从检查点继续
+运行开始前可按提示长度与历史输出估算整次运行的费用。
+"""
+
+import os
+import json
+import time
+import threading
+
+from model_config import load_env
+
+# 各模型的 (输入, 输出) 单价，单位：元 / 百万 token（OpenAI 按 1 美元 ≈ 7.2 元折算）
+MODEL_PRICES = {
+    'deepseek-reasoner': (4.0, 16.0),
+    'deepseek-chat': (2.0, 8.0),
+    'deepseek-coder': (2.0, 8.0),
+    'gpt-4o': (18.0, 72.0),
+    'gpt-4': (216.0, 432.0),
+    'gpt-3.5-turbo': (3.6, 10.8),
+}
+# 未知模型按较高单价估算，宁可高估
+DEFAULT_PRICE = (20.0, 80.0)
+
+# 用量状态，按严重程度递增
+STATE_OK = 'ok'
+STATE_THROTTLE = 'throttle'
+STATE_DOWNGRADE = 'downgrade'
+STATE_STOP = 'stop'
+_STATE_ORDER = [STATE_OK, STATE_THROTTLE, STATE_DOWNGRADE, STATE_STOP]
+
+def _parse_prices(spec):
+    """解析 BUDGET_PRICES，例如 "deepseek-reasoner=4/16,gpt-4o=18/72" """
+    prices = {}
+    for entry in (spec or '').split(','):
+        if '=' not in entry:
+            continue
+        model, value = entry.split('=', 1)
+        try:
+            prompt_price, completion_price = (float(v) for v in value.split('/'))
+        except ValueError:
+            print(f"⚠️ 忽略无法解析的单价: {entry.strip()}")
+            continue
+        prices[model.strip()] = (prompt_price, completion_price)
+    return prices
+
+def get_model_price(model_name):
+    """模型的 (输入, 输出) 单价（元 / 百万 token），BUDGET_PRICES 中的设置优先"""
+    load_env()
+    overrides = _parse_prices(os.getenv('BUDGET_PRICES'))
+    return overrides.get(model_name) or MODEL_PRICES.get(model_name, DEFAULT_PRICE)
+
+def estimate_cost(model_name, prompt_tokens, completion_tokens):
+    """按单价估算费用（元）"""
+    prompt_price, completion_price = get_model_price(model_name)
+    return (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1e6
+
+def _optional_float(name):
+    value = os.getenv(name, '').strip()
+    return float(value) if value else None
+
+class BudgetGovernor:
+    """
+    预算控制器（线程安全）
+
+    Args:
+        run_cost / run_tokens: 整次运行的费用（元）/ token 上限，None 表示不限
+        interface_cost / interface_tokens: 单个接口的费用 / token 上限（批量评审）
+        throttle_at / downgrade_at: 触发限流 / 降级的用量比例
+        throttle_delay: 限流时相邻两次调用的最小间隔（秒）
+    """
+
+    def __init__(self, run_cost=None, run_tokens=None, interface_cost=None, interface_tokens=None,
+                 throttle_at=0.7, downgrade_at=0.85, throttle_delay=5.0):
+        self.run_cost = run_cost
+        self.run_tokens = run_tokens
+        self.interface_cost = interface_cost
+        self.interface_tokens = interface_tokens
+        self.throttle_at = throttle_at
+        self.downgrade_at = downgrade_at
+        self.throttle_delay = throttle_delay
+        self.models = {}
+        self.run = {'tokens': 0, 'cost': 0.0}
+        self.interface = None
+        self.interface_name = None
+        self.refused = 0
+        self.downgraded = 0
+        self.throttled = 0
+        self._last_call = 0.0
+        self._fast_config = None
+        self._lock = threading.Lock()
+
+    @property
+    def limited(self):
+        """是否设置了任何上限"""
+        return any(v is not None for v in (self.run_cost, self.run_tokens, self.interface_cost, self.interface_tokens))
+
+    def record(self, model_name, usage):
+        """累计一次调用（或续写的一段）的 usage"""
+        usage = usage or {}
+        prompt_tokens = usage.get('prompt_tokens', 0) or 0
+        completion_tokens = usage.get('completion_tokens', 0) or 0
+        cost = estimate_cost(model_name, prompt_tokens, completion_tokens)
+        with self._lock:
+            stats = self.models.setdefault(
+                model_name, {'calls': 0, 'prompt_tokens': 0, 'completion_tokens': 0, 'cost': 0.0})
+            stats['calls'] += 1
+            stats['prompt_tokens'] += prompt_tokens
+            stats['completion_tokens'] += completion_tokens
+            stats['cost'] += cost
+            for scope in (self.run, self.interface):
+                if scope is not None:
+                    scope['tokens'] += prompt_tokens + completion_tokens
+                    scope['cost'] += cost
+
+    def begin_interface(self, name):
+        """开始累计一个接口的用量"""
+        with self._lock:
+            self.interface_name = name
+            self.interface = {'tokens': 0, 'cost': 0.0, 'refused': 0}
+
+    def end_interface(self):
+        """结束接口用量累计，返回该接口的用量（含被拒绝的调用数）"""
+        with self._lock:
+            scope, self.interface, self.interface_name = self.interface, None, None
+            return scope or {'tokens': 0, 'cost': 0.0, 'refused': 0}
+
+    def _fractions(self):
+        """(运行级用量比例, 接口级用量比例)"""
+        def fraction(scope, cost_limit, token_limit):
+            if scope is None:
+                return 0.0
+            values = [0.0]
+            if cost_limit:
+                values.append(scope['cost'] / cost_limit)
+            if token_limit:
+                values.append(scope['tokens'] / token_limit)
+            return max(values)
+        return (fraction(self.run, self.run_cost, self.run_tokens),
+                fraction(self.interface, self.interface_cost, self.interface_tokens))
+
+    def _state_for(self, fraction):
+        if fraction >= 1.0:
+            return STATE_STOP
+        if fraction >= self.downgrade_at:
+            return STATE_DOWNGRADE
+        if fraction >= self.throttle_at:
+            return STATE_THROTTLE
+        return STATE_OK
+
+    def state(self):
+        """当前（运行级与接口级中较严重的）用量状态"""
+        with self._lock:
+            run_fraction, interface_fraction = self._fractions()
+        return max(self._state_for(run_fraction), self._state_for(interface_fraction), key=_STATE_ORDER.index)
+
+    def should_stop(self):
+        """运行级预算是否已用尽（评审流程据此在边界处停止并写出检查点）"""
+        with self._lock:
+            run_fraction, _ = self._fractions()
+        return run_fraction >= 1.0
+
+    def _downgrade_config(self, config):
+        """更便宜的快速模型配置，没有更便宜的模型时返回 None"""
+        from model_config import get_model_config, get_fast_model_name
+
+        fast_model = get_fast_model_name()
+        if not fast_model or fast_model == getattr(config, 'model_name', None):
+            return None
+        if sum(get_model_price(fast_model)) >= sum(get_model_price(config.model_name)):
+            return None
+        with self._lock:
+            if self._fast_config is None or self._fast_config.model_name != fast_model:
+                self._fast_config = get_model_config(fast_model)
+            return self._fast_config
+
+    def admit(self, config):
+        """
+        调用前的准入检查
+
+        Returns:
+            本次调用使用的模型配置（可能已降级）；预算用尽时返回 None
+        """
+        state = self.state()
+        if state == STATE_STOP:
+            with self._lock:
+                self.refused += 1
+                if self.interface is not None:
+                    self.interface['refused'] += 1
+            return None
+        if state == STATE_DOWNGRADE:
+            cheaper = self._downgrade_config(config)
+            if cheaper is not None:
+                with self._lock:
+                    self.downgraded += 1
+                config = cheaper
+        throttle = state in (STATE_THROTTLE, STATE_DOWNGRADE) and self.throttle_delay > 0
+        with self._lock:
+            now = time.time()
+            # 限流时为本次调用预约发送时刻，并发线程依次错开
+            start = max(now, self._last_call + self.throttle_delay) if throttle else now
+            self._last_call = max(self._last_call, start)
+            self.throttled += 1 if throttle else 0
+        if start > now:
+            time.sleep(start - now)
+        return config
+
+    def refusal_message(self):
+        with self._lock:
+            run_fraction, _ = self._fractions()
+        scope = "运行" if run_fraction >= 1.0 else f"接口 {self.interface_name} 的"
+        return f"{scope}预算已用尽，未发送请求"
+
+    def report(self):
+        with self._lock:
+            return {
+                'models': {name: dict(stats) for name, stats in self.models.items()},
+                'tokens': self.run['tokens'],
+                'cost': self.run['cost'],
+                'refused': self.refused,
+                'downgraded': self.downgraded,
+                'throttled': self.throttled,
+            }
+
+    def format_report(self):
+        """格式化实际用量，供最终统计输出"""
+        r = self.report()
+        lines = [f"实际用量: {r['tokens']} token，约 ¥{r['cost']:.2f}" + (
+            f"（运行预算 ¥{self.run_cost:.2f}）" if self.run_cost else "") + (
+            f"（运行 token 上限 {self.run_tokens}）" if self.run_tokens else "")]
+        for name, stats in sorted(r['models'].items()):
+            lines.append(
+                f"   {name}: {stats['calls']} 次调用，提示 {stats['prompt_tokens']} + "
+                f"输出 {stats['completion_tokens']} token，约 ¥{stats['cost']:.2f}")
+        if r['throttled'] or r['downgraded'] or r['refused']:
+            lines.append(f"   限流 {r['throttled']} 次，降级 {r['downgraded']} 次，拒绝 {r['refused']} 次")
+        return "\n".join(lines)
+
+_governor = None
+_governor_lock = threading.Lock()
+
+def get_budget_governor():
+    """
+    全局预算控制器（始终统计用量，设置上限后才限流/降级/停止）
+
+    相关环境变量：
+        BUDGET_RUN_COST / BUDGET_RUN_TOKENS              整次运行的费用（元）/ token 上限
+        BUDGET_INTERFACE_COST / BUDGET_INTERFACE_TOKENS  单个接口的费用 / token 上限
+        BUDGET_THROTTLE_AT=0.7 / BUDGET_DOWNGRADE_AT=0.85  触发限流 / 降级的用量比例
+        BUDGET_THROTTLE_DELAY=5                          限流时相邻调用的最小间隔（秒）
+        BUDGET_PRICES                                    单价覆盖，例如 deepseek-reasoner=4/16
+    """
+    global _governor
+    with _governor_lock:
+        if _governor is None:
+            load_env()
+            run_tokens = _optional_float('BUDGET_RUN_TOKENS')
+            interface_tokens = _optional_float('BUDGET_INTERFACE_TOKENS')
+            _governor = BudgetGovernor(
+                run_cost=_optional_float('BUDGET_RUN_COST'),
+                run_tokens=int(run_tokens) if run_tokens else None,
+                interface_cost=_optional_float('BUDGET_INTERFACE_COST'),
+                interface_tokens=int(interface_tokens) if interface_tokens else None,
+                throttle_at=float(os.getenv('BUDGET_THROTTLE_AT', '0.7')),
+                downgrade_at=float(os.getenv('BUDGET_DOWNGRADE_AT', '0.85')),
+                throttle_delay=float(os.getenv('BUDGET_THROTTLE_DELAY', '5')),
+            )
+        return _governor
+
+def set_run_budget(cost):
+    """命令行 --budget：覆盖运行级费用上限"""
+    get_budget_governor().run_cost = cost
+
+def project_run_cost(prompts, model_name, item_count):
+    """
+    估算整次运行的用量
+
+    投票评审（REVIEW_VOTES > 1）按每个样本单独请求估算提示与输出，为上限；
+    端点支持 n 参数时提示只计费一次。
+
+    Args:
+        prompts: 将发送的提示文本（可迭代，逐条估算）
+        item_count: 每个提示中的检查条目数
+
+    Returns:
+        {'calls', 'prompt_tokens', 'completion_tokens', 'cost'}
+    """
+    import token_budget
+    from model_config import build_review_messages, get_vote_count
+
+    votes = get_vote_count()
+    calls = prompt_tokens = 0
+    for prompt in prompts:
+        calls += 1
+        prompt_tokens += token_budget.count_prompt_tokens(build_review_messages(prompt), model_name) * votes
+    completion_tokens = calls * votes * token_budget.required_output_tokens(model_name, item_count)
+    return {
+        'calls': calls,
+        'prompt_tokens': prompt_tokens,
+        'completion_tokens': completion_tokens,
+        'cost': estimate_cost(model_name, prompt_tokens, completion_tokens),
+    }
+
+def format_projection(projection, model_name, governor=None):
+    """格式化运行前的费用估算，超出运行预算时附加提示"""
+    line = (f"💰 预计用量（{model_name}，按历史输出偏保守估算）: {projection['calls']} 次调用，"
+            f"提示约 {projection['prompt_tokens']} + 输出约 {projection['completion_tokens']} token，"
+            f"约 ¥{projection['cost']:.2f}")
+    if projection.get('sampled'):
+        line += f"（抽样解析 {projection['sampled']} 个接口，其余按文件大小外推）"
+    governor = governor or get_budget_governor()
+    total_tokens = projection['prompt_tokens'] + projection['completion_tokens']
+    if (governor.run_cost and projection['cost'] > governor.run_cost) or \
+            (governor.run_tokens and total_tokens > governor.run_tokens):
+        line += "\n⚠️ 预计用量超出运行预算，接近上限时将限流并改用快速模型，用尽后在检查点停止"
+    return line
+
+def load_checkpoint(path):
+    """读取检查点，不存在或无法解析时返回 None"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def save_checkpoint(path, data):
+    """原子写入检查点"""
+    temp_path = f"{path}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2, default=str)
+    os.replace(temp_path, path)
+    return path
+
+def clear_checkpoint(path):
+    if os.path.exists(path):
+        os.remove(path)
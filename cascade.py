@@ -0,0 +1,75 @@
+"""
+两级模型级联评审
+先由快速模型评审全部检查条目，只有结论为 失败/不确定 或未能解析出结论的条目
+才交给配置的推理模型复核，复核结论替换快速模型的对应结果行。
+"""
+
+from review_parser import parse_item_verdicts, replace_item_lines, extract_extra_issues, append_extra_issues
+
+# 需要复核的结论
+ESCALATE_VERDICTS = ('失败', '不确定')
+
+# 评审层级标记
+TIER_FAST = 'fast'
+TIER_REASONER = 'reasoner'
+TIER_MIXED = 'fast+reasoner'
+
+# 复核结论在理由后附加的标记
+ESCALATED_MARK = '[复核]'
+
+def is_failed_review(review_text):
+    """评审调用失败（空结果或错误信息）"""
+    return not review_text.strip() or "Error:" in review_text or review_text.startswith("❌")
+
+def cascade_review(render_prompt, checklist, call_fast, call_reasoner):
+    """
+    级联评审
+
+    Args:
+        render_prompt: 函数，接收检查单文本，返回完整提示
+        checklist: checklist.Checklist 实例
+        call_fast: 函数，使用快速模型评审提示并返回评审文本
+        call_reasoner: 函数，使用推理模型评审提示并返回评审文本
+
+    Returns:
+        (合并后的评审文本, 评审层级, 复核的条目ID列表)
+    """
+    fast_text = call_fast(render_prompt(checklist.text))
+    verdicts = {} if is_failed_review(fast_text) else {
+        item_id: (verdict, reason) for item_id, verdict, reason in parse_item_verdicts(fast_text)
+    }
+
+    # 快速模型失败或完全无法解析：整体交给推理模型
+    if not verdicts:
+        return call_reasoner(render_prompt(checklist.text)), TIER_REASONER, checklist.item_ids
+
+    escalated = [
+        item_id for item_id in checklist.item_ids
+        if item_id not in verdicts or verdicts[item_id][0] in ESCALATE_VERDICTS
+    ]
+    if not escalated:
+        return fast_text, TIER_FAST, []
+
+    reasoner_text = call_reasoner(render_prompt(checklist.subset_text(escalated)))
+    if is_failed_review(reasoner_text):
+        # 复核失败：待复核条目只有快速模型的结论，不能作为完成的评审，按评审失败处理（计入失败并重试）
+        return (f"Error: 推理模型复核 {', '.join(escalated)} 失败: {reasoner_text.strip() or '空结果'}",
+                TIER_MIXED, escalated)
+
+    reasoner_verdicts = {
+        item_id: (verdict, reason) for item_id, verdict, reason in parse_item_verdicts(reasoner_text)
+    }
+    replacements = {}
+    for item_id in escalated:
+        if item_id in reasoner_verdicts:
+            verdict, reason = reasoner_verdicts[item_id]
+            replacements[item_id] = (verdict, f"{reason} {ESCALATED_MARK}".strip())
+        elif item_id not in verdicts:
+            replacements[item_id] = ('不确定', f"两级模型均未给出结论 {ESCALATED_MARK}")
+
+    merged = replace_item_lines(fast_text, replacements)
+    merged = append_extra_issues(merged, [
+        issue for issue in extract_extra_issues(reasoner_text)
+        if issue not in extract_extra_issues(fast_text)
+    ])
+    return merged, TIER_MIXED, escalated
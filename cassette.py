@@ -0,0 +1,194 @@
+"""
+评审调用录像
+录制模式把每次成功的评审调用（提示摘要、回复文本、usage 与耗时）写入 gzip 压缩的 JSON Lines 录像文件；
+回放模式按提示摘要直接返回录制的回复，不连接模型服务、不限速、不等待，同一批需求的结果完全确定。
+用于离线对比 extract_valid_content、结果统计正则与 Excel 写入等后处理环节的性能与输出。
+
+    LLM_CASSETTE=评审录像.jsonl.gz LLM_CASSETTE_MODE=record   # 或命令行 --record 评审录像.jsonl.gz
+    LLM_CASSETTE=评审录像.jsonl.gz LLM_CASSETTE_MODE=replay   # 或命令行 --replay 评审录像.jsonl.gz
+"""
+
+import os
+import gzip
+import json
+import atexit
+import hashlib
+import threading
+
+from model_config import load_env
+
+CASSETTE_MODES = ('record', 'replay')
+
+def prompt_key(model_name, prompt):
+    """录像中的调用键：模型名称 + 提示文本的摘要"""
+    return hashlib.sha256(f"{model_name}\0{prompt}".encode('utf-8')).hexdigest()
+
+class ReplayConfig:
+    """回放时使用的模型配置：模型名称的解析与 ModelConfig 相同，但不创建客户端，也不需要 API 密钥"""
+
+    def __init__(self, model_name=None, provider=None):
+        from model_config import ModelConfig
+
+        load_env()
+        self.provider = (provider or os.getenv('MODEL_PROVIDER', 'deepseek')).lower()
+        mapping = ModelConfig.MODEL_MAPPING.get(self.provider, ModelConfig.MODEL_MAPPING['deepseek'])
+        self.model_name = model_name or os.getenv(f"{self.provider.upper()}_MODEL", mapping['default_model'])
+        self.base_url = 'cassette://replay'
+        self.api_key = None
+        self.client = None
+
+    def get_model_name(self):
+        return self.model_name
+
+    def get_provider(self):
+        return self.provider
+
+    def get_config_info(self):
+        return {'provider': self.provider, 'model': self.model_name, 'base_url': self.base_url, 'api_key_set': False}
+
+class Cassette:
+    """
+    评审调用录像
+
+    同一提示被多次调用（重复的需求、重试）时按录制顺序依次回放，用完后从头循环。
+    只录制成功的调用；回放时找不到的提示返回不可重试的 cassette_miss 错误。
+    """
+
+    def __init__(self, path, mode):
+        if mode not in CASSETTE_MODES:
+            raise ValueError(f"不支持的录像模式: {mode}（可选 {', '.join(CASSETTE_MODES)}）")
+        self.path = path
+        self.mode = mode
+        self._lock = threading.Lock()
+        self._file = None
+        self._entries = {}
+        self._cursors = {}
+        self.recorded = 0
+        self.hits = 0
+        self.misses = 0
+        # 命中的调用在录制时的耗时合计，即回放省下的等待时间
+        self.replayed_seconds = 0.0
+        if mode == 'replay':
+            self._load()
+
+    @property
+    def replaying(self):
+        return self.mode == 'replay'
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            raise FileNotFoundError(f"录像文件不存在: {self.path}")
+        for record in read_records(self.path):
+            self._entries.setdefault(record['key'], []).append(record)
+
+    def model_config(self, model_name=None, provider=None):
+        return ReplayConfig(model_name, provider)
+
+    def record(self, prompt, model_name, result, seconds):
+        """追加一次成功的调用（失败的调用不录制）"""
+        if not result.ok:
+            return
+        record = {
+            'key': prompt_key(model_name, prompt),
+            'model': result.model or model_name,
+            'prompt_chars': len(prompt),
+            'text': result.text,
+            'finish_reason': result.finish_reason,
+            'usage': result.usage,
+            'continuations': result.continuations,
+            'samples': result.samples,
+            'agreement': result.agreement,
+            'seconds': round(seconds, 3),
+        }
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self._lock:
+            if self._file is None:
+                self._file = gzip.open(self.path, 'wt', encoding='utf-8')
+            self._file.write(line)
+            self.recorded += 1
+
+    def replay(self, prompt, model_name):
+        """返回录制的 LLMResult"""
+        from llm_client import LLMResult
+
+        key = prompt_key(model_name, prompt)
+        with self._lock:
+            records = self._entries.get(key)
+            if not records:
+                self.misses += 1
+                return LLMResult(error=f"录像中没有该提示的调用（模型 {model_name}）", error_class='cassette_miss',
+                                 model=model_name)
+            cursor = self._cursors.get(key, 0)
+            self._cursors[key] = cursor + 1
+            record = records[cursor % len(records)]
+            self.hits += 1
+            self.replayed_seconds += record['seconds']
+        return LLMResult(record['text'], record['finish_reason'], dict(record['usage']),
+                         continuations=record['continuations'], model=record['model'],
+                         samples=record.get('samples', 1), agreement=record.get('agreement'))
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def format_report(self):
+        if self.replaying:
+            return (f"录像回放: 命中 {self.hits} 次，未命中 {self.misses} 次，"
+                    f"省去录制时的调用耗时 {self.replayed_seconds:.1f} 秒（{self.path}）")
+        return f"录像录制: {self.recorded} 次调用（{self.path}）"
+
+def read_records(path):
+    """逐条读取录像记录"""
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+_cassette = None
+_cassette_lock = threading.Lock()
+
+def set_cassette(path, mode):
+    """命令行 --record / --replay：设置本次运行的录像"""
+    os.environ['LLM_CASSETTE'] = path
+    os.environ['LLM_CASSETTE_MODE'] = mode
+
+def get_cassette():
+    """获取全局录像（LLM_CASSETTE 与 LLM_CASSETTE_MODE 环境变量），未设置时返回 None"""
+    global _cassette
+    load_env()
+    path = os.getenv('LLM_CASSETTE')
+    if not path:
+        return None
+    with _cassette_lock:
+        if _cassette is None:
+            _cassette = Cassette(path, os.getenv('LLM_CASSETTE_MODE', 'replay').lower())
+            atexit.register(_cassette.close)
+        return _cassette
+
+def summarize(path):
+    """录像概况：调用次数、各模型的 token 与录制耗时"""
+    models = {}
+    for record in read_records(path):
+        stats = models.setdefault(record['model'], {'calls': 0, 'prompt_tokens': 0, 'completion_tokens': 0,
+                                                    'seconds': 0.0, 'chars': 0})
+        stats['calls'] += 1
+        stats['prompt_tokens'] += record['usage'].get('prompt_tokens', 0)
+        stats['completion_tokens'] += record['usage'].get('completion_tokens', 0)
+        stats['seconds'] += record['seconds']
+        stats['chars'] += len(record['text'])
+    return models
+
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) < 2:
+        print("用法: python cassette.py <录像文件>")
+        sys.exit(1)
+    cassette_path = sys.argv[1]
+    print(f"📼 {cassette_path}（{os.path.getsize(cassette_path) / 1024:.1f} KB）")
+    for model, stats in summarize(cassette_path).items():
+        print(f"   {model}: {stats['calls']} 次调用，提示 {stats['prompt_tokens']} + 输出 {stats['completion_tokens']} token，"
+              f"回复 {stats['chars']} 字符，录制耗时 {stats['seconds']:.1f} 秒"
+              f"（平均 {stats['seconds'] / stats['calls']:.1f} 秒/次）")
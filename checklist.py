@@ -0,0 +1,91 @@
+"""
+检查单解析模块
+把 checklist.txt 拆分为逐条的检查条目，便于按条目子集构造提示
+"""
+
+import os
+import re
+
+# 条目起始行，例如：**CHKI_01**
+ITEM_HEADER_PATTERN = re.compile(r'^\*\*(CHKI_\d+)\*\*\s*$', re.MULTILINE)
+
+class ChecklistItem:
+    """单个检查条目"""
+
+    def __init__(self, item_id, text):
+        self.item_id = item_id
+        self.text = text.strip()
+
+    def field(self, name):
+        """读取单行字段值，例如 field('检查项')"""
+        match = re.search(rf'-\s*\*\*{name}\*\*\s*[:：]\s*(.*)', self.text)
+        return match.group(1).strip() if match else ''
+
+    def __repr__(self):
+        return f"ChecklistItem({self.item_id!r})"
+
+class Checklist:
+    """检查单：表头说明 + 有序的检查条目"""
+
+    def __init__(self, text):
+        self.text = text
+        matches = list(ITEM_HEADER_PATTERN.finditer(text))
+        self.preamble = text[:matches[0].start()].strip() if matches else text.strip()
+        self.items = []
+        for i, match in enumerate(matches):
+            end = matches[i + 1].start() if i + 1 < len(matches) else len(text)
+            # 去掉条目之间的分隔线
+            block = re.sub(r'\n-{3,}\s*$', '', text[match.start():end].rstrip())
+            self.items.append(ChecklistItem(match.group(1), block))
+
+    @classmethod
+    def from_file(cls, path):
+        with open(path, 'r', encoding='utf-8') as f:
+            return cls(f.read())
+
+    @property
+    def item_ids(self):
+        return [item.item_id for item in self.items]
+
+    def get(self, item_id):
+        for item in self.items:
+            if item.item_id == item_id:
+                return item
+        return None
+
+    def subset_text(self, item_ids):
+        """只包含指定条目的检查单文本（保持原顺序与原格式）"""
+        wanted = set(item_ids)
+        blocks = [item.text for item in self.items if item.item_id in wanted]
+        return "\n\n---\n\n".join(blocks)
+
+    def split_groups(self, group_count):
+        """把条目按原顺序尽量均匀地分成若干组"""
+        group_count = max(1, min(group_count, len(self.items)))
+        size, extra = divmod(len(self.items), group_count)
+        groups, start = [], 0
+        for i in range(group_count):
+            end = start + size + (1 if i < extra else 0)
+            groups.append(self.item_ids[start:end])
+            start = end
+        return groups
+
+def load_checklists(paths):
+    """
+    读取多份检查单（同一需求依次对照评审）
+
+    Args:
+        paths: 检查单文件路径列表，第一份为主检查单
+
+    Returns:
+        [(检查单名称, Checklist), ...]，名称为去掉扩展名的文件名
+    """
+    checklists = []
+    names = set()
+    for path in paths:
+        name = os.path.splitext(os.path.basename(path))[0]
+        if name in names:
+            raise ValueError(f"检查单名称重复: {name}（{path}）")
+        names.add(name)
+        checklists.append((name, Checklist.from_file(path)))
+    return checklists
@@ -0,0 +1,41 @@
+"""
+按检查条目分组并行评审
+把检查单拆成若干组条目，对同一条需求的各组同时调用大模型，再把各组结论按检查单顺序合并为
+标准的 [评审结果] 格式。单条需求的耗时取决于最慢的一组，而不是所有条目依次输出的总和。
+"""
+
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+from checklist import Checklist
+from cascade import is_failed_review, TIER_MIXED
+from review_parser import merge_item_groups
+
+def fanout_review(checklist, group_count, review_group):
+    """
+    分组并行评审
+
+    Args:
+        checklist: checklist.Checklist 实例
+        group_count: 分组数（不超过条目数）
+        review_group: 函数，接收只包含一组条目的 Checklist，返回 (评审文本, 评审层级, 复核的条目ID列表)
+
+    Returns:
+        (合并后的评审文本, 评审层级, 复核的条目ID列表)；任一组评审失败时返回该组的错误信息
+    """
+    groups = checklist.split_groups(group_count)
+    sub_checklists = [Checklist(checklist.subset_text(item_ids)) for item_ids in groups]
+    with ThreadPoolExecutor(max_workers=len(groups), thread_name_prefix='fanout') as executor:
+        # 各组在调用方的上下文中评审（继承请求通道等上下文变量）
+        futures = [executor.submit(contextvars.copy_context().run, review_group, sub_checklist)
+                   for sub_checklist in sub_checklists]
+        outcomes = [future.result() for future in futures]
+
+    for (review_text, tier, _), item_ids in zip(outcomes, groups):
+        if is_failed_review(review_text):
+            return f"{item_ids[0]}-{item_ids[-1]} 分组评审失败: {review_text}", tier, []
+
+    tiers = {tier for _, tier, _ in outcomes}
+    escalated = [item_id for _, _, ids in outcomes for item_id in ids]
+    merged = merge_item_groups([review_text for review_text, _, _ in outcomes], groups)
+    return merged, tiers.pop() if len(tiers) == 1 else TIER_MIXED, escalated
@@ -0,0 +1,133 @@
+"""
+目录监视
+监视目录中文件的新增、修改与删除：Linux 上通过 ctypes 直接使用 inotify，
+其他平台或 inotify 不可用时退回按修改时间与大小定期轮询。
+监视器只报告“哪些文件名可能变化”，是否写入完成由调用方去抖判断。
+"""
+
+import os
+import sys
+import time
+import errno
+import select
+import struct
+
+# inotify 事件掩码（见 <sys/inotify.h>）
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+_EVENT_HEADER = struct.Struct('iIII')
+
+def is_temporary_file(name):
+    """办公软件与导出工具写入过程中产生的临时文件（~$x.xlsx、.~lock.x#、.x.xlsx.tmp 等）"""
+    return name.startswith(('~$', '.~', '.')) or name.endswith(('.tmp', '.part', '#'))
+
+def file_signature(path):
+    """(大小, 修改时间)，文件不存在时返回 None"""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+class InotifyWatcher:
+    """基于 inotify 的目录监视（仅 Linux）"""
+
+    kind = 'inotify'
+
+    def __init__(self, path):
+        import ctypes
+        import ctypes.util
+
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self._fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self._fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+        if libc.inotify_add_watch(self._fd, os.fsencode(path), WATCH_MASK) < 0:
+            err = ctypes.get_errno()
+            os.close(self._fd)
+            raise OSError(err, os.strerror(err))
+        self.path = path
+        self.overflowed = False
+
+    def wait(self, timeout):
+        """
+        等待最多 timeout 秒
+
+        Returns:
+            可能变化的文件名集合；事件队列溢出时 overflowed 置为 True，调用方应全量扫描
+        """
+        readable, _, _ = select.select([self._fd], [], [], timeout)
+        if not readable:
+            return set()
+        names = set()
+        while True:
+            try:
+                data = os.read(self._fd, 64 * 1024)
+            except OSError as e:
+                if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    break
+                raise
+            offset = 0
+            while offset + _EVENT_HEADER.size <= len(data):
+                _, mask, _, length = _EVENT_HEADER.unpack_from(data, offset)
+                offset += _EVENT_HEADER.size
+                name = data[offset:offset + length].rstrip(b'\0')
+                offset += length
+                if mask & IN_Q_OVERFLOW:
+                    self.overflowed = True
+                elif name:
+                    names.add(os.fsdecode(name))
+        return names
+
+    def close(self):
+        os.close(self._fd)
+
+class PollingWatcher:
+    """按修改时间与大小定期轮询的目录监视"""
+
+    kind = 'polling'
+
+    def __init__(self, path, interval=5.0):
+        self.path = path
+        self.interval = interval
+        self.overflowed = False
+        self._snapshot = self._scan()
+
+    def _scan(self):
+        snapshot = {}
+        try:
+            names = os.listdir(self.path)
+        except FileNotFoundError:
+            return snapshot
+        for name in names:
+            signature = file_signature(os.path.join(self.path, name))
+            if signature is not None:
+                snapshot[name] = signature
+        return snapshot
+
+    def wait(self, timeout):
+        """等待最多 timeout 秒（至少一个轮询间隔），返回签名变化或增删的文件名集合"""
+        time.sleep(max(0.0, min(timeout, self.interval)))
+        snapshot = self._scan()
+        previous, self._snapshot = self._snapshot, snapshot
+        return {name for name in set(previous) | set(snapshot) if previous.get(name) != snapshot.get(name)}
+
+    def close(self):
+        pass
+
+def create_watcher(path, poll_interval=5.0, force_polling=False):
+    """创建目录监视器：优先 inotify，不可用时退回轮询"""
+    if not force_polling and sys.platform.startswith('linux'):
+        try:
+            return InotifyWatcher(path)
+        except (OSError, AttributeError) as e:
+            print(f"⚠️ inotify 不可用，改为每 {poll_interval:g} 秒轮询: {str(e)}")
+    return PollingWatcher(path, poll_interval)
@@ -0,0 +1,181 @@
+"""
+需求表格解析缓存
+把解析后的需求表格（DataFrame）以 pickle 二进制格式缓存，按 路径 + 修改时间 + 大小 + 内容哈希 判断是否失效：
+- 路径、修改时间与大小都未变化时直接读取缓存
+- 修改时间变化但大小相同时比较内容哈希，内容未变（例如重新拷贝）仍使用缓存
+- 否则重新用 openpyxl 解析并更新缓存
+
+ReadAhead 在后台线程中预先读取后续的表格，评审当前接口时下一个接口已经解析完成。
+"""
+
+import os
+import pickle
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# 缓存格式版本，格式变化时递增使旧缓存失效
+CACHE_VERSION = 1
+
+def get_default_cache_dir():
+    """默认缓存目录（INPUT_CACHE_DIR 环境变量，默认与脚本同目录的 输入缓存/）"""
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    return os.getenv('INPUT_CACHE_DIR') or os.path.join(script_dir, "输入缓存")
+
+def file_sha256(path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+class InputCache:
+    """需求表格解析缓存"""
+
+    def __init__(self, cache_dir=None):
+        self.cache_dir = cache_dir or get_default_cache_dir()
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def _cache_path(self, path):
+        key = hashlib.sha256(os.path.abspath(path).encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, key[:2], key[2:] + '.pkl')
+
+    def _read_entry(self, cache_path):
+        try:
+            with open(cache_path, 'rb') as f:
+                entry = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+            return None
+        return entry if isinstance(entry, dict) and entry.get('version') == CACHE_VERSION else None
+
+    def _write_entry(self, cache_path, entry):
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        temp_path = f"{cache_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temp_path, 'wb') as f:
+            pickle.dump(entry, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, cache_path)
+
+    def load(self, path):
+        """读取需求表格，优先使用缓存"""
+        import pandas as pd
+
+        stat = os.stat(path)
+        cache_path = self._cache_path(path)
+        entry = self._read_entry(cache_path)
+
+        if entry is not None and entry['size'] == stat.st_size:
+            if entry['mtime_ns'] == stat.st_mtime_ns:
+                self._count(hit=True)
+                return entry['data']
+            # 修改时间变化：按内容哈希确认
+            if entry['sha256'] == file_sha256(path):
+                entry['mtime_ns'] = stat.st_mtime_ns
+                self._save_quietly(cache_path, entry)
+                self._count(hit=True)
+                return entry['data']
+
+        self._count(hit=False)
+        # 先计算哈希再解析：解析期间文件被修改时，下次读取会因哈希不符而重新解析
+        sha256 = file_sha256(path)
+        data = pd.read_excel(path, engine='openpyxl')
+        self._save_quietly(cache_path, {
+            'version': CACHE_VERSION,
+            'path': os.path.abspath(path),
+            'mtime_ns': stat.st_mtime_ns,
+            'size': stat.st_size,
+            'sha256': sha256,
+            'data': data,
+        })
+        return data
+
+    def _save_quietly(self, cache_path, entry):
+        """缓存写入失败不影响评审"""
+        try:
+            self._write_entry(cache_path, entry)
+        except OSError as e:
+            print(f"⚠️ 写入输入缓存失败: {str(e)}")
+
+    def _count(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def format_report(self):
+        return f"输入缓存: 命中 {self.hits} 个，重新解析 {self.misses} 个 ({self.cache_dir})"
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+def is_input_cache_enabled():
+    """是否启用输入缓存（INPUT_CACHE，默认启用）"""
+    from model_config import load_env
+    load_env()
+    return os.getenv('INPUT_CACHE', '1').lower() not in ('0', 'false', 'no', 'off')
+
+def get_input_cache():
+    """全局输入缓存，未启用时返回 None"""
+    global _default_cache
+    if not is_input_cache_enabled():
+        return None
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = InputCache()
+        return _default_cache
+
+def load_requirements(path):
+    """读取需求表格（启用缓存时经由缓存）"""
+    cache = get_input_cache()
+    if cache is not None:
+        return cache.load(path)
+    import pandas as pd
+    return pd.read_excel(path, engine='openpyxl')
+
+class ReadAhead:
+    """
+    按顺序预读文件
+
+    Args:
+        paths: 将按顺序读取的文件
+        loader: 读取函数，接收路径返回解析结果
+        depth: 最多提前读取的文件数
+    """
+
+    def __init__(self, paths, loader, depth=2):
+        self.paths = list(paths)
+        self.loader = loader
+        self.depth = depth
+        self._futures = {}
+        self._next = 0
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='read-ahead')
+
+    def _schedule(self, upto):
+        while self._next < min(upto, len(self.paths)):
+            path = self.paths[self._next]
+            self._futures[path] = self._executor.submit(self.loader, path)
+            self._next += 1
+
+    def start(self):
+        self._schedule(self.depth)
+        return self
+
+    def get(self, path):
+        """取得解析结果（未预读的文件同步读取），并继续预读后续文件"""
+        if path in self.paths:
+            self._schedule(self.paths.index(path) + 1 + self.depth)
+        future = self._futures.pop(path, None)
+        if future is None:
+            return self.loader(path)
+        return future.result()
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.close()
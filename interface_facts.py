@@ -0,0 +1,268 @@
+"""
+接口事实表
+在本地解析同一接口文件中各需求的 C 函数原型与数值范围（如注释中的“优先级范围1-10”），
+确定性地找出原型不一致、同名参数类型不同、范围/限值不一致与标识重复等问题，
+生成紧凑的事实表放入批量评审提示，原型只列出一次，不再随每条需求重复发送。
+"""
+
+import os
+import re
+
+from model_config import load_env
+
+# 参与范围与限值提取的字段
+RANGE_FIELDS = ('需求描述', '注释', '测试建议')
+
+_NUMBER = r'-?\d+(?:\.\d+)?'
+_UNIT = r'(?P<unit>个字符|字符|字节|bytes?|毫秒|ms|微秒|us|秒|s|赫兹|Hz|%|℃|个|次)?'
+# 函数原型：返回类型 + 函数名 + 参数列表
+_PROTOTYPE_PATTERN = re.compile(r'([A-Za-z_][\w\s\*]*?)\b([A-Za-z_]\w*)\s*\(([^()]*)\)')
+# 参数：类型 + 参数名 + 可选的数组维度
+_PARAM_PATTERN = re.compile(r'^(.*?)\b([A-Za-z_]\w*)\s*(\[[^\]]*\])?$')
+# 范围，例如：优先级范围1-10 / 取值范围为[0, 255] / 周期范围 10~100ms
+_RANGE_PATTERN = re.compile(
+    rf'(?P<subject>[一-龥A-Za-z_]*)范围(?:为|是|[:：])?\s*[\[［(（]?\s*(?P<low>{_NUMBER})\s*'
+    rf'(?:-|~|～|至|到|—|–|,|，)\s*(?P<high>{_NUMBER})\s*[\]］)）]?\s*{_UNIT}')
+# 上限/下限，例如：最多64个字符的名称 / 名称长度不超过64个字符
+_LIMIT_PATTERN = re.compile(
+    rf'(?P<before>[一-龥A-Za-z_]*?)(?P<keyword>最多|至多|不超过|不大于|最大为|最大值为|最大|上限为|上限|'
+    rf'至少|不少于|不小于|最小为|最小值为|最小|下限为|下限)\s*(?P<value>{_NUMBER})\s*{_UNIT}'
+    rf'(?:的(?P<after>[一-龥]{{1,6}}))?')
+_MIN_KEYWORDS = ('至少', '不少于', '不小于', '最小为', '最小值为', '最小', '下限为', '下限')
+# 主语中的连接词与修饰词
+_SUBJECT_SPLIT = re.compile(r'[和与及、包括其中以及或]')
+_SUBJECT_SUFFIXES = ('的', '取值', '长度', '值')
+# 不能作为主语的动词
+_NON_SUBJECTS = {'支持', '允许', '可', '能', '能够', '应', '应能', '需', '需要', '可以', '最多', '系统'}
+
+def is_facts_enabled():
+    """批量评审是否生成接口事实表（INTERFACE_FACTS 环境变量，默认开启）"""
+    load_env()
+    return os.getenv('INTERFACE_FACTS', '1').lower() not in ('0', 'false', 'no', 'off')
+
+def _normalize_type(text):
+    text = re.sub(r'\s+', ' ', text).strip()
+    return re.sub(r'\s*\*\s*', '*', text)
+
+class Prototype:
+    """解析后的 C 函数原型"""
+
+    def __init__(self, return_type, name, params):
+        self.return_type = return_type
+        self.name = name
+        # [(类型, 参数名)]，参数只写类型时参数名为空
+        self.params = params
+
+    @property
+    def signature(self):
+        params = ", ".join(f"{ptype[:-2]} {pname}[]" if ptype.endswith('[]') and pname else f"{ptype} {pname}".strip()
+                           for ptype, pname in self.params) or "void"
+        return f"{self.return_type} {self.name}({params})"
+
+    def __eq__(self, other):
+        return isinstance(other, Prototype) and self.signature == other.signature
+
+    def __hash__(self):
+        return hash(self.signature)
+
+    def __repr__(self):
+        return f"Prototype({self.signature!r})"
+
+def parse_prototypes(text):
+    """解析文本中的 C 函数原型（一个单元格可包含多个以分号或换行分隔的原型）"""
+    prototypes = []
+    for part in re.split(r'[;\n；]', text or ''):
+        match = _PROTOTYPE_PATTERN.search(part.strip())
+        if not match or not match.group(1).strip():
+            continue
+        params = []
+        for param in match.group(3).split(','):
+            param = param.strip()
+            if not param or param == 'void':
+                continue
+            param_match = _PARAM_PATTERN.match(param)
+            ptype = _normalize_type(param_match.group(1)) if param_match else ''
+            if not ptype:
+                # 只写了类型
+                params.append((_normalize_type(param), ''))
+                continue
+            params.append((ptype + ('[]' if param_match.group(3) else ''), param_match.group(2)))
+        prototypes.append(Prototype(_normalize_type(match.group(1)), match.group(2), params))
+    return prototypes
+
+def _clean_subject(subject, last=True):
+    """规范化主语：数值之前的主语取最后一段，之后的主语取第一段"""
+    parts = _SUBJECT_SPLIT.split(subject or '')
+    subject = parts[-1] if last else parts[0]
+    changed = True
+    while changed:
+        changed = False
+        for suffix in _SUBJECT_SUFFIXES:
+            if subject.endswith(suffix) and len(subject) > len(suffix):
+                subject, changed = subject[:-len(suffix)], True
+        if subject.startswith('的'):
+            subject, changed = subject[1:], True
+    return None if not subject or subject in _NON_SUBJECTS else subject
+
+def _number(text):
+    value = float(text)
+    return int(value) if value.is_integer() else value
+
+def extract_ranges(text):
+    """
+    提取数值范围与上下限
+
+    Returns:
+        [(主语, 下限, 上限, 单位), ...]，只有上限或下限时另一端为 None；无法确定主语的数值不提取
+    """
+    facts = []
+    for match in _RANGE_PATTERN.finditer(text or ''):
+        subject = _clean_subject(match.group('subject'))
+        if subject:
+            facts.append((subject, _number(match.group('low')), _number(match.group('high')), match.group('unit') or ''))
+    for match in _LIMIT_PATTERN.finditer(text or ''):
+        subject = _clean_subject(match.group('after'), last=False) or _clean_subject(match.group('before'))
+        if not subject:
+            continue
+        value = _number(match.group('value'))
+        unit = match.group('unit') or ''
+        if match.group('keyword') in _MIN_KEYWORDS:
+            facts.append((subject, value, None, unit))
+        else:
+            facts.append((subject, None, value, unit))
+    return facts
+
+def format_range(low, high, unit=''):
+    if low is not None and high is not None:
+        return f"{low}-{high}{unit}"
+    if high is not None:
+        return f"最多 {high}{unit}"
+    return f"至少 {low}{unit}"
+
+def _numbers(numbers):
+    return "、".join(str(number) for number in numbers)
+
+class InterfaceFacts:
+    """
+    一个接口文件的事实表
+
+    Attributes:
+        prototypes: {原型签名: [需求编号]}，按首次出现的顺序
+        ranges: {主语: {(下限, 上限, 单位): [需求编号]}}
+        issues: 一致性问题描述列表
+    """
+
+    def __init__(self, records):
+        """
+        Args:
+            records: [(需求编号, {字段名: 值}), ...]，值为空时为“无”
+        """
+        self.prototypes = {}
+        self.ranges = {}
+        self.issues = []
+        unparsed = []
+        identifiers = {}
+        functions = {}
+        params = {}
+
+        for number, values in records:
+            identifier = values.get('标识', '无')
+            if identifier in ('', '无'):
+                self.issues.append(f"需求 {number} 缺少标识")
+            else:
+                identifiers.setdefault(identifier, []).append(number)
+
+            prototype_text = values.get('接口原型', '无')
+            if prototype_text not in ('', '无'):
+                prototypes = parse_prototypes(prototype_text)
+                if not prototypes:
+                    unparsed.append((number, prototype_text))
+                for prototype in prototypes:
+                    self.prototypes.setdefault(prototype.signature, []).append(number)
+                    functions.setdefault(prototype.name, {}).setdefault(prototype.signature, []).append(number)
+                    for ptype, pname in prototype.params:
+                        if pname:
+                            params.setdefault(pname, {}).setdefault(ptype, set()).add(prototype.name)
+
+            for field in RANGE_FIELDS:
+                for subject, low, high, unit in extract_ranges(values.get(field, '')):
+                    numbers = self.ranges.setdefault(subject, {}).setdefault((low, high, unit), [])
+                    if number not in numbers:
+                        numbers.append(number)
+
+        for identifier, numbers in identifiers.items():
+            if len(numbers) > 1:
+                self.issues.append(f"标识 {identifier} 重复（需求 {_numbers(numbers)}）")
+        for name, signatures in functions.items():
+            if len(signatures) > 1:
+                variants = " / ".join(f"{signature}（需求 {_numbers(numbers)}）"
+                                      for signature, numbers in signatures.items())
+                self.issues.append(f"函数 {name} 的原型不一致: {variants}")
+        for pname, types in params.items():
+            # 同一函数内的差异已在原型不一致中列出
+            if len(types) > 1 and len(set().union(*types.values())) > 1:
+                variants = " / ".join(f"{ptype}（{', '.join(sorted(names))}）" for ptype, names in types.items())
+                self.issues.append(f"同名参数 {pname} 的类型不同: {variants}")
+        for subject, variants in self.ranges.items():
+            issue = _range_conflict(variants)
+            if issue:
+                self.issues.append(f"{subject} 的{issue}")
+        for number, text in unparsed:
+            self.issues.append(f"需求 {number} 的接口原型无法解析: {text}")
+
+    def format(self):
+        """事实表文本"""
+        lines = []
+        if self.prototypes:
+            lines.append("函数原型（需求编号）:")
+            lines.extend(f"- {signature}（{_numbers(numbers)}）" for signature, numbers in self.prototypes.items())
+        if self.ranges:
+            lines.append("数值范围与限值（需求编号）:")
+            for subject, variants in self.ranges.items():
+                lines.append(f"- {subject}: " + "；".join(f"{format_range(*key)}（{_numbers(numbers)}）"
+                                                          for key, numbers in variants.items()))
+        lines.append("一致性检查:")
+        if self.issues:
+            lines.extend(f"- {issue}" for issue in self.issues)
+        else:
+            lines.append("- 未发现原型、参数类型、数值范围或标识的不一致")
+        return "\n".join(lines)
+
+def _range_conflict(variants):
+    """同一主语的范围/限值之间的矛盾，没有矛盾时返回 None"""
+    problems = []
+    for (low, high, unit), numbers in variants.items():
+        if low is not None and high is not None and low > high:
+            problems.append(f"范围上下限颠倒: {format_range(low, high, unit)}（需求 {_numbers(numbers)}）")
+    lows = {key[0] for key in variants if key[0] is not None}
+    highs = {key[1] for key in variants if key[1] is not None}
+    units = {key[2] for key in variants if key[2]}
+    if len(lows) > 1 or len(highs) > 1 or len(units) > 1:
+        problems.append("范围或限值不一致: " + " / ".join(
+            f"{format_range(*key)}（需求 {_numbers(numbers)}）" for key, numbers in variants.items()))
+    return "；".join(problems) or None
+
+def analyze_interface(records):
+    """分析接口文件中的全部需求，返回 InterfaceFacts"""
+    return InterfaceFacts(records)
+
+if __name__ == "__main__":
+    # 不调用大模型，输出示例接口文件的事实表与提示 token 对比
+    from reviewer_batch import get_batch_paths, list_interface_files, load_prompt_template, prepare_interface
+    from input_cache import load_requirements
+    from token_budget import estimate_tokens
+    from prompt_format import render_review_prompt
+
+    paths = get_batch_paths()
+    prompt_template, checklist = load_prompt_template(paths['prompt_file'], paths['checklist_file'])
+    for name in list_interface_files(paths['interfaces_dir']):
+        df_requirements = load_requirements(os.path.join(paths['interfaces_dir'], name))
+        blocks, facts = prepare_interface(df_requirements, use_facts=True)
+        plain_blocks, _ = prepare_interface(df_requirements, use_facts=False)
+        prompt_tokens = estimate_tokens(render_review_prompt(prompt_template, checklist.text, "".join(blocks),
+                                                             facts=facts.format()))
+        saved = estimate_tokens("".join(plain_blocks)) - estimate_tokens("".join(blocks))
+        print(f"📐 {name}: 提示约 {prompt_tokens} token，事实表 {estimate_tokens(facts.format())} token，"
+              f"需求文本中省去重复的原型 {saved} token，发现 {len(facts.issues)} 处一致性问题")
+        print(facts.format())
+        print()
@@ -0,0 +1,276 @@
+"""
+基于 SQLite 的租约式任务队列
+供多台主机上的评审进程共享同一个 接口需求集合 目录时分配任务：
+每个 worker 以限时租约领取任务，处理期间定期续约，租约过期的任务会被其他 worker 重新领取。
+
+注意：队列数据库需放在支持文件锁的共享存储上（本地磁盘、SMB 或开启锁服务的 NFS）。
+"""
+
+import os
+import json
+import time
+import socket
+import sqlite3
+import threading
+
+# 任务状态
+STATUS_PENDING = 'pending'
+STATUS_LEASED = 'leased'
+STATUS_DONE = 'done'
+STATUS_FAILED = 'failed'
+
+def default_worker_id():
+    """生成 worker 标识：主机名-进程号"""
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+class Job:
+    """已领取的任务"""
+
+    def __init__(self, job_id, key, payload, attempts, lease_expires):
+        self.job_id = job_id
+        self.key = key
+        self.payload = payload
+        self.attempts = attempts
+        self.lease_expires = lease_expires
+
+    def __repr__(self):
+        return f"Job({self.job_id}, {self.key!r}, attempts={self.attempts})"
+
+class JobQueue:
+    """租约式任务队列"""
+
+    def __init__(self, db_path, lease_seconds=600, max_attempts=3):
+        self.db_path = db_path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self._init_db()
+
+    def _connect(self):
+        # isolation_level=None: 由下面的 BEGIN IMMEDIATE 显式控制事务
+        conn = sqlite3.connect(self.db_path, timeout=60, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _init_db(self):
+        conn = self._connect()
+        try:
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    key TEXT NOT NULL UNIQUE,
+                    payload TEXT NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'pending',
+                    worker TEXT,
+                    lease_expires REAL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    result TEXT,
+                    error TEXT,
+                    updated_at REAL
+                );
+                CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status, lease_expires);
+            """)
+        finally:
+            conn.close()
+
+    def enqueue(self, items, reset=False):
+        """
+        批量加入任务（按 key 去重，可被多个 worker 安全地重复调用）
+
+        已存在的同名任务在 payload 变化时（例如接口文件内容的哈希变化）重置为待处理，
+        payload 相同时保持原状态。
+
+        Args:
+            items: (key, payload) 序列，payload 为可 JSON 序列化的对象
+            reset: 为 True 时把已存在的同名任务全部重置为待处理
+
+        Returns:
+            新加入（或重置）的任务数
+        """
+        # 先在事务外生成全部任务（payload 可能需要读取文件计算哈希），避免长时间持有写锁
+        rows = [(key, json.dumps(payload, ensure_ascii=False)) for key, payload in items]
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            added = 0
+            for key, data in rows:
+                if reset:
+                    cur = conn.execute(
+                        "INSERT INTO jobs(key, payload, updated_at) VALUES (?, ?, ?) "
+                        "ON CONFLICT(key) DO UPDATE SET payload=excluded.payload, status='pending', "
+                        "worker=NULL, lease_expires=NULL, attempts=0, result=NULL, error=NULL, "
+                        "updated_at=excluded.updated_at",
+                        (key, data, now))
+                else:
+                    cur = conn.execute(
+                        "INSERT INTO jobs(key, payload, updated_at) VALUES (?, ?, ?) "
+                        "ON CONFLICT(key) DO UPDATE SET payload=excluded.payload, status='pending', "
+                        "worker=NULL, lease_expires=NULL, attempts=0, result=NULL, error=NULL, "
+                        "updated_at=excluded.updated_at WHERE jobs.payload != excluded.payload",
+                        (key, data, now))
+                added += cur.rowcount
+            conn.execute("COMMIT")
+            return added
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def claim(self, worker_id):
+        """
+        领取一个待处理或租约已过期的任务，没有可领取任务时返回 None
+
+        租约过期且已达到最大尝试次数的任务（例如每次都让 worker 崩溃）标记为最终失败，不再回收。
+        """
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, worker = NULL, lease_expires = NULL, updated_at = ? "
+                "WHERE status = ? AND lease_expires < ? AND attempts >= ?",
+                (STATUS_FAILED, f"租约过期 {self.max_attempts} 次（worker 处理中退出）", now,
+                 STATUS_LEASED, now, self.max_attempts))
+            row = conn.execute(
+                "SELECT id, key, payload, attempts FROM jobs "
+                "WHERE status = ? OR (status = ? AND lease_expires < ? AND attempts < ?) "
+                "ORDER BY id LIMIT 1",
+                (STATUS_PENDING, STATUS_LEASED, now, self.max_attempts)).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            lease_expires = now + self.lease_seconds
+            conn.execute(
+                "UPDATE jobs SET status = ?, worker = ?, lease_expires = ?, "
+                "attempts = attempts + 1, updated_at = ? WHERE id = ?",
+                (STATUS_LEASED, worker_id, lease_expires, now, row['id']))
+            conn.execute("COMMIT")
+            return Job(row['id'], row['key'], json.loads(row['payload']),
+                       row['attempts'] + 1, lease_expires)
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def _update_owned(self, job_id, worker_id, sql, params):
+        """仅当任务仍由该 worker 持有租约时执行更新，返回是否成功"""
+        conn = self._connect()
+        try:
+            cur = conn.execute(
+                sql + " WHERE id = ? AND worker = ? AND status = ?",
+                tuple(params) + (job_id, worker_id, STATUS_LEASED))
+            return cur.rowcount == 1
+        finally:
+            conn.close()
+
+    def heartbeat(self, job_id, worker_id):
+        """续约；租约已被他人回收时返回 False"""
+        now = time.time()
+        return self._update_owned(
+            job_id, worker_id,
+            "UPDATE jobs SET lease_expires = ?, updated_at = ?",
+            (now + self.lease_seconds, now))
+
+    def complete(self, job_id, worker_id, result):
+        """标记任务完成并保存结果"""
+        return self._update_owned(
+            job_id, worker_id,
+            "UPDATE jobs SET status = ?, result = ?, error = NULL, lease_expires = NULL, updated_at = ?",
+            (STATUS_DONE, json.dumps(result, ensure_ascii=False), time.time()))
+
+    def fail(self, job_id, worker_id, error):
+        """记录失败；未超过最大尝试次数的任务回到待处理状态"""
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT attempts FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        finally:
+            conn.close()
+        status = STATUS_FAILED if row and row['attempts'] >= self.max_attempts else STATUS_PENDING
+        return self._update_owned(
+            job_id, worker_id,
+            "UPDATE jobs SET status = ?, error = ?, worker = NULL, lease_expires = NULL, updated_at = ?",
+            (status, str(error), time.time()))
+
+    def release(self, job_id, worker_id, reason):
+        """放回待处理状态且不计入尝试次数（例如预算用尽，任务本身并未失败）"""
+        return self._update_owned(
+            job_id, worker_id,
+            "UPDATE jobs SET status = ?, error = ?, attempts = MAX(attempts - 1, 0), worker = NULL, "
+            "lease_expires = NULL, updated_at = ?",
+            (STATUS_PENDING, str(reason), time.time()))
+
+    def counts(self):
+        """各状态任务数量"""
+        conn = self._connect()
+        try:
+            rows = conn.execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status").fetchall()
+        finally:
+            conn.close()
+        counts = {STATUS_PENDING: 0, STATUS_LEASED: 0, STATUS_DONE: 0, STATUS_FAILED: 0}
+        counts.update({row['status']: row['n'] for row in rows})
+        return counts
+
+    def is_drained(self):
+        """所有任务都已完成或最终失败"""
+        counts = self.counts()
+        return counts[STATUS_PENDING] == 0 and counts[STATUS_LEASED] == 0
+
+    def results(self):
+        """按任务顺序返回所有已完成任务的结果"""
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                "SELECT result FROM jobs WHERE status = ? ORDER BY id", (STATUS_DONE,)).fetchall()
+        finally:
+            conn.close()
+        return [json.loads(row['result']) for row in rows if row['result']]
+
+    def failures(self):
+        """返回最终失败的任务 (key, error) 列表"""
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                "SELECT key, error FROM jobs WHERE status = ? ORDER BY id", (STATUS_FAILED,)).fetchall()
+        finally:
+            conn.close()
+        return [(row['key'], row['error']) for row in rows]
+
+class LeaseKeeper:
+    """
+    租约保持器：在后台线程中定期续约
+
+    用法：
+        with LeaseKeeper(queue, job, worker_id) as keeper:
+            ...  # 处理任务
+            if keeper.lost: ...  # 租约已被回收，放弃写入结果
+    """
+
+    def __init__(self, queue, job, worker_id, interval=None):
+        self.queue = queue
+        self.job = job
+        self.worker_id = worker_id
+        self.interval = interval or max(1.0, queue.lease_seconds / 3)
+        self.lost = False
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                if not self.queue.heartbeat(self.job.job_id, self.worker_id):
+                    self.lost = True
+                    return
+            except sqlite3.Error as e:
+                # 暂时性的锁冲突不视为丢失租约，下个周期再试
+                print(f"⚠️ 续约失败: {e}")
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._stop.set()
+        self._thread.join()
+        return False
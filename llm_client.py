@@ -0,0 +1,746 @@
+"""
+大模型调用层
+在 model_config 的客户端之上提供调用策略：
+- 类型化结果：每次调用返回 LLMResult，包含 finish_reason、usage 与错误分类
+- 截断续写：输出因 max_tokens 截断时，在原对话后追加已输出内容并请求继续，而不是整体重发
+- 熔断：端点连续出现可重试的传输错误后暂停发送请求，冷却后放行单个探测请求
+- 限速：设置 REVIEW_RPM 后按端点以令牌桶平滑发送请求，避免触发服务端限流；
+  同一端点的评审进程共用额度，交互式请求优先于批量评审（见 rate_lanes）
+- 预算：每次调用前经 budget 模块准入（接近上限时限流或改用快速模型，用尽后拒绝），调用后累计 token 与费用
+- 多样本：一次请求取得 n 个候选（提示只计费一次），端点不支持 n 时改为并行发送多个请求
+- 请求对冲：调用耗时超过动态统计的延迟分位数时，向同一或备用端点再发一份相同请求，
+  先完成者胜出，落后的请求被取消（关闭流式连接），对冲的额外开销受比例上限约束。
+"""
+
+import os
+import re
+import time
+import threading
+import contextvars
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from model_config import load_env
+from budget import get_budget_governor
+
+class RequestCancelled(Exception):
+    """请求在完成前被取消（对冲中落败的一方）"""
+
+class CancelToken:
+    """
+    流式请求的取消标记
+
+    由控制线程调用 set() 取消：除设置标记外，立即关闭请求已打开的流式连接，
+    长时间没有新数据的请求也会立刻结束，不再占用线程与连接。
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._stream = None
+
+    def is_set(self):
+        return self._event.is_set()
+
+    def set(self):
+        with self._lock:
+            self._event.set()
+            stream = self._stream
+        if stream is not None:
+            try:
+                stream.close()
+            except Exception:
+                pass
+
+    def attach(self, stream):
+        """登记已打开的流，已被取消时返回 False"""
+        with self._lock:
+            self._stream = stream
+            return not self._event.is_set()
+
+class LLMResult:
+    """
+    一次大模型调用的结果
+
+    Attributes:
+        text: 回复文本（截断后续写的多段已拼接）
+        finish_reason: 最后一段的结束原因（stop / length / ...）
+        usage: {'prompt_tokens', 'completion_tokens'}，多段续写时累加
+        error: 错误信息，成功时为 None
+        error_class: 错误分类（rate_limit / timeout / connection / server / auth / bad_request / circuit_open /
+            budget_exceeded / unknown）
+        retryable: 错误是否值得重试
+        continuations: 截断后续写的次数
+        samples: 投票评审时参与投票的样本数（否则为 1）
+        agreement: 投票评审的一致度（0~1），未投票时为 None
+    """
+
+    def __init__(self, text='', finish_reason=None, usage=None, error=None, error_class=None,
+                 retryable=False, continuations=0, model=None, retry_after=None, samples=1, agreement=None):
+        self.text = text
+        self.finish_reason = finish_reason
+        self.usage = usage or {'prompt_tokens': 0, 'completion_tokens': 0}
+        self.error = error
+        self.error_class = error_class
+        self.retryable = retryable
+        self.continuations = continuations
+        self.model = model
+        self.retry_after = retry_after
+        self.samples = samples
+        self.agreement = agreement
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    @property
+    def truncated(self):
+        """续写次数用尽后仍被截断"""
+        return self.finish_reason == 'length'
+
+    def __repr__(self):
+        state = f"error={self.error_class!r}" if self.error else f"finish_reason={self.finish_reason!r}"
+        return f"LLMResult({state}, chars={len(self.text)}, continuations={self.continuations})"
+
+# 可重试的 HTTP 状态码：限流与服务端错误
+RETRYABLE_STATUS = (408, 409, 429, 500, 502, 503, 504)
+
+def classify_error(exc):
+    """
+    错误分类
+
+    Returns:
+        (错误分类, 是否可重试)
+    """
+    import openai
+
+    if isinstance(exc, openai.RateLimitError):
+        return 'rate_limit', True
+    if isinstance(exc, openai.APITimeoutError):
+        return 'timeout', True
+    if isinstance(exc, openai.APIConnectionError):
+        return 'connection', True
+    if isinstance(exc, (openai.AuthenticationError, openai.PermissionDeniedError)):
+        return 'auth', False
+    if isinstance(exc, openai.APIStatusError):
+        status = getattr(exc, 'status_code', None)
+        if status in RETRYABLE_STATUS or (status or 0) >= 500:
+            return 'server', True
+        return 'bad_request', False
+    if isinstance(exc, (TimeoutError, ConnectionError)):
+        return 'connection', True
+    return 'unknown', False
+
+class CircuitBreaker:
+    """
+    端点熔断器
+
+    连续 failure_threshold 次可重试的传输错误后断开，reset_timeout 秒内不再发送请求；
+    冷却结束后放行一个探测请求（半开），成功则恢复，失败则重新断开。
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold=5, reset_timeout=60):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trips = 0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """是否允许发送请求"""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.time() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+            if self.state == self.HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            return False
+
+    def retry_after(self):
+        """距离下次允许探测的秒数"""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return 0.0
+            return max(0.0, self.reset_timeout - (time.time() - self.opened_at))
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    self.trips += 1
+                self.state = self.OPEN
+                self.opened_at = time.time()
+            self._probe_in_flight = False
+
+    def release(self):
+        """请求以不可重试的错误结束（例如参数错误）：端点本身可用，只释放探测名额"""
+        with self._lock:
+            self._probe_in_flight = False
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+def get_circuit_breaker(config):
+    """
+    按端点（base_url）获取熔断器
+
+    相关环境变量：
+        BREAKER_THRESHOLD=5        连续失败多少次后熔断
+        BREAKER_RESET=60           熔断后冷却的秒数
+    """
+    key = getattr(config, 'base_url', None) or 'default'
+    with _breakers_lock:
+        if key not in _breakers:
+            load_env()
+            _breakers[key] = CircuitBreaker(
+                failure_threshold=int(os.getenv('BREAKER_THRESHOLD', '5')),
+                reset_timeout=float(os.getenv('BREAKER_RESET', '60')),
+            )
+        return _breakers[key]
+
+_rate_limiters = {}
+_rate_limiters_lock = threading.Lock()
+
+def get_rate_limiter(config):
+    """
+    按端点（base_url）获取限速器，未设置 REVIEW_RPM 时返回 None
+
+    同一端点的所有评审进程共用一个令牌桶，请求按本进程的通道（interactive / normal / bulk）加权公平排队，
+    详见 rate_lanes 模块。
+
+    相关环境变量：
+        REVIEW_RPM=0               每分钟最多发送的请求数（0 表示不限速，可由 python main.py test --probe 推荐）
+    """
+    from rate_lanes import LaneRateLimiter
+
+    load_env()
+    rpm = float(os.getenv('REVIEW_RPM', '0') or 0)
+    if rpm <= 0:
+        return None
+    key = getattr(config, 'base_url', None) or 'default'
+    with _rate_limiters_lock:
+        if key not in _rate_limiters:
+            _rate_limiters[key] = LaneRateLimiter(rpm, key)
+        return _rate_limiters[key]
+
+def get_rate_limiters():
+    """本进程已创建的全部限速器"""
+    with _rate_limiters_lock:
+        return list(_rate_limiters.values())
+
+# 截断续写时追加的指令
+CONTINUE_PROMPT = "你的上一条回复因长度限制被截断。请从截断处继续输出，不要重复已输出的内容，也不要添加任何说明。"
+
+def _format_options(response_format):
+    """response_format 为空时不发送该参数（兼容不支持结构化输出的端点）"""
+    return {'response_format': response_format} if response_format else {}
+
+def _create_once(config, messages, max_tokens, temperature, response_format=None):
+    """
+    单次调用，返回 (回复文本, usage, finish_reason, 实际作答的配置)
+
+    启用请求对冲时由对冲器发起，对冲请求（可能是 HEDGE_MODEL）胜出时返回其配置。
+    """
+    hedger = get_hedger()
+    if hedger is not None:
+        return hedger.complete(config, messages, max_tokens, temperature, response_format)
+
+    response = config.client.chat.completions.create(
+        model=config.model_name,
+        messages=messages,
+        stream=False,
+        max_tokens=max_tokens,
+        temperature=temperature,
+        **_format_options(response_format),
+    )
+    usage = None
+    if getattr(response, 'usage', None):
+        usage = {
+            'prompt_tokens': response.usage.prompt_tokens,
+            'completion_tokens': response.usage.completion_tokens,
+        }
+    if not response.choices:
+        return "", usage, None, config
+    choice = response.choices[0]
+    return choice.message.content or "", usage, choice.finish_reason, config
+
+def get_max_continuations():
+    """截断后最多续写的次数（LLM_MAX_CONTINUATIONS，默认 3）"""
+    load_env()
+    return int(os.getenv('LLM_MAX_CONTINUATIONS', '3'))
+
+def _admit(governor, config, max_tokens):
+    """预算准入，返回 (实际使用的配置, 输出上限)；被拒绝时返回 None"""
+    admitted = governor.admit(config)
+    if admitted is None:
+        return None
+    if admitted is not config:
+        # 降级到快速模型：输出上限不超过该模型的最大输出
+        from token_budget import get_model_limits
+        max_tokens = min(max_tokens, get_model_limits(admitted.model_name)[1])
+    return admitted, max_tokens
+
+def complete(config, messages, max_tokens=10000, temperature=0.7, max_continuations=None, response_format=None):
+    """
+    调用大模型并返回 LLMResult
+
+    输出因 max_tokens 截断（finish_reason == 'length'）时，把已输出内容作为 assistant 消息
+    追加到对话中并请求继续，各段拼接为完整回复；调用异常时不抛出，按错误分类返回。
+    response_format 为 JSON 模式或响应结构（见 structured_output），为空时不发送。
+    """
+    if max_continuations is None:
+        max_continuations = get_max_continuations()
+    governor = get_budget_governor()
+    admitted = _admit(governor, config, max_tokens)
+    if admitted is None:
+        return LLMResult(error=governor.refusal_message(), error_class='budget_exceeded',
+                         model=getattr(config, 'model_name', None))
+    config, max_tokens = admitted
+    breaker = get_circuit_breaker(config)
+    limiter = get_rate_limiter(config)
+    model = getattr(config, 'model_name', None)
+
+    parts = []
+    usage = {'prompt_tokens': 0, 'completion_tokens': 0}
+    finish_reason = None
+    conversation = list(messages)
+    for attempt in range(max_continuations + 1):
+        if not breaker.allow():
+            return LLMResult(
+                "".join(parts), finish_reason, usage,
+                error="端点已熔断，暂停发送请求", error_class='circuit_open',
+                retryable=True, continuations=max(0, attempt - 1), model=model,
+                retry_after=breaker.retry_after())
+        if limiter is not None:
+            limiter.acquire()
+        try:
+            text, part_usage, finish_reason, served = _create_once(config, conversation, max_tokens, temperature,
+                                                                   response_format)
+        except Exception as e:
+            error_class, retryable = classify_error(e)
+            if retryable:
+                breaker.record_failure()
+            else:
+                breaker.release()
+            return LLMResult(
+                "".join(parts), finish_reason, usage, error=str(e), error_class=error_class,
+                retryable=retryable, continuations=max(0, attempt - 1), model=model)
+        if get_circuit_breaker(served) is breaker:
+            breaker.record_success()
+        else:
+            # 其他端点的对冲请求胜出：主请求已取消，只释放探测名额（对冲端点的状态由对冲器记录）
+            breaker.release()
+        # 用量记在实际作答的模型上
+        model = getattr(served, 'model_name', model)
+        governor.record(model, part_usage)
+
+        parts.append(text)
+        for key in usage:
+            usage[key] += (part_usage or {}).get(key, 0)
+        # 推理模型可能在思考阶段就被截断（正文为空），续写无从衔接
+        if finish_reason != 'length' or not text or attempt == max_continuations:
+            return LLMResult("".join(parts), finish_reason, usage, continuations=attempt, model=model)
+        conversation = list(messages) + [
+            {"role": "assistant", "content": "".join(parts)},
+            {"role": "user", "content": CONTINUE_PROMPT},
+        ]
+
+# 端点（base_url, 模型）是否支持一次请求返回多个候选：首次请求时探测，针对 n 参数报错或返回的候选数不足即视为不支持
+_n_support = {}
+_n_support_lock = threading.Lock()
+
+# 错误信息中单独出现的参数名 n（例如 "'n' is not supported"、"n must be 1"）
+_N_PARAM_PATTERN = re.compile(r"(?<![A-Za-z0-9_])n(?![A-Za-z0-9_])")
+
+def _rejects_n(exc):
+    """参数错误是否针对 n 参数（其他参数错误，例如 response_format 不受支持，原样返回给调用方）"""
+    return getattr(exc, 'param', None) == 'n' or bool(_N_PARAM_PATTERN.search(str(exc)))
+
+def _create_samples(config, messages, n, max_tokens, temperature, response_format=None):
+    """一次请求 n 个候选，返回 ([(回复文本, finish_reason)], usage)"""
+    response = config.client.chat.completions.create(
+        model=config.model_name,
+        messages=messages,
+        stream=False,
+        max_tokens=max_tokens,
+        temperature=temperature,
+        n=n,
+        **_format_options(response_format),
+    )
+    usage = None
+    if getattr(response, 'usage', None):
+        usage = {
+            'prompt_tokens': response.usage.prompt_tokens,
+            'completion_tokens': response.usage.completion_tokens,
+        }
+    return [(choice.message.content or "", choice.finish_reason) for choice in response.choices or []], usage
+
+def complete_samples(config, messages, n, max_tokens=10000, temperature=0.7, response_format=None):
+    """
+    取得 n 个独立的回复样本
+
+    端点支持 n 参数时只发送一次请求，提示只计费一次（合计 usage 记在第一个样本上，不对冲、不续写）；
+    不支持时（或候选数不足时补齐）并行调用 complete，每个样本各自续写。
+
+    Returns:
+        LLMResult 列表（调用失败的样本为带错误的 LLMResult）
+    """
+    if n <= 1:
+        return [complete(config, messages, max_tokens, temperature, response_format=response_format)]
+
+    key = (getattr(config, 'base_url', None), getattr(config, 'model_name', None))
+    results = []
+    if _n_support.get(key) is not False:
+        governor = get_budget_governor()
+        admitted = _admit(governor, config, max_tokens)
+        if admitted is None:
+            return [LLMResult(error=governor.refusal_message(), error_class='budget_exceeded',
+                              model=getattr(config, 'model_name', None))]
+        sample_config, sample_max_tokens = admitted
+        breaker = get_circuit_breaker(sample_config)
+        if not breaker.allow():
+            return [LLMResult(error="端点已熔断，暂停发送请求", error_class='circuit_open', retryable=True,
+                              model=sample_config.model_name, retry_after=breaker.retry_after())]
+        limiter = get_rate_limiter(sample_config)
+        if limiter is not None:
+            limiter.acquire()
+        try:
+            choices, usage = _create_samples(sample_config, messages, n, sample_max_tokens, temperature,
+                                             response_format)
+        except Exception as e:
+            error_class, retryable = classify_error(e)
+            if retryable:
+                breaker.record_failure()
+            else:
+                breaker.release()
+            if error_class != 'bad_request' or not _rejects_n(e):
+                return [LLMResult(error=str(e), error_class=error_class, retryable=retryable,
+                                  model=sample_config.model_name)]
+            # 针对 n 参数的错误：视为不支持 n，改为并行请求
+            choices, usage = [], None
+        else:
+            breaker.record_success()
+            governor.record(sample_config.model_name, usage)
+        with _n_support_lock:
+            _n_support[key] = len(choices) >= n
+        for i, (text, finish_reason) in enumerate(choices[:n]):
+            results.append(LLMResult(text, finish_reason, usage if i == 0 else None, model=sample_config.model_name))
+
+    missing = n - len(results)
+    if missing > 0:
+        with ThreadPoolExecutor(max_workers=missing, thread_name_prefix='llm-sample') as executor:
+            futures = [executor.submit(contextvars.copy_context().run, complete, config, messages, max_tokens,
+                                       temperature, response_format=response_format) for _ in range(missing)]
+            results.extend(future.result() for future in futures)
+    return results
+
+def stream_completion(config, messages, max_tokens, temperature, cancel_event=None, progress=None,
+                      response_format=None):
+    """
+    以流式方式调用大模型，支持中途取消
+
+    Args:
+        cancel_event: CancelToken（由其他线程 set() 时立即关闭连接）或 threading.Event（收到下一段数据时检查），
+            被设置后抛出 RequestCancelled
+        progress: 可选列表，实时追加已收到的文本片段（取消时用于估算已消耗的输出）
+        response_format: JSON 模式或响应结构，为空时不发送
+
+    Returns:
+        (回复文本, usage 字典或 None, finish_reason)
+    """
+    stream = config.client.chat.completions.create(
+        model=config.model_name,
+        messages=messages,
+        stream=True,
+        stream_options={"include_usage": True},
+        max_tokens=max_tokens,
+        temperature=temperature,
+        **_format_options(response_format),
+    )
+    parts = progress if progress is not None else []
+    usage = None
+    finish_reason = None
+    attach = getattr(cancel_event, 'attach', None)
+    try:
+        if attach is not None and not attach(stream):
+            raise RequestCancelled()
+        for chunk in stream:
+            if cancel_event is not None and cancel_event.is_set():
+                raise RequestCancelled()
+            if getattr(chunk, 'usage', None):
+                usage = {
+                    'prompt_tokens': chunk.usage.prompt_tokens,
+                    'completion_tokens': chunk.usage.completion_tokens,
+                }
+            if chunk.choices:
+                choice = chunk.choices[0]
+                if getattr(choice.delta, 'content', None):
+                    parts.append(choice.delta.content)
+                if getattr(choice, 'finish_reason', None):
+                    finish_reason = choice.finish_reason
+    except Exception:
+        # 连接被取消方关闭时读取会报错，统一按取消处理
+        if cancel_event is not None and cancel_event.is_set():
+            raise RequestCancelled()
+        raise
+    finally:
+        stream.close()
+    return "".join(parts), usage, finish_reason
+
+class LatencyTracker:
+    """
+    滑动窗口内主请求的耗时统计
+
+    对冲胜出后被取消的主请求只知道耗时的下限，记为截尾样本：计算分位数时排在全部完整样本之后，
+    对冲本身不会把分布的尾部截掉，触发阈值不会随对冲逐渐降低。
+    """
+
+    def __init__(self, window=200):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds, censored=False):
+        with self._lock:
+            self._samples.append((seconds, censored))
+
+    def count(self):
+        with self._lock:
+            return len(self._samples)
+
+    def percentile(self, p):
+        """返回第 p 百分位耗时，没有样本时返回 None"""
+        with self._lock:
+            samples = sorted(seconds for seconds, censored in self._samples if not censored) + \
+                sorted(seconds for seconds, censored in self._samples if censored)
+        if not samples:
+            return None
+        index = min(len(samples) - 1, max(0, int(round(p / 100 * (len(samples) - 1)))))
+        return samples[index]
+
+class RequestHedger:
+    """
+    请求对冲器
+
+    Args:
+        percentile: 触发对冲的延迟分位数（例如 95 表示超过 P95 耗时后发出对冲请求）
+        max_hedge_ratio: 对冲请求数占总调用数的上限，用于控制额外开销
+        min_samples: 收集到足够的耗时样本前不发起对冲
+        hedge_config: 对冲请求使用的模型配置，None 表示与主请求相同
+    """
+
+    def __init__(self, percentile=95, max_hedge_ratio=0.1, min_samples=10, hedge_config=None, max_workers=32):
+        self.percentile = percentile
+        self.max_hedge_ratio = max_hedge_ratio
+        self.min_samples = min_samples
+        self.hedge_config = hedge_config
+        self.tracker = LatencyTracker()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='llm-hedge')
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.extra_prompt_tokens = 0
+        self.extra_completion_tokens = 0
+
+    def _hedge_delay(self):
+        """当前的对冲触发阈值（秒），样本不足时返回 None"""
+        if self.tracker.count() < self.min_samples:
+            return None
+        return self.tracker.percentile(self.percentile)
+
+    def _may_hedge(self):
+        """额外请求是否仍在预算内"""
+        with self._lock:
+            return self.hedges + 1 <= self.max_hedge_ratio * max(self.calls, 1)
+
+    def _record_loser(self, future, progress, sent, winner_usage, loser_config):
+        """
+        统计落败请求的额外开销：提示 token 与胜出请求相同，输出 token 按已收到的文本估算；
+        同时计入预算管理器（按落败方的模型计价）
+        """
+        if not sent.is_set():
+            return
+        usage = None
+        if future.done() and not future.cancelled() and future.exception() is None:
+            usage = future.result()[1]
+        prompt_tokens = (usage or winner_usage or {}).get('prompt_tokens', 0)
+        if usage:
+            completion_tokens = usage.get('completion_tokens', 0)
+        else:
+            # 粗略估算：中文约 1 字/token，英文约 4 字符/token，取折中
+            completion_tokens = len("".join(progress)) // 2
+        with self._lock:
+            self.extra_prompt_tokens += prompt_tokens
+            self.extra_completion_tokens += completion_tokens
+        get_budget_governor().record(getattr(loser_config, 'model_name', None),
+                                     {'prompt_tokens': prompt_tokens, 'completion_tokens': completion_tokens})
+
+    @staticmethod
+    def _hedge_call(config, messages, max_tokens, temperature, cancel_event, progress, response_format, lane, sent):
+        """
+        对冲请求：与普通请求一样占用限速额度与熔断器名额
+
+        在对冲线程中排队取得限速额度（排队期间主请求先完成时直接放弃，不产生开销），
+        真正发出时设置 sent，结束后记录熔断器状态。
+        """
+        breaker = get_circuit_breaker(config)
+        try:
+            limiter = get_rate_limiter(config)
+            if limiter is not None:
+                limiter.acquire(lane)
+            if cancel_event.is_set():
+                raise RequestCancelled()
+            sent.set()
+            outcome = stream_completion(config, messages, max_tokens, temperature, cancel_event, progress,
+                                        response_format)
+        except RequestCancelled:
+            breaker.release()
+            raise
+        except Exception as e:
+            if classify_error(e)[1]:
+                breaker.record_failure()
+            else:
+                breaker.release()
+            raise
+        breaker.record_success()
+        return outcome
+
+    def complete(self, config, messages, max_tokens, temperature, response_format=None):
+        """发起（可能被对冲的）调用，返回 (回复文本, usage, finish_reason, 实际作答的配置)"""
+        from rate_lanes import get_lane
+
+        with self._lock:
+            self.calls += 1
+
+        start = time.time()
+        primary_cancel, primary_progress = CancelToken(), []
+        primary = self._executor.submit(
+            stream_completion, config, messages, max_tokens, temperature, primary_cancel, primary_progress,
+            response_format)
+
+        delay = self._hedge_delay()
+        done, _ = wait([primary], timeout=delay)
+        hedge_config = self.hedge_config or config
+        # 对冲端点熔断中（或同一端点正在半开探测）时不对冲
+        if primary in done or not self._may_hedge() or not get_circuit_breaker(hedge_config).allow():
+            outcome = primary.result()
+            self.tracker.record(time.time() - start)
+            return outcome + (config,)
+
+        with self._lock:
+            self.hedges += 1
+        hedge_cancel, hedge_progress, hedge_sent = CancelToken(), [], threading.Event()
+        hedge = self._executor.submit(
+            self._hedge_call, hedge_config, messages, max_tokens, temperature,
+            hedge_cancel, hedge_progress, response_format, get_lane(), hedge_sent)
+        primary_sent = threading.Event()
+        primary_sent.set()
+
+        contenders = {
+            primary: (primary_cancel, primary_progress, primary_sent, config),
+            hedge: (hedge_cancel, hedge_progress, hedge_sent, hedge_config),
+        }
+        pending = set(contenders)
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is not None:
+                    if future is primary or error is None:
+                        error = future.exception()
+                    continue
+                outcome = future.result()
+                if future is primary:
+                    self.tracker.record(time.time() - start)
+                else:
+                    with self._lock:
+                        self.hedge_wins += 1
+                    if not primary.done():
+                        # 主请求仍未完成：只知道其耗时不短于当前值
+                        self.tracker.record(time.time() - start, censored=True)
+                # 取消仍在进行的另一方并统计其额外开销
+                for other in pending:
+                    contenders[other][0].set()
+                loser = primary if future is hedge else hedge
+                _, progress, sent, loser_config = contenders[loser]
+                self._record_loser(loser, progress, sent, outcome[1], loser_config)
+                return outcome + (contenders[future][3],)
+        raise error
+
+    def report(self):
+        """对冲统计"""
+        with self._lock:
+            return {
+                'calls': self.calls,
+                'hedges': self.hedges,
+                'hedge_wins': self.hedge_wins,
+                'hedge_rate': self.hedges / self.calls if self.calls else 0.0,
+                'win_rate': self.hedge_wins / self.hedges if self.hedges else 0.0,
+                'extra_prompt_tokens': self.extra_prompt_tokens,
+                'extra_completion_tokens': self.extra_completion_tokens,
+                'p50': self.tracker.percentile(50),
+                'threshold': self._hedge_delay(),
+            }
+
+    def format_report(self):
+        """格式化对冲统计，供最终统计输出"""
+        r = self.report()
+        threshold = f"{r['threshold']:.1f}秒" if r['threshold'] is not None else "样本不足"
+        return (
+            f"对冲请求: {r['hedges']}/{r['calls']} 次调用 ({r['hedge_rate']*100:.1f}%)，"
+            f"对冲胜出 {r['hedge_wins']} 次 (胜率 {r['win_rate']*100:.1f}%)，"
+            f"额外 token ≈ 提示 {r['extra_prompt_tokens']} + 输出 {r['extra_completion_tokens']}，"
+            f"当前触发阈值 P{self.percentile}={threshold}"
+        )
+
+_hedger = None
+_hedger_lock = threading.Lock()
+
+def is_hedging_enabled():
+    """是否启用请求对冲（REVIEW_HEDGE 环境变量）"""
+    load_env()
+    return os.getenv('REVIEW_HEDGE', '').lower() in ('1', 'true', 'yes', 'on')
+
+def get_hedger():
+    """
+    获取全局请求对冲器，未启用时返回 None
+
+    相关环境变量：
+        REVIEW_HEDGE=1             启用对冲
+        HEDGE_PERCENTILE=95        触发对冲的延迟分位数
+        HEDGE_MAX_RATIO=0.1        对冲请求占总调用数的上限
+        HEDGE_MIN_SAMPLES=10       开始对冲前需要的耗时样本数
+        HEDGE_PROVIDER / HEDGE_MODEL  对冲请求使用的备用提供商/模型（默认与主请求相同）
+    """
+    global _hedger
+    if not is_hedging_enabled():
+        return None
+    with _hedger_lock:
+        if _hedger is None:
+            hedge_config = None
+            if os.getenv('HEDGE_PROVIDER') or os.getenv('HEDGE_MODEL'):
+                from model_config import get_model_config
+                hedge_config = get_model_config(os.getenv('HEDGE_MODEL'), os.getenv('HEDGE_PROVIDER'))
+            _hedger = RequestHedger(
+                percentile=float(os.getenv('HEDGE_PERCENTILE', '95')),
+                max_hedge_ratio=float(os.getenv('HEDGE_MAX_RATIO', '0.1')),
+                min_samples=int(os.getenv('HEDGE_MIN_SAMPLES', '10')),
+                hedge_config=hedge_config,
+            )
+        return _hedger
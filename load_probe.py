@@ -0,0 +1,314 @@
+"""
+并发负载探测
+按 1、2、4、8… 逐级提高并发，用与实际评审规模相当的提示（prompt.txt + 完整检查单 + 一条需求）
+调用配置的端点（或本地模拟端点），统计每一级的吞吐量、延迟分位数与错误/限流比例，
+据此推荐 REVIEW_CONCURRENCY 与 REVIEW_RPM，并可写入 .env。
+
+探测直接调用客户端，不经过重试、熔断与对冲，测得的是端点本身的表现。
+"""
+
+import os
+import time
+import random
+import threading
+from types import SimpleNamespace
+from concurrent.futures import ThreadPoolExecutor
+
+# 限流（429）比例超过该值视为过载
+MAX_RATE_LIMITED = 0.02
+
+# 其他错误比例超过该值视为过载
+MAX_ERROR_RATE = 0.05
+
+# 提高并发后吞吐提升不足该比例视为饱和
+MIN_GAIN = 0.10
+
+# 推荐的每分钟请求数相对实测成功吞吐保留的余量
+RPM_HEADROOM = 0.8
+
+# requirements.xlsx 不存在时使用的示例需求
+SAMPLE_REQUIREMENT = """**标识**
+PROBE_001
+**标题**
+互斥锁参数验证需求
+**版本信息**
+V1.0
+**需求类型**
+功能需求
+**是否派生的需求**
+是
+**派生理由**
+基于输入验证要求派生
+**接口原型**
+int ValidateMutexParams(char* name, int priority)
+**需求描述**
+系统应验证互斥锁创建参数的有效性，包括名称长度和优先级范围；名称为空指针或长度超过64个字符时应返回错误码 -1，
+优先级不在 1-10 范围内时应返回错误码 -2，参数有效时应返回 0。
+**测试建议**
+验证参数边界条件和无效输入处理
+**注释**
+优先级范围1-10
+"""
+
+def build_probe_messages(script_dir=None):
+    """
+    构造与实际评审规模相当的对话消息
+
+    Returns:
+        (消息列表, 检查条目数)
+    """
+    from model_config import build_review_messages
+    from checklist import Checklist
+    from prompt_format import render_review_prompt
+
+    script_dir = script_dir or os.path.dirname(os.path.abspath(__file__))
+    with open(os.path.join(script_dir, "prompt.txt"), 'r', encoding='utf-8') as f:
+        template = f.read()
+    checklist = Checklist.from_file(os.path.join(script_dir, "checklist.txt"))
+
+    requirement = SAMPLE_REQUIREMENT
+    requirements_path = os.path.join(script_dir, "requirements.xlsx")
+    if os.path.exists(requirements_path):
+        from input_cache import load_requirements
+        from reviewer import build_requirement_text
+        try:
+            df = load_requirements(requirements_path)
+        except Exception as e:
+            print(f"⚠️ 读取 {requirements_path} 失败，使用示例需求: {str(e)}")
+        else:
+            if len(df):
+                requirement = build_requirement_text(df.iloc[0].to_dict())
+
+    prompt = render_review_prompt(template, checklist.text, requirement)
+    return build_review_messages(prompt), len(checklist.items)
+
+class MockEndpoint:
+    """
+    本地模拟端点（与 ModelConfig 接口相同：client / model_name / base_url）
+
+    服务端同时处理 capacity 个请求，超出部分排队使延迟按负载增加；
+    并发超过 capacity 时，超出的比例按相同概率返回 429。
+
+    Args:
+        capacity: 模拟的服务端并发容量
+        latency: 空载时单次调用的中位耗时（秒）
+        jitter: 耗时的对数正态波动
+        seed: 随机种子
+    """
+
+    def __init__(self, capacity=6, latency=0.3, jitter=0.25, seed=None, model_name='mock-reviewer'):
+        self.capacity = capacity
+        self.latency = latency
+        self.jitter = jitter
+        self.model_name = model_name
+        self.base_url = 'mock://load-probe'
+        self.in_flight = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=self._create)))
+
+    def _rate_limited(self):
+        import httpx
+        import openai
+        response = httpx.Response(429, request=httpx.Request('POST', f"{self.base_url}/chat/completions"))
+        return openai.RateLimitError("模拟端点限流", response=response, body=None)
+
+    def _create(self, model, messages, max_tokens=None, temperature=None, stream=False, **kwargs):
+        with self._lock:
+            self.in_flight += 1
+            load = self.in_flight
+            limited = load > self.capacity and self._random.random() < 1 - self.capacity / load
+            factor = self._random.lognormvariate(0, self.jitter)
+        try:
+            if limited:
+                time.sleep(self.latency * 0.05)
+                raise self._rate_limited()
+            time.sleep(self.latency * max(1.0, load / self.capacity) * factor)
+            prompt_chars = sum(len(m.get('content', '')) for m in messages)
+            return SimpleNamespace(
+                choices=[SimpleNamespace(
+                    message=SimpleNamespace(content="[评审结果]\n- [CHKI_01]: 通过\n[/评审结果]"),
+                    finish_reason='stop')],
+                usage=SimpleNamespace(prompt_tokens=prompt_chars // 2, completion_tokens=min(max_tokens or 800, 800)),
+            )
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+def get_config(mock=False):
+    """探测使用的模型配置：mock 为 True 时返回本地模拟端点"""
+    if mock:
+        return MockEndpoint()
+    from model_config import get_model_config
+    return get_model_config()
+
+def ramp_levels(max_concurrency):
+    """1、2、4、8… 直到 max_concurrency（包含）"""
+    levels, level = [], 1
+    while level < max_concurrency:
+        levels.append(level)
+        level *= 2
+    levels.append(max(1, max_concurrency))
+    return levels
+
+def requests_for_level(concurrency, requests_per_level=None):
+    """每一级发送的请求数：默认为并发数的 2 倍，至少 4 个"""
+    return requests_per_level or max(2 * concurrency, 4)
+
+def percentile(samples, p):
+    """第 p 百分位（最近秩），没有样本时返回 None"""
+    samples = sorted(samples)
+    if not samples:
+        return None
+    index = min(len(samples) - 1, max(0, int(round(p / 100 * (len(samples) - 1)))))
+    return samples[index]
+
+def _timed_call(config, messages, max_tokens, temperature):
+    from llm_client import classify_error
+
+    start = time.time()
+    try:
+        response = config.client.chat.completions.create(
+            model=config.model_name,
+            messages=messages,
+            stream=False,
+            max_tokens=max_tokens,
+            temperature=temperature,
+        )
+    except Exception as e:
+        error_class, _ = classify_error(e)
+        return {'seconds': time.time() - start, 'error_class': error_class, 'error': str(e), 'completion_tokens': 0}
+    usage = getattr(response, 'usage', None)
+    return {
+        'seconds': time.time() - start,
+        'error_class': None,
+        'error': None,
+        'completion_tokens': getattr(usage, 'completion_tokens', 0) if usage else 0,
+    }
+
+def summarize_level(concurrency, calls, wall_seconds):
+    """汇总一级并发的调用结果"""
+    ok = [c for c in calls if c['error_class'] is None]
+    rate_limited = sum(1 for c in calls if c['error_class'] == 'rate_limit')
+    errors = len(calls) - len(ok) - rate_limited
+    latencies = [c['seconds'] for c in ok]
+    minutes = max(wall_seconds, 1e-9) / 60
+    return {
+        'concurrency': concurrency,
+        'requests': len(calls),
+        'ok': len(ok),
+        'rate_limited': rate_limited,
+        'errors': errors,
+        'rate_limited_rate': rate_limited / len(calls) if calls else 0.0,
+        'error_rate': errors / len(calls) if calls else 0.0,
+        'throughput': len(ok) / minutes,
+        'tokens_per_minute': sum(c['completion_tokens'] for c in ok) / minutes,
+        'p50': percentile(latencies, 50),
+        'p90': percentile(latencies, 90),
+        'p99': percentile(latencies, 99),
+        'wall_seconds': wall_seconds,
+        'sample_error': next((c['error'] for c in calls if c['error']), None),
+    }
+
+def probe_level(config, messages, concurrency, request_count, max_tokens, temperature=0.7):
+    """以固定并发发送 request_count 个请求并汇总"""
+    start = time.time()
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='load-probe') as executor:
+        calls = list(executor.map(
+            lambda _: _timed_call(config, messages, max_tokens, temperature), range(request_count)))
+    return summarize_level(concurrency, calls, time.time() - start)
+
+def is_overloaded(level):
+    return level['rate_limited_rate'] > MAX_RATE_LIMITED or level['error_rate'] > MAX_ERROR_RATE
+
+def run_probe(config, messages, max_tokens, max_concurrency=16, requests_per_level=None, on_level=None):
+    """
+    逐级提高并发，出现过载或吞吐不再提升时停止
+
+    Args:
+        on_level: 每完成一级后回调，参数为该级的汇总
+
+    Returns:
+        各级汇总列表
+    """
+    results = []
+    best = None
+    for concurrency in ramp_levels(max_concurrency):
+        level = probe_level(config, messages, concurrency,
+                            requests_for_level(concurrency, requests_per_level), max_tokens)
+        results.append(level)
+        if on_level:
+            on_level(level)
+        if is_overloaded(level):
+            break
+        if best is not None and level['throughput'] < best['throughput'] * (1 + MIN_GAIN):
+            break
+        if best is None or level['throughput'] > best['throughput']:
+            best = level
+    return results
+
+def recommend(results):
+    """
+    根据探测结果推荐设置
+
+    并发取未过载各级中达到最高吞吐（90% 以内）的最小并发；
+    探测中出现过限流时，按实测最高成功吞吐留出余量推荐 REVIEW_RPM，否则不限速。
+
+    Returns:
+        ({环境变量: 值}, 说明)
+    """
+    healthy = [r for r in results if not is_overloaded(r)]
+    limited = any(r['rate_limited'] for r in results)
+    if not healthy:
+        top = max(results, key=lambda r: r['throughput'])
+        rpm = max(1, int(top['throughput'] * RPM_HEADROOM))
+        return ({'REVIEW_CONCURRENCY': '1', 'REVIEW_RPM': str(rpm)},
+                "并发为 1 时端点已过载，建议串行调用并限速，或检查 API 配额")
+
+    peak = max(r['throughput'] for r in healthy)
+    chosen = min((r for r in healthy if r['throughput'] >= peak * (1 - MIN_GAIN)), key=lambda r: r['concurrency'])
+    settings = {'REVIEW_CONCURRENCY': str(chosen['concurrency'])}
+    if limited:
+        top = max(r['throughput'] for r in results)
+        settings['REVIEW_RPM'] = str(max(1, int(top * RPM_HEADROOM)))
+        reason = (f"并发 {chosen['concurrency']} 时吞吐达到峰值 {peak:.1f} 次/分钟；更高并发出现限流，"
+                  f"按最高成功吞吐的 {RPM_HEADROOM:.0%} 限速")
+    else:
+        settings['REVIEW_RPM'] = '0'
+        last = results[-1]['concurrency']
+        reason = (f"并发 {chosen['concurrency']} 时吞吐达到峰值 {peak:.1f} 次/分钟；"
+                  f"探测至并发 {last} 未出现限流，无需限速")
+    return settings, reason
+
+def format_level(level):
+    """格式化一级并发的汇总"""
+    def seconds(value):
+        return f"{value:.2f}" if value is not None else "-"
+    return (
+        f"{level['concurrency']:>6} {level['requests']:>6} {level['ok']:>6} "
+        f"{level['rate_limited_rate']*100:>7.1f}% {level['error_rate']*100:>7.1f}% "
+        f"{level['throughput']:>9.1f} {level['tokens_per_minute']:>10.0f} "
+        f"{seconds(level['p50']):>8} {seconds(level['p90']):>8} {seconds(level['p99']):>8}"
+    )
+
+LEVEL_HEADER = (f"{'并发':>5} {'请求':>5} {'成功':>5} {'限流率':>6} {'错误率':>6} "
+                f"{'次/分钟':>7} {'token/分钟':>9} {'P50秒':>6} {'P90秒':>6} {'P99秒':>6}")
+
+def update_env_file(path, updates):
+    """在 .env 中更新（或追加）指定变量，保留其余内容"""
+    lines = []
+    if os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            lines = f.read().splitlines()
+    pending = dict(updates)
+    for i, line in enumerate(lines):
+        key = line.split('=', 1)[0].strip()
+        if not line.lstrip().startswith('#') and key in pending:
+            lines[i] = f"{key}={pending.pop(key)}"
+    if pending:
+        lines.append(f"# 负载探测推荐值（{time.strftime('%Y-%m-%d %H:%M')}）")
+        lines.extend(f"{key}={value}" for key, value in pending.items())
+    temp_path = f"{path}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        f.write("\n".join(lines) + "\n")
+    os.replace(temp_path, path)
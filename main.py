@@ -6,17 +6,22 @@
 import os
 import sys
 import argparse
+from importlib.util import find_spec
+
+# 依赖包名 -> 导入模块名
+REQUIRED_PACKAGES = {
+    'pandas': 'pandas',
+    'openai': 'openai',
+    'openpyxl': 'openpyxl',
+    'python-dotenv': 'dotenv',
+}
 
 def check_dependencies():
-    """检查依赖包"""
-    required_packages = ['pandas', 'openai', 'openpyxl', 'python-dotenv']
-    missing_packages = []
-    
-    for package in required_packages:
-        try:
-            __import__(package.replace('-', '_'))
-        except ImportError:
-            missing_packages.append(package)
+    """检查依赖包（仅查找模块规格，不实际导入）"""
+    missing_packages = [
+        package for package, module in REQUIRED_PACKAGES.items()
+        if find_spec(module) is None
+    ]
     
     if missing_packages:
         print(f"❌ 缺少依赖包: {', '.join(missing_packages)}")
@@ -32,7 +37,7 @@ def check_config():
         return False
     return True
 
-def run_single_review():
+def run_single_review(args):
     """运行单个需求评审"""
     if not os.path.exists('requirements.xlsx'):
         print("❌ requirements.xlsx 文件不存在")
@@ -40,9 +45,13 @@ def run_single_review():
         return
     
     print("🚀 开始单个需求评审...")
-    os.system('python reviewer.py')
+    import reviewer
+    from profiler import profiling
+    with profiling('single', enabled=args.profile or args.cprofile, use_cprofile=args.cprofile):
+        checklists = [name.strip() for name in args.checklists.split(',') if name.strip()] if args.checklists else None
+        reviewer.main(concurrency=args.concurrency, cascade=args.cascade, fanout=args.fanout, checklists=checklists)
 
-def run_batch_review():
+def run_batch_review(args):
     """运行批量接口评审"""
     if not os.path.exists('接口需求集合'):
         print("❌ 接口需求集合 目录不存在")
@@ -56,17 +65,88 @@ def run_batch_review():
         return
     
     print("🚀 开始批量接口评审...")
-    os.system('python reviewer_batch.py')
+    import reviewer_batch
+    from profiler import profiling
+    with profiling('batch', enabled=args.profile or args.cprofile, use_cprofile=args.cprofile):
+        reviewer_batch.main(cascade=args.cascade)
 
-def test_configuration():
-    """测试配置"""
+def run_queue_worker(args):
+    """以共享任务队列 worker 身份运行批量评审（可在多台主机上同时运行）"""
+    if not os.path.exists('接口需求集合'):
+        print("❌ 接口需求集合 目录不存在")
+        return
+    
+    print("🚀 启动批量评审 worker...")
+    import reviewer_batch
+    reviewer_batch.run_worker(
+        queue_path=args.queue,
+        worker_id=args.worker_id,
+        lease_seconds=args.lease,
+        cascade=args.cascade,
+        requeue=args.requeue
+    )
+
+def run_watch_mode(args):
+    """监视 接口需求集合/，新增或变化的接口文件写入完成后自动评审"""
+    if not os.path.exists('接口需求集合'):
+        print("❌ 接口需求集合 目录不存在")
+        return
+    
+    print("🚀 启动接口目录监视...")
+    import reviewer_batch
+    reviewer_batch.run_watch(
+        debounce=args.debounce,
+        poll_interval=args.poll_interval,
+        force_polling=args.polling,
+        cascade=args.cascade,
+        skip_existing=args.skip_existing,
+        once=args.once
+    )
+
+def run_report(args):
+    """跨运行汇总查询评审结果库"""
+    import time
+    from results_store import ResultsStore, format_table, get_default_store_path
+
+    db_path = args.db or get_default_store_path()
+    if not os.path.exists(db_path):
+        print(f"❌ 评审结果库不存在: {db_path}")
+        print("请先运行 single 或 batch 评审生成结果")
+        return 1
+    
+    start = time.time()
+    store = ResultsStore(db_path)
+    try:
+        columns, rows = store.query(
+            by=args.by, since=args.since, until=args.until, run_id=args.run,
+            interface=args.interface, verdict=args.verdict, top=args.top
+        )
+    finally:
+        store.close()
+    
+    print(f"📊 评审结果汇总（按 {args.by}，{len(rows)} 行，查询耗时 {time.time()-start:.2f} 秒）")
+    print(format_table(columns, rows))
+    
+    if args.output:
+        from xlsx_stream import write_rows_streaming
+        paths = write_rows_streaming(args.output, columns, rows)
+        print(f"💾 汇总已保存: {', '.join(paths)}")
+    return 0
+
+def test_configuration(args):
+    """测试配置（--probe 时进行并发负载探测）"""
     print("🧪 测试模型配置...")
-    os.system('python test_config.py')
+    import test_config
+    return test_config.main(
+        probe=args.probe, mock=args.mock, max_concurrency=args.max_concurrency,
+        requests_per_level=args.probe_requests, write_env=args.write_env
+    )
 
 def setup_project():
     """设置项目"""
     print("⚙️ 项目初始化设置...")
-    os.system('python setup.py')
+    import setup
+    setup.main()
 
 def show_help():
     """显示帮助信息"""
@@ -78,13 +158,35 @@ def show_help():
   test      - 测试大模型配置是否正确
   single    - 运行单个需求评审
   batch     - 运行批量接口评审
+  worker    - 作为共享任务队列的 worker 运行批量评审（可多机并行）
+  watch     - 监视 接口需求集合/，只评审新增或变化的接口文件
+  report    - 跨运行汇总查询评审结果库
   help      - 显示此帮助信息
 
 使用示例：
   python main.py setup    # 首次使用时运行
   python main.py test     # 测试配置
+  python main.py test --probe --write-env # 探测端点容量，把推荐的并发与限速写入 .env
   python main.py single   # 评审 requirements.xlsx
+  python main.py single --concurrency 4   # 4 条需求并发调用大模型
+  python main.py single --cascade         # 快速模型初审，推理模型仅复核失败/不确定条目
+  python main.py single --fanout 4        # 检查单分 4 组并行评审，单条需求耗时取决于最慢的一组
+  python main.py single --checklists checklist.txt,项目检查单.txt  # 同一遍对照多份检查单，结果分列保存
+  python main.py batch --budget 50        # 本次运行最多花费约 50 元，用尽后在检查点停止
+  python main.py batch --prompt-format compact  # 紧凑检查单与需求字段，减少提示 token
+  python main.py single --votes 3         # 每次评审取 3 个样本按条目多数投票，报告一致度
+  python main.py single --lane interactive  # 设置 REVIEW_RPM 时优先于正在运行的批量评审发送请求
+  python main.py batch --output-format json  # 模型返回结构化 JSON，减少输出 token 与解析开销
   python main.py batch    # 评审 接口需求集合/ 下所有文件
+  python main.py batch --profile          # 记录各步骤耗时，输出时间线到 性能分析/
+  python main.py single --record 评审录像.jsonl.gz   # 录制评审调用
+  python main.py single --replay 评审录像.jsonl.gz --profile  # 离线回放，测试解析与写入性能
+  python main.py worker   # 在多台主机上同时运行，共同完成批量评审
+  python main.py worker --queue /shared/评审队列.db --lease 900
+  python main.py watch    # 持续监视，文件写入完成后自动评审并更新汇总
+  python main.py watch --once             # 只评审上次以来新增/变化的文件后退出（适合定时任务）
+  python main.py report --by item --since 2026-07-01 --until 2026-10-01 --top 10
+  python main.py report --by interface --output 跨运行汇总.xlsx
 
 配置说明：
 1. 编辑 .env 文件设置 API 密钥
@@ -99,8 +201,74 @@ def main():
     """主函数"""
     parser = argparse.ArgumentParser(description='需求评审自动化工具')
     parser.add_argument('command', nargs='?', default='help', 
-                       choices=['setup', 'test', 'single', 'batch', 'help'],
+                       choices=['setup', 'test', 'single', 'batch', 'worker', 'watch', 'report', 'help'],
                        help='要执行的命令')
+    parser.add_argument('--concurrency', type=int, default=None,
+                       help='single: 并发评审的需求数（默认读取 REVIEW_CONCURRENCY，未设置时为 1）')
+    parser.add_argument('--fanout', type=int, default=None,
+                       help='single: 把检查单分成 N 组并行评审同一条需求（默认读取 REVIEW_FANOUT，未设置时不分组）')
+    parser.add_argument('--checklists', default=None,
+                       help='single: 逗号分隔的检查单文件，第一份为主检查单（默认读取 REVIEW_CHECKLISTS，未设置时为 checklist.txt）')
+    parser.add_argument('--cascade', action='store_true', default=None,
+                       help='single/batch/worker/watch: 快速模型先评审，仅失败/不确定的条目由推理模型复核（默认读取 REVIEW_CASCADE）')
+    parser.add_argument('--budget', type=float, default=None,
+                       help='single/batch/worker/watch: 本次运行的费用上限（元），默认读取 BUDGET_RUN_COST')
+    parser.add_argument('--prompt-format', default=None, choices=['markdown', 'compact'],
+                       help='single/batch/worker/watch: 提示格式，compact 为紧凑检查单与需求（默认读取 PROMPT_FORMAT，未设置时为 markdown）')
+    parser.add_argument('--votes', type=int, default=None,
+                       help='single/batch/worker/watch: 每次评审的样本数，按检查条目多数投票（默认读取 REVIEW_VOTES，未设置时为 1）')
+    parser.add_argument('--output-format', default=None, choices=['text', 'json'],
+                       help='single/batch/worker/watch: 评审输出格式，json 为紧凑的结构化结果，无效时回退文本格式（默认读取 REVIEW_OUTPUT_FORMAT，未设置时为 text）')
+    parser.add_argument('--lane', default=None, choices=['interactive', 'normal', 'bulk'],
+                       help='single/batch/worker/watch: 限速通道，interactive 优先发送（默认 single 为 normal，其余为 bulk；读取 REVIEW_LANE）')
+    parser.add_argument('--record', default=None, metavar='CASSETTE',
+                       help='single/batch: 把评审调用录制到压缩录像文件（如 评审录像.jsonl.gz）')
+    parser.add_argument('--replay', default=None, metavar='CASSETTE',
+                       help='single/batch: 回放录像中的评审结果，不调用大模型（离线测试后处理性能）')
+    parser.add_argument('--profile', action='store_true',
+                       help='single/batch: 记录各步骤耗时，输出 Chrome Trace 时间线（性能分析/ 目录）')
+    parser.add_argument('--cprofile', action='store_true',
+                       help='single/batch: 在 --profile 的基础上同时生成 cProfile 统计文件')
+    parser.add_argument('--probe', action='store_true',
+                       help='test: 逐级提高并发探测端点容量，推荐 REVIEW_CONCURRENCY 与 REVIEW_RPM')
+    parser.add_argument('--mock', action='store_true',
+                       help='test: 探测本地模拟端点（不发送真实请求）')
+    parser.add_argument('--max-concurrency', type=int, default=16,
+                       help='test: 探测的最高并发')
+    parser.add_argument('--probe-requests', type=int, default=None,
+                       help='test: 每一级发送的请求数（默认为并发数的 2 倍，至少 4 个）')
+    parser.add_argument('--write-env', action='store_true',
+                       help='test: 把推荐设置写入 .env')
+    parser.add_argument('--queue', default=None,
+                       help='worker: 任务队列数据库路径（默认 评审结果/评审队列.db）')
+    parser.add_argument('--lease', type=int, default=600,
+                       help='worker: 任务租约时长（秒）')
+    parser.add_argument('--requeue', action='store_true',
+                       help='worker: 把队列中所有接口（包括已完成的）重新置为待处理；内容变化的接口无需此参数也会重新评审')
+    parser.add_argument('--worker-id', default=None,
+                       help='worker: worker 标识（默认 主机名-进程号）')
+    parser.add_argument('--debounce', type=float, default=10.0,
+                       help='watch: 文件大小与修改时间保持不变多少秒后才评审（避免读到未写完的文件）')
+    parser.add_argument('--poll-interval', type=float, default=5.0,
+                       help='watch: 轮询模式的扫描间隔（秒）')
+    parser.add_argument('--polling', action='store_true',
+                       help='watch: 不使用 inotify，始终轮询（网络共享目录上 inotify 收不到其他主机的写入）')
+    parser.add_argument('--once', action='store_true',
+                       help='watch: 评审完当前新增/变化的文件后退出')
+    parser.add_argument('--skip-existing', action='store_true',
+                       help='watch: 把启动时已存在的文件记为已评审，只处理之后的变化')
+    parser.add_argument('--db', default=None,
+                       help='report: 评审结果库路径（默认读取 RESULTS_DB，未设置时为 评审结果库.db）')
+    parser.add_argument('--by', default='item', choices=['item', 'interface', 'requirement', 'run'],
+                       help='report: 汇总维度')
+    parser.add_argument('--since', default=None, help='report: 运行开始时间下限（YYYY-MM-DD）')
+    parser.add_argument('--until', default=None, help='report: 运行开始时间上限（YYYY-MM-DD，不含）')
+    parser.add_argument('--run', default=None, help='report: 只统计指定运行标识')
+    parser.add_argument('--interface', default=None, help='report: 只统计指定接口')
+    parser.add_argument('--verdict', default='失败', choices=['失败', '不确定', '不适用', '通过'],
+                       help='report: 按检查条目汇总时的排序结论')
+    parser.add_argument('--top', type=int, default=None, help='report: 只显示前 N 行')
+    parser.add_argument('--output', default=None, help='report: 把汇总另存为 xlsx')
     
     args = parser.parse_args()
     
@@ -117,19 +285,54 @@ def main():
         setup_project()
         return
     
+    # 查询结果库只依赖标准库 sqlite3，不需要 API 配置
+    if args.command == 'report':
+        return run_report(args)
+    
     # 其他命令需要检查依赖和配置
     if not check_dependencies():
         return
     
+    # 探测本地模拟端点不需要 API 配置
+    if args.command == 'test' and args.probe and args.mock:
+        return test_configuration(args)
+    
     if not check_config():
         return
     
     if args.command == 'test':
-        test_configuration()
-    elif args.command == 'single':
-        run_single_review()
+        return test_configuration(args)
+    
+    if args.budget is not None:
+        from budget import set_run_budget
+        set_run_budget(args.budget)
+    if args.prompt_format is not None:
+        from prompt_format import set_prompt_format
+        set_prompt_format(args.prompt_format)
+    if args.record or args.replay:
+        if args.record and args.replay:
+            print("❌ --record 与 --replay 不能同时使用")
+            return
+        from cassette import set_cassette
+        set_cassette(args.record or args.replay, 'record' if args.record else 'replay')
+    if args.votes is not None:
+        from model_config import set_vote_count
+        set_vote_count(args.votes)
+    if args.lane is not None:
+        from rate_lanes import set_lane
+        set_lane(args.lane)
+    if args.output_format is not None:
+        from structured_output import set_output_format
+        set_output_format(args.output_format)
+    
+    if args.command == 'single':
+        run_single_review(args)
     elif args.command == 'batch':
-        run_batch_review()
+        run_batch_review(args)
+    elif args.command == 'worker':
+        run_queue_worker(args)
+    elif args.command == 'watch':
+        run_watch_mode(args)
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
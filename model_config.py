@@ -4,11 +4,16 @@
 """
 
 import os
-from openai import OpenAI
-from dotenv import load_dotenv
 
-# 加载环境变量
-load_dotenv()
+_env_loaded = False
+
+def load_env():
+    """加载 .env 环境变量（仅首次调用时导入 python-dotenv）"""
+    global _env_loaded
+    if not _env_loaded:
+        from dotenv import load_dotenv
+        load_dotenv()
+        _env_loaded = True
 
 class ModelConfig:
     """大模型配置类"""
@@ -20,17 +25,20 @@ class ModelConfig:
         'openai': {
             'default_model': 'gpt-4o',
             'alternative_models': ['gpt-4', 'gpt-3.5-turbo'],
+            'fast_model': 'gpt-3.5-turbo',
             'default_url': 'https://api.openai.com/v1'
         },
         'deepseek': {
             'default_model': 'deepseek-reasoner',
             'alternative_models': ['deepseek-chat', 'deepseek-coder'],
+            'fast_model': 'deepseek-chat',
             'default_url': 'https://api.deepseek.com/v1'
         }
     }
     
-    def __init__(self):
-        self.provider = os.getenv('MODEL_PROVIDER', 'deepseek').lower()
+    def __init__(self, model_name=None, provider=None):
+        load_env()
+        self.provider = (provider or os.getenv('MODEL_PROVIDER', 'deepseek')).lower()
         self.validate_provider()
         
         # 根据提供商设置配置
@@ -43,11 +51,16 @@ class ModelConfig:
             self.base_url = os.getenv('DEEPSEEK_URL', self.MODEL_MAPPING['deepseek']['default_url'])
             self.model_name = os.getenv('DEEPSEEK_MODEL', self.MODEL_MAPPING['deepseek']['default_model'])
         
+        # 显式指定的模型（例如级联评审中的快速模型）优先
+        if model_name:
+            self.model_name = model_name
+        
         # 验证API密钥
         if not self.api_key:
             raise ValueError(f"请在.env文件中设置 {self.provider.upper()}_API")
         
-        # 初始化客户端
+        # 初始化客户端（openai/httpx 仅在此时导入）
+        from openai import OpenAI
         self.client = OpenAI(
             api_key=self.api_key,
             base_url=self.base_url
@@ -79,9 +92,155 @@ class ModelConfig:
             'api_key_set': bool(self.api_key)
         }
 
-def get_model_config():
-    """获取模型配置实例"""
-    return ModelConfig()
+def get_model_config(model_name=None, provider=None):
+    """获取模型配置实例，model_name/provider 为空时使用 .env 中的配置（回放录像时不创建客户端）"""
+    from cassette import get_cassette
+
+    cassette = get_cassette()
+    if cassette is not None and cassette.replaying:
+        return cassette.model_config(model_name, provider)
+    return ModelConfig(model_name, provider)
+
+def get_fast_model_name():
+    """级联评审第一级使用的快速模型（CASCADE_FAST_MODEL，默认取当前提供商的 fast_model）"""
+    load_env()
+    provider = os.getenv('MODEL_PROVIDER', 'deepseek').lower()
+    default = ModelConfig.MODEL_MAPPING.get(provider, {}).get('fast_model')
+    return os.getenv('CASCADE_FAST_MODEL', default)
+
+# 评审使用的系统提示
+REVIEW_SYSTEM_PROMPT = "你是一个软件工程专家和适航工程师，专注于DO-178C A级软件标准的合规性评审。你的职责是确保软件需求满足最高安全完整性等级的要求。"
+
+def build_review_messages(prompt: str) -> list:
+    """构造评审对话消息"""
+    return [
+        {
+            "role": "system", 
+            "content": REVIEW_SYSTEM_PROMPT
+        }, 
+        {
+            "role": "user", 
+            "content": prompt
+        }
+    ]
+
+# 未启用自适应预算时的输出上限
+DEFAULT_MAX_TOKENS = 10000
+
+def get_vote_count():
+    """投票评审的样本数（REVIEW_VOTES，默认 1 即不投票）"""
+    load_env()
+    try:
+        return max(1, int(os.getenv('REVIEW_VOTES', '1')))
+    except ValueError:
+        return 1
+
+def set_vote_count(votes):
+    """命令行 --votes：覆盖本次运行的样本数"""
+    os.environ['REVIEW_VOTES'] = str(votes)
+
+def vote_complete(config, messages, votes, max_tokens, temperature=0.7, response_format=None, normalize=None):
+    """
+    取得多个样本并按检查条目多数投票，返回合并后的 LLMResult
+
+    usage 为全部样本的合计，samples 为参与投票的有效样本数，agreement 为一致度；
+    全部样本失败时返回第一个失败样本。normalize 把样本文本转换为标准评审文本（如 JSON 模式的回复），
+    返回 None 的样本不参与投票，全部无效时返回 invalid_output 错误。
+    """
+    from llm_client import complete_samples, LLMResult
+    from review_parser import vote_reviews
+
+    samples = complete_samples(config, messages, votes, max_tokens=max_tokens, temperature=temperature,
+                               response_format=response_format)
+    usage = {'prompt_tokens': 0, 'completion_tokens': 0}
+    for sample in samples:
+        for key in usage:
+            usage[key] += (sample.usage or {}).get(key, 0)
+    valid = [sample for sample in samples if sample.ok and sample.text.strip()]
+    if not valid:
+        samples[0].usage = usage
+        return samples[0]
+    texts = [sample.text for sample in valid]
+    if normalize is not None:
+        converted = [(sample, normalize(sample.text)) for sample in valid]
+        valid = [sample for sample, text in converted if text is not None]
+        texts = [text for _, text in converted if text is not None]
+        if not valid:
+            return LLMResult(error="全部样本的输出均无效", error_class='invalid_output', usage=usage,
+                             model=samples[0].model)
+    text, agreement = vote_reviews(texts)
+    truncated = any(sample.truncated for sample in valid)
+    return LLMResult(text, 'length' if truncated else 'stop', usage, model=valid[0].model,
+                     samples=len(valid), agreement=agreement)
+
+def review_with_llm_result(prompt: str, config: ModelConfig = None, max_tokens: int = None, votes: int = None):
+    """
+    使用大语言模型进行评审，返回 llm_client.LLMResult
+    （包含 finish_reason、usage 与错误分类，截断的输出会自动续写）
+
+    max_tokens 为空时按提示中的检查条目数与历史输出长度选择（见 token_budget）；
+    提示超出上下文窗口时不发送请求，直接返回 prompt_too_large 错误。
+    votes 大于 1 时（默认读取 REVIEW_VOTES）取得多个样本，按检查条目多数投票后返回合并的评审文本。
+    输出格式为 json 时（REVIEW_OUTPUT_FORMAT）要求模型返回 JSON 并转换为标准评审文本，无效时回退文本格式。
+    设置了评审录像（LLM_CASSETTE）时录制本次调用，或直接回放录制的结果。
+    """
+    import time
+    from cassette import get_cassette
+    from structured_output import is_structured, structured_prompt
+
+    if config is None:
+        config = get_model_config()
+    cassette = get_cassette()
+    # JSON 模式与文本模式的结果分开录制
+    cassette_prompt = structured_prompt(prompt) if is_structured() else prompt
+    if cassette is not None and cassette.replaying:
+        return cassette.replay(cassette_prompt, config.model_name)
+    start = time.time()
+    result = _review_with_llm_result(prompt, config, max_tokens, votes)
+    if cassette is not None:
+        cassette.record(cassette_prompt, config.model_name, result, time.time() - start)
+    return result
+
+def _review_with_llm_result(prompt, config, max_tokens, votes):
+    from llm_client import complete, LLMResult
+    from structured_output import is_structured, complete_structured
+    import token_budget
+
+    messages = build_review_messages(prompt)
+    votes = votes or get_vote_count()
+    structured = is_structured()
+
+    def call_text(max_tokens):
+        if votes > 1:
+            return vote_complete(config, messages, votes, max_tokens)
+        return complete(config, messages, max_tokens=max_tokens, temperature=0.7)
+
+    def call(max_tokens):
+        if structured:
+            return complete_structured(config, prompt, max_tokens, votes, lambda: call_text(max_tokens))
+        return call_text(max_tokens)
+
+    if max_tokens is not None or not token_budget.is_adaptive_enabled():
+        return call(max_tokens or DEFAULT_MAX_TOKENS)
+
+    item_count = token_budget.count_checklist_items(prompt)
+    try:
+        prompt_tokens, max_tokens = token_budget.plan_max_tokens(messages, config.model_name, item_count)
+    except token_budget.PromptTooLarge as e:
+        return LLMResult(error=str(e), error_class='prompt_too_large', model=config.model_name)
+
+    result = call(max_tokens)
+    if result.ok:
+        # 续写会重复发送提示，只用单次调用的 usage 校准提示估算；投票时按单个样本的平均输出记录
+        # 预算降级时实际调用的是快速模型
+        usage = result.usage
+        if result.samples > 1:
+            usage = {'prompt_tokens': 0, 'completion_tokens': usage['completion_tokens'] // result.samples}
+        token_budget.get_token_history().record(
+            result.model or config.model_name, item_count,
+            token_budget.estimate_messages_tokens(messages) if result.continuations == 0 else 0,
+            usage)
+    return result
 
 def review_with_llm(prompt: str, config: ModelConfig = None) -> str:
     """
@@ -92,28 +251,12 @@ def review_with_llm(prompt: str, config: ModelConfig = None) -> str:
         config: 模型配置，如果为None则创建新的配置
     
     Returns:
-        评审结果
+        评审结果，调用失败时返回 "Error: ..." 文本
     """
-    if config is None:
-        config = get_model_config()
-    
     try:
-        response = config.client.chat.completions.create(
-            model=config.model_name,
-            messages=[
-                {
-                    "role": "system", 
-                    "content": "你是一个软件工程专家和适航工程师，专注于DO-178C A级软件标准的合规性评审。你的职责是确保软件需求满足最高安全完整性等级的要求。"
-                }, 
-                {
-                    "role": "user", 
-                    "content": prompt
-                }
-            ],
-            stream=False,
-            max_tokens=10000,
-            temperature=0.7,
-        )
-        return response.choices[0].message.content if response.choices else "无返回结果"
+        result = review_with_llm_result(prompt, config)
     except Exception as e:
         return f"Error: {str(e)}"
+    if not result.ok:
+        return f"Error: {result.error}"
+    return result.text if result.text else "无返回结果"
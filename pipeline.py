@@ -0,0 +1,217 @@
+"""
+分阶段评审流水线
+各阶段之间通过有界队列连接：下游处理不过来时上游阻塞（背压），
+网络调用阶段使用多线程并发，CPU 密集的解析/写入阶段提交到进程池执行。
+运行结束后可输出每个阶段的利用率统计。
+"""
+
+import time
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+# 队列结束标记
+_DONE = object()
+
+class Stage:
+    """
+    流水线阶段
+
+    Args:
+        name: 阶段名称（用于统计输出）
+        func: 处理函数，接收一个条目并返回处理后的条目；返回 None 表示丢弃该条目
+        workers: 该阶段的并发线程数
+        use_process: 为 True 时在进程池中执行 func（func 及条目必须可 pickle）
+        on_error: 可选的错误处理函数 on_error(条目, 异常)，在当前线程中调用，返回的条目继续送往下游
+            （例如记为评审失败的结果，保证每条输入都有输出）；未设置或返回 None 时丢弃该条目
+    """
+
+    def __init__(self, name, func, workers=1, use_process=False, on_error=None):
+        self.name = name
+        self.func = func
+        self.workers = max(1, int(workers))
+        self.use_process = use_process
+        self.on_error = on_error
+        self.processed = 0
+        self.errors = 0
+        self.busy_time = 0.0      # 执行 func 的累计时间
+        self.blocked_time = 0.0   # 因下游队列已满而等待的累计时间（背压）
+        self._lock = threading.Lock()
+
+    def record(self, busy, blocked, error=False):
+        with self._lock:
+            self.busy_time += busy
+            self.blocked_time += blocked
+            if error:
+                self.errors += 1
+            else:
+                self.processed += 1
+
+class StagedPipeline:
+    """
+    由若干 Stage 串联组成的流水线
+
+    用法：
+        pipeline = StagedPipeline([Stage('render', render), Stage('call', call, workers=4), ...])
+        results = pipeline.run(items, on_result=callback)
+        print(pipeline.format_report())
+    """
+
+    def __init__(self, stages, queue_size=4, process_workers=None):
+        self.stages = list(stages)
+        self.queue_size = queue_size
+        self.process_workers = process_workers
+        self.load_stage = Stage('load', None)
+        self.wall_time = 0.0
+
+    def _put(self, q, item):
+        """放入下游队列，返回阻塞等待的时间"""
+        start = time.perf_counter()
+        q.put(item)
+        return time.perf_counter() - start
+
+    def _run_loader(self, items, out_q, next_workers):
+        """load 阶段：逐条读取数据源"""
+        stage = self.load_stage
+        iterator = iter(items)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                break
+            except Exception as e:
+                stage.record(time.perf_counter() - start, 0.0, error=True)
+                print(f"❌ [load] 读取失败: {str(e)}")
+                break
+            busy = time.perf_counter() - start
+            stage.record(busy, self._put(out_q, item))
+        for _ in range(next_workers):
+            out_q.put(_DONE)
+
+    def _handle_error(self, stage, item, error):
+        """交给阶段的错误处理函数，返回继续送往下游的条目（None 表示丢弃）"""
+        if stage.on_error is None:
+            return None
+        try:
+            return stage.on_error(item, error)
+        except Exception as e:
+            print(f"❌ [{stage.name}] 错误处理失败，条目被丢弃: {str(e)}")
+            return None
+
+    def _run_worker(self, stage, in_q, out_q, executor, finish):
+        while True:
+            item = in_q.get()
+            if item is _DONE:
+                break
+            start = time.perf_counter()
+            try:
+                if stage.use_process:
+                    output = executor.submit(stage.func, item).result()
+                else:
+                    output = stage.func(item)
+            except Exception as e:
+                stage.record(time.perf_counter() - start, 0.0, error=True)
+                print(f"❌ [{stage.name}] 处理失败: {str(e)}")
+                output = self._handle_error(stage, item, e)
+                if output is not None:
+                    self._put(out_q, output)
+                continue
+            busy = time.perf_counter() - start
+            blocked = self._put(out_q, output) if output is not None else 0.0
+            stage.record(busy, blocked)
+        finish()
+
+    def run(self, items, on_result=None, collect=True):
+        """
+        运行流水线
+
+        Args:
+            items: 数据源（可迭代对象），其读取计入 load 阶段
+            on_result: 可选回调，每当最后一个阶段产出条目时在收集线程中调用
+            collect: 为 False 时不保留产出的条目（长时间流式运行时由 on_result 处理）
+
+        Returns:
+            最后一个阶段产出的条目列表（按完成顺序）；collect 为 False 时为空列表
+        """
+        start = time.perf_counter()
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in self.stages]
+        result_q = queue.Queue(maxsize=self.queue_size)
+        outputs = queues[1:] + [result_q]
+
+        executor = None
+        if any(stage.use_process for stage in self.stages):
+            executor = ProcessPoolExecutor(max_workers=self.process_workers)
+
+        threads = []
+        for i, stage in enumerate(self.stages):
+            next_workers = self.stages[i + 1].workers if i + 1 < len(self.stages) else 1
+            remaining = [stage.workers]
+            lock = threading.Lock()
+
+            # 最后一个退出的线程负责向下游发送结束标记
+            def finish(out_q=outputs[i], remaining=remaining, lock=lock, next_workers=next_workers):
+                with lock:
+                    remaining[0] -= 1
+                    last = remaining[0] == 0
+                if last:
+                    for _ in range(next_workers):
+                        out_q.put(_DONE)
+
+            for n in range(stage.workers):
+                thread = threading.Thread(
+                    target=self._run_worker,
+                    args=(stage, queues[i], outputs[i], executor, finish),
+                    name=f"{stage.name}-{n}", daemon=True)
+                thread.start()
+                threads.append(thread)
+
+        loader = threading.Thread(
+            target=self._run_loader, args=(items, queues[0], self.stages[0].workers),
+            name="load", daemon=True)
+        loader.start()
+        threads.append(loader)
+
+        results = []
+        try:
+            while True:
+                item = result_q.get()
+                if item is _DONE:
+                    break
+                if collect:
+                    results.append(item)
+                if on_result is not None:
+                    on_result(item)
+            for thread in threads:
+                thread.join()
+        finally:
+            if executor is not None:
+                executor.shutdown()
+            self.wall_time = time.perf_counter() - start
+        return results
+
+    def stage_stats(self):
+        """各阶段统计：处理数、错误数、忙碌时间、背压等待时间、利用率"""
+        stats = []
+        for stage in [self.load_stage] + self.stages:
+            capacity = self.wall_time * stage.workers
+            stats.append({
+                'stage': stage.name,
+                'workers': stage.workers,
+                'processed': stage.processed,
+                'errors': stage.errors,
+                'busy': stage.busy_time,
+                'blocked': stage.blocked_time,
+                'utilisation': stage.busy_time / capacity if capacity > 0 else 0.0,
+            })
+        return stats
+
+    def format_report(self):
+        """格式化阶段利用率报告"""
+        lines = [f"{'阶段':<10}{'并发':>6}{'处理数':>8}{'错误':>6}{'忙碌(秒)':>10}{'背压(秒)':>10}{'利用率':>8}"]
+        for s in self.stage_stats():
+            lines.append(
+                f"{s['stage']:<10}{s['workers']:>6}{s['processed']:>8}{s['errors']:>6}"
+                f"{s['busy']:>10.2f}{s['blocked']:>10.2f}{s['utilisation']*100:>7.1f}%"
+            )
+        return "\n".join(lines)
@@ -0,0 +1,207 @@
+"""
+性能剖析
+为评审流程中的各步骤（读取表格、构造提示、大模型调用、结果解析、保存、写日志）记录计时区间，
+输出可在 chrome://tracing 或 Perfetto 中查看的时间线 JSON，并可选生成 cProfile 统计文件。
+未启用时 span() 返回空上下文，不产生额外开销。
+"""
+
+import os
+import sys
+import json
+import time
+import threading
+from contextlib import contextmanager, nullcontext
+
+class Tracer:
+    """计时区间记录器（线程安全）"""
+
+    def __init__(self):
+        self.events = []
+        self.thread_names = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name, **args):
+        start = time.time_ns() // 1000
+        try:
+            yield
+        finally:
+            self.record(name, start, time.time_ns() // 1000 - start, args)
+
+    def record(self, name, start_us, duration_us, args=None):
+        thread = threading.current_thread()
+        event = {
+            'name': name, 'cat': 'review', 'ph': 'X',
+            'ts': start_us, 'dur': duration_us,
+            'pid': os.getpid(), 'tid': thread.ident,
+        }
+        if args:
+            event['args'] = args
+        with self._lock:
+            self.events.append(event)
+            self.thread_names[(event['pid'], thread.ident)] = thread.name
+
+    def merge(self, events, thread_names=None):
+        """合并其他进程中记录的区间"""
+        with self._lock:
+            self.events.extend(events)
+            for (pid, tid), name in (thread_names or {}).items():
+                self.thread_names[(pid, tid)] = name
+
+    def totals(self):
+        """各区间名称的 (次数, 累计秒, 最大秒)，按累计耗时降序"""
+        with self._lock:
+            events = list(self.events)
+        totals = {}
+        for event in events:
+            count, total, longest = totals.get(event['name'], (0, 0.0, 0.0))
+            seconds = event['dur'] / 1e6
+            totals[event['name']] = (count + 1, total + seconds, max(longest, seconds))
+        return sorted(totals.items(), key=lambda kv: kv[1][1], reverse=True)
+
+    def format_totals(self):
+        """格式化各步骤耗时，供最终统计输出"""
+        lines = []
+        for name, (count, total, longest) in self.totals():
+            lines.append(
+                f"   {name:<22} {count:>6} 次  累计 {total:>9.2f}秒  "
+                f"平均 {total / count:>7.3f}秒  最大 {longest:>7.3f}秒")
+        return "\n".join(lines) if lines else "   (无记录)"
+
+    def write_chrome_trace(self, path):
+        """写出 Chrome Trace Event 格式的时间线"""
+        with self._lock:
+            events = list(self.events)
+            names = dict(self.thread_names)
+        metadata = [
+            {'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid, 'args': {'name': name}}
+            for (pid, tid), name in names.items()
+        ]
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'traceEvents': metadata + events, 'displayTimeUnit': 'ms'}, f, ensure_ascii=False)
+        return path
+
+_tracer = None
+
+def get_tracer():
+    """当前启用的记录器，未启用剖析时返回 None"""
+    return _tracer
+
+def span(name, **args):
+    """记录一个计时区间：with span('llm_call'): ..."""
+    tracer = _tracer
+    return tracer.span(name, **args) if tracer is not None else nullcontext()
+
+class TracedStage:
+    """
+    包装在进程池中执行的流水线阶段函数
+
+    子进程中记录的区间附加在条目的 '_spans' 字段上带回主进程，由 merge_item_spans 合并。
+    """
+
+    def __init__(self, func):
+        self.func = func
+
+    def __call__(self, item):
+        global _tracer
+        # 前面的进程池阶段带来的区间继续随条目传递
+        events, thread_names = item.pop('_spans', ([], {})) if isinstance(item, dict) else ([], {})
+        previous, _tracer = _tracer, Tracer()
+        try:
+            output = self.func(item)
+        finally:
+            tracer, _tracer = _tracer, previous
+        if isinstance(output, dict):
+            thread_names.update(tracer.thread_names)
+            output['_spans'] = (events + tracer.events, thread_names)
+        return output
+
+def traced(func):
+    """启用剖析时包装进程池阶段函数，否则原样返回"""
+    return TracedStage(func) if _tracer is not None else func
+
+def merge_item_spans(item):
+    """把子进程带回的区间合并到当前记录器"""
+    spans = item.pop('_spans', None) if isinstance(item, dict) else None
+    if spans and _tracer is not None:
+        _tracer.merge(*spans)
+
+class CProfileSession:
+    """
+    cProfile 统计（覆盖主线程及之后启动的所有线程）
+
+    Python 3.12 起 cProfile 基于 sys.monitoring，单个 Profile 即覆盖所有线程，
+    线程内再次启用会失败，此时忽略即可。
+    """
+
+    def __init__(self):
+        self._profiles = []
+        self._lock = threading.Lock()
+
+    def _enable_new(self):
+        import cProfile
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            return
+        with self._lock:
+            self._profiles.append(profile)
+
+    def _thread_hook(self, frame, event, arg):
+        sys.setprofile(None)
+        self._enable_new()
+
+    def start(self):
+        self._enable_new()
+        threading.setprofile(self._thread_hook)
+
+    def stop(self, path):
+        import pstats
+        threading.setprofile(None)
+        with self._lock:
+            profiles = list(self._profiles)
+        profiles[0].disable()
+        stats = pstats.Stats(profiles[0])
+        for profile in profiles[1:]:
+            stats.add(profile)
+        stats.dump_stats(path)
+        return path
+
+def get_profile_dir():
+    """剖析输出目录（PROFILE_DIR 环境变量，默认与脚本同目录的 性能分析/）"""
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    return os.getenv('PROFILE_DIR') or os.path.join(script_dir, "性能分析")
+
+@contextmanager
+def profiling(mode, enabled=True, use_cprofile=False):
+    """
+    在上下文内启用剖析，结束后写出时间线（及 cProfile 统计）并打印文件路径
+
+    Args:
+        mode: 运行模式（single / batch），用于输出文件名
+        enabled: 为 False 时不做任何事
+        use_cprofile: 同时生成 cProfile 统计（可用 python -m pstats 或 snakeviz 查看）
+    """
+    global _tracer
+    if not enabled:
+        yield None
+        return
+
+    _tracer = Tracer()
+    session = None
+    if use_cprofile:
+        session = CProfileSession()
+        session.start()
+    try:
+        yield _tracer
+    finally:
+        tracer, _tracer = _tracer, None
+        profile_dir = get_profile_dir()
+        os.makedirs(profile_dir, exist_ok=True)
+        stamp = time.strftime('%Y%m%d-%H%M%S')
+        trace_path = tracer.write_chrome_trace(os.path.join(profile_dir, f"trace-{mode}-{stamp}.json"))
+        print(f"🔬 时间线已保存: {trace_path}（可在 chrome://tracing 或 https://ui.perfetto.dev 打开）")
+        if session is not None:
+            prof_path = session.stop(os.path.join(profile_dir, f"profile-{mode}-{stamp}.prof"))
+            print(f"🔬 cProfile 统计已保存: {prof_path}")
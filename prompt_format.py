@@ -0,0 +1,206 @@
+"""
+提示序列化格式
+- markdown：原有格式，检查单原文发送，需求逐字段输出 **字段** 标题（包括值为“无”的字段）
+- compact：紧凑格式，每个检查条目压缩为一行（编号|适用性|检查项|要点|依据），
+  去掉检查单的横幅与分隔线；需求只输出非空字段，字段名使用简短且固定的键
+
+格式按运行切换（PROMPT_FORMAT 环境变量或命令行 --prompt-format），评审输出格式与解析不受影响。
+"""
+
+import os
+import re
+from functools import lru_cache
+
+from model_config import load_env
+
+PROMPT_FORMATS = ('markdown', 'compact')
+
+# 需求字段 -> 紧凑格式中的键
+COMPACT_KEYS = {
+    '标识': '标识',
+    '标题': '标题',
+    '版本信息': '版本',
+    '需求类型': '类型',
+    '是否派生的需求': '派生',
+    '派生理由': '派生理由',
+    '接口原型': '原型',
+    '需求描述': '描述',
+    '测试建议': '测试',
+    '注释': '注释',
+    '作者': '作者',
+}
+
+# 单个需求评审发送的字段
+REQUIREMENT_FIELDS = ['标识', '标题', '版本信息', '需求类型', '是否派生的需求', '派生理由',
+                      '接口原型', '需求描述', '测试建议', '注释']
+# 接口需求集合中每条需求的字段（标识写在需求标题行）
+BLOCK_FIELDS = ['标题', '版本信息', '需求类型', '是否派生的需求', '派生理由',
+                '接口原型', '需求描述', '测试建议', '注释', '作者']
+
+# 占位值，紧凑格式中视为空字段
+EMPTY_VALUES = ('', '无')
+
+COMPACT_CHECKLIST_HEADER = "检查单（每行一个条目: 编号|适用性|检查项|要点|依据）"
+COMPACT_REQUIREMENT_NOTE = "（未列出的字段为空）"
+# 未生成接口事实表时 [FACTS] 的替换文本
+FACTS_DISABLED = "（未提供，请直接分析需求集合中的接口原型）"
+
+# 条目中的字段行，例如：- **检查项**: xxx
+_FIELD_PATTERN = re.compile(r'^-\s*\*\*(.+?)\*\*\s*[:：]\s*(.*)$')
+# 字段下的列表行，例如：  - xxx
+_LIST_PATTERN = re.compile(r'^\s+-\s*(.*)$')
+# 标准条目后的标题，例如：DO-178C [6.3.1a] 软件高层需求 -> DO-178C [6.3.1a]
+_REFERENCE_PATTERN = re.compile(r'^(.*?\[[^\]]*\])')
+
+def get_prompt_format():
+    """本次运行使用的提示格式（PROMPT_FORMAT，默认 markdown）"""
+    load_env()
+    prompt_format = os.getenv('PROMPT_FORMAT', 'markdown').lower()
+    if prompt_format not in PROMPT_FORMATS:
+        print(f"⚠️ 未知的 PROMPT_FORMAT={prompt_format}，使用 markdown")
+        return 'markdown'
+    return prompt_format
+
+def set_prompt_format(prompt_format):
+    """命令行 --prompt-format：覆盖本次运行的提示格式"""
+    os.environ['PROMPT_FORMAT'] = prompt_format
+
+def is_compact(prompt_format=None):
+    return (prompt_format or get_prompt_format()) == 'compact'
+
+def _item_fields(item_text):
+    """解析条目的字段：{字段名: 单行值或列表项}"""
+    fields, current = {}, None
+    for line in item_text.splitlines():
+        match = _FIELD_PATTERN.match(line.strip())
+        if match:
+            current = match.group(1)
+            fields[current] = [match.group(2).strip()] if match.group(2).strip() else []
+            continue
+        match = _LIST_PATTERN.match(line)
+        if match and current and match.group(1).strip():
+            fields[current].append(match.group(1).strip())
+    return fields
+
+def _compact_cell(values):
+    # 分隔符出现在内容中时替换为全角，避免破坏行结构
+    return '；'.join(values).replace('|', '｜')
+
+def compact_item(item):
+    """把 checklist.ChecklistItem 压缩为一行"""
+    fields = _item_fields(item.text)
+    references = [_REFERENCE_PATTERN.match(ref).group(1) if _REFERENCE_PATTERN.match(ref) else ref
+                  for ref in fields.get('对应标准条目', [])]
+    cells = [
+        item.item_id,
+        _compact_cell(fields.get('适用性', [])),
+        _compact_cell(fields.get('检查项', [])),
+        _compact_cell(fields.get('说明', [])),
+        _compact_cell(references),
+    ]
+    return '|'.join(cells)
+
+@lru_cache(maxsize=64)
+def compact_checklist(checklist_text):
+    """检查单文本（完整或子集）的紧凑形式"""
+    from checklist import Checklist
+
+    checklist = Checklist(checklist_text)
+    if not checklist.items:
+        return checklist_text
+    return "\n".join([COMPACT_CHECKLIST_HEADER] + [compact_item(item) for item in checklist.items])
+
+def _compact_value(value):
+    # 多行值的续行缩进，与下一个字段区分
+    return value.replace('\r\n', '\n').replace('\n', '\n  ')
+
+def format_fields(values, fields, prompt_format=None):
+    """
+    按格式输出需求字段
+
+    Args:
+        values: {字段名: 已格式化的值}（空值为“无”）
+        fields: 按顺序输出的字段
+    """
+    if is_compact(prompt_format):
+        return "".join(f"{COMPACT_KEYS.get(name, name)}: {_compact_value(values[name])}\n"
+                       for name in fields if values[name].strip() not in EMPTY_VALUES)
+    return "".join(f"**{name}**\n{values[name]}\n" for name in fields)
+
+def render_review_prompt(prompt_template, checklist_text, requirement_text, prompt_format=None, facts=None):
+    """
+    按格式填充提示模板（检查单文本为 checklist.txt 原文或其子集）
+
+    facts 为批量评审的接口事实表（interface_facts），填入模板中的 [FACTS]；
+    模板中没有 [FACTS] 时放在需求集合之前。
+    """
+    if is_compact(prompt_format):
+        checklist_text = compact_checklist(checklist_text)
+        requirement_text = COMPACT_REQUIREMENT_NOTE + "\n" + requirement_text.lstrip('\n')
+    if facts and "[FACTS]" not in prompt_template:
+        requirement_text = f"接口事实表:\n{facts}\n{requirement_text}"
+    return prompt_template.replace("[CHECKLIST]", checklist_text).replace("[REQUIREMENT]", requirement_text) \
+        .replace("[FACTS]", facts or FACTS_DISABLED)
+
+def measure_savings(prompt_template, checklist_text, render_requirements):
+    """
+    对比 markdown 与紧凑格式的提示 token 数（本地估算，未经 usage 校准）
+
+    Args:
+        render_requirements: 接收格式名、返回该格式下各个提示的需求文本（可迭代）
+
+    Returns:
+        {'prompts', 'markdown', 'compact', 'checklist_markdown', 'checklist_compact'}
+    """
+    from token_budget import estimate_tokens
+
+    totals, prompts = {}, 0
+    for prompt_format in PROMPT_FORMATS:
+        totals[prompt_format] = 0
+        prompts = 0
+        for requirement_text in render_requirements(prompt_format):
+            prompts += 1
+            totals[prompt_format] += estimate_tokens(
+                render_review_prompt(prompt_template, checklist_text, requirement_text, prompt_format))
+    return {
+        'prompts': prompts,
+        'markdown': totals['markdown'],
+        'compact': totals['compact'],
+        'checklist_markdown': estimate_tokens(checklist_text),
+        'checklist_compact': estimate_tokens(compact_checklist(checklist_text)),
+    }
+
+def format_savings(savings):
+    """格式化 token 节省报告"""
+    saved = savings['markdown'] - savings['compact']
+    ratio = saved / savings['markdown'] if savings['markdown'] else 0.0
+    return (f"🗜️ 紧凑提示: {savings['prompts']} 个提示约 {savings['markdown']} → {savings['compact']} token"
+            f"（节省 {saved}，{ratio:.1%}），检查单 {savings['checklist_markdown']} → "
+            f"{savings['checklist_compact']} token/次"
+            + (f"（抽样 {savings['prompts']}/{savings['sampled']} 个接口）" if savings.get('sampled') else ""))
+
+if __name__ == "__main__":
+    # 不调用大模型，估算示例数据在两种格式下的提示 token
+    from reviewer import build_requirement_text
+    from reviewer_batch import get_batch_paths, load_prompt_template, list_interface_files, measure_interfaces_savings
+    from input_cache import load_requirements
+
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    requirements_path = os.path.join(script_dir, "requirements.xlsx")
+    if os.path.exists(requirements_path):
+        prompt_template, checklist = load_prompt_template(
+            os.path.join(script_dir, "prompt.txt"), os.path.join(script_dir, "checklist.txt"))
+        rows = [row for _, row in load_requirements(requirements_path).iterrows()]
+        print("单个需求评审 (requirements.xlsx):")
+        print(format_savings(measure_savings(
+            prompt_template, checklist.text,
+            lambda prompt_format: (build_requirement_text(row, prompt_format) for row in rows))))
+
+    paths = get_batch_paths()
+    if os.path.isdir(paths['interfaces_dir']):
+        prompt_template, checklist = load_prompt_template(paths['prompt_file'], paths['checklist_file'])
+        interface_paths = [os.path.join(paths['interfaces_dir'], name)
+                           for name in list_interface_files(paths['interfaces_dir'])]
+        print("批量接口评审 (接口需求集合/):")
+        print(format_savings(measure_interfaces_savings(interface_paths, prompt_template, checklist, load_requirements,
+                                                         sample_size=None)))
@@ -0,0 +1,249 @@
+"""
+分优先级的请求限速
+同一端点的全部请求（包括同一台机器上的其他评审进程）共用一个令牌桶，状态保存在 SQLite 中；
+请求按优先级分为三个通道，按加权公平排队（WFQ）依次放行：
+- interactive：交互式评审（单条需求、嵌入式 API），权重最高，并始终保留若干额度，到达后几乎不用等待
+- normal：普通的 single 评审
+- bulk：batch / worker / watch 等批量评审，使用保留额度之外的全部余量
+
+    REVIEW_RPM=60                     每分钟最多发送的请求数（所有通道合计）
+    REVIEW_LANE=interactive           本进程的请求通道（也可用命令行 --lane），默认由入口决定
+    REVIEW_LANE_WEIGHTS=8,3,1         interactive、normal、bulk 三个通道的权重
+    REVIEW_LANE_RESERVE=1             为 interactive 通道保留的请求额度（其他通道取用后桶中至少还剩这么多）
+    RATE_LIMIT_DB=限速状态.db          共享限速状态的数据库（默认与脚本同目录）
+"""
+
+import os
+import time
+import sqlite3
+import threading
+import contextvars
+from contextlib import contextmanager
+
+from model_config import load_env
+
+LANES = ('interactive', 'normal', 'bulk')
+DEFAULT_WEIGHTS = (8, 3, 1)
+# 等待者两次轮询的最长间隔（秒）；超过 STALE_SECONDS 未轮询的等待者视为已退出
+POLL_SECONDS = 0.5
+STALE_SECONDS = 10.0
+
+_default_lane = 'normal'
+# 当前上下文的通道（嵌入式评审会话按调用设置，不改变本进程的默认通道）
+_context_lane = contextvars.ContextVar('review_lane', default=None)
+
+def check_lane(lane):
+    if lane not in LANES:
+        raise ValueError(f"不支持的请求通道: {lane}（可选 {', '.join(LANES)}）")
+    return lane
+
+def set_default_lane(lane):
+    """入口设置本进程的默认通道（REVIEW_LANE 环境变量优先）"""
+    global _default_lane
+    _default_lane = check_lane(lane)
+
+@contextmanager
+def use_lane(lane):
+    """
+    在当前上下文中使用指定通道（REVIEW_LANE 环境变量优先）
+
+    只作用于当前线程及经 contextvars.copy_context().run 提交到线程池的任务，不影响其他调用。
+    """
+    token = _context_lane.set(check_lane(lane))
+    try:
+        yield
+    finally:
+        _context_lane.reset(token)
+
+def set_lane(lane):
+    """命令行 --lane：设置本次运行的请求通道"""
+    os.environ['REVIEW_LANE'] = check_lane(lane)
+
+def get_lane():
+    """当前请求的通道：REVIEW_LANE 环境变量，其次为当前上下文的通道（use_lane），最后为本进程的默认通道"""
+    load_env()
+    lane = os.getenv('REVIEW_LANE', '').strip().lower()
+    return lane if lane in LANES else _context_lane.get() or _default_lane
+
+def get_lane_weights():
+    """各通道的权重（REVIEW_LANE_WEIGHTS 环境变量，逗号分隔，依次为 interactive、normal、bulk）"""
+    load_env()
+    text = os.getenv('REVIEW_LANE_WEIGHTS', '')
+    try:
+        weights = [float(part) for part in text.split(',')] if text.strip() else list(DEFAULT_WEIGHTS)
+    except ValueError:
+        weights = list(DEFAULT_WEIGHTS)
+    if len(weights) != len(LANES) or min(weights) <= 0:
+        weights = list(DEFAULT_WEIGHTS)
+    return dict(zip(LANES, weights))
+
+def get_lane_reserve():
+    """为 interactive 通道保留的请求额度（REVIEW_LANE_RESERVE 环境变量，默认 1）"""
+    load_env()
+    return max(0.0, float(os.getenv('REVIEW_LANE_RESERVE', '1') or 0))
+
+def get_rate_limit_db():
+    """共享限速状态的数据库路径"""
+    load_env()
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    return os.getenv('RATE_LIMIT_DB') or os.path.join(script_dir, "限速状态.db")
+
+class LaneRateLimiter:
+    """
+    分通道的共享令牌桶
+
+    令牌以 rpm / 60 每秒的速度补充，桶容量为 burst + reserve。等待的请求在数据库中登记，
+    每次轮询时在事务内补充令牌并选出下一个放行的通道：各通道的虚拟开始时间为
+    max(通道上次的虚拟完成时间, 系统虚拟时间)，取最小者（相同时优先级高者），
+    放行后该通道的虚拟完成时间增加 1 / 权重。通道内按登记顺序放行。
+    interactive 以外的通道只有在放行后桶中仍剩 reserve 个令牌时才能取用，
+    因此持续满载的批量评审不会占用为交互式评审保留的额度。
+    """
+
+    def __init__(self, rpm, key='default', db_path=None, weights=None, reserve=None, burst=1):
+        self.rpm = rpm
+        self.rate = rpm / 60.0
+        self.key = key
+        self.db_path = db_path or get_rate_limit_db()
+        self.weights = weights or get_lane_weights()
+        self.reserve = get_lane_reserve() if reserve is None else reserve
+        self.capacity = burst + self.reserve
+        self.waited = 0.0
+        # {通道: [放行次数, 等待合计, 最长等待]}，只统计本进程
+        self.stats = {}
+        self._lock = threading.Lock()
+        self._init_db()
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=60, isolation_level=None)
+
+    def _init_db(self):
+        conn = self._connect()
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS buckets (
+                    key TEXT PRIMARY KEY,
+                    tokens REAL NOT NULL,
+                    updated REAL NOT NULL,
+                    vtime REAL NOT NULL DEFAULT 0
+                );
+                CREATE TABLE IF NOT EXISTS lanes (
+                    key TEXT NOT NULL,
+                    lane TEXT NOT NULL,
+                    finish REAL NOT NULL DEFAULT 0,
+                    PRIMARY KEY (key, lane)
+                );
+                CREATE TABLE IF NOT EXISTS waiters (
+                    ticket INTEGER PRIMARY KEY AUTOINCREMENT,
+                    key TEXT NOT NULL,
+                    lane TEXT NOT NULL,
+                    pid INTEGER,
+                    seen_at REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_waiters_key ON waiters(key, lane, ticket);
+            """)
+        finally:
+            conn.close()
+
+    def _need(self, lane):
+        return 1.0 if lane == 'interactive' else 1.0 + self.reserve
+
+    def _try_acquire(self, conn, lane, ticket):
+        """
+        一次轮询：补充令牌，轮到该等待者且额度足够时放行
+
+        Returns:
+            (放行时为 None 否则为票号, 建议的等待秒数)
+        """
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT tokens, updated, vtime FROM buckets WHERE key = ?", (self.key,)).fetchone()
+            if row is None:
+                tokens, vtime = self.capacity, 0.0
+                conn.execute("INSERT INTO buckets(key, tokens, updated, vtime) VALUES (?, ?, ?, 0)",
+                             (self.key, tokens, now))
+            else:
+                tokens = min(self.capacity, row[0] + max(0.0, now - row[1]) * self.rate)
+                vtime = row[2]
+            if ticket is None:
+                ticket = conn.execute("INSERT INTO waiters(key, lane, pid, seen_at) VALUES (?, ?, ?, ?)",
+                                      (self.key, lane, os.getpid(), now)).lastrowid
+            else:
+                conn.execute("UPDATE waiters SET seen_at = ? WHERE ticket = ?", (now, ticket))
+            conn.execute("DELETE FROM waiters WHERE key = ? AND seen_at < ?", (self.key, now - STALE_SECONDS))
+
+            # 有等待者的通道中虚拟开始时间最小者排在最前，再按通道内的登记顺序
+            heads = conn.execute("SELECT lane, MIN(ticket) FROM waiters WHERE key = ? GROUP BY lane",
+                                 (self.key,)).fetchall()
+            finishes = dict(conn.execute("SELECT lane, finish FROM lanes WHERE key = ?", (self.key,)).fetchall())
+            head_lane, head_ticket = min(
+                heads, key=lambda head: (max(finishes.get(head[0], 0.0), vtime), LANES.index(head[0])))
+            need = self._need(head_lane)
+            granted = head_ticket == ticket and tokens >= need
+            if granted:
+                start = max(finishes.get(lane, 0.0), vtime)
+                tokens -= 1
+                conn.execute("UPDATE buckets SET vtime = ? WHERE key = ?", (start, self.key))
+                conn.execute("INSERT INTO lanes(key, lane, finish) VALUES (?, ?, ?) "
+                             "ON CONFLICT(key, lane) DO UPDATE SET finish = excluded.finish",
+                             (self.key, lane, start + 1.0 / self.weights[lane]))
+                conn.execute("DELETE FROM waiters WHERE ticket = ?", (ticket,))
+            conn.execute("UPDATE buckets SET tokens = ?, updated = ? WHERE key = ?", (tokens, now, self.key))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        if granted:
+            return None, 0.0
+        # 轮到自己时按缺口等待，否则按最前通道的缺口等待（期间可能有更高优先级的请求到达，最多等待一个轮询间隔）
+        return ticket, min(POLL_SECONDS, max(0.01, (need - tokens) / self.rate))
+
+    def acquire(self, lane=None):
+        """按通道取得一个请求额度，返回等待的秒数"""
+        lane = lane or get_lane()
+        started = time.monotonic()
+        conn = self._connect()
+        ticket = None
+        try:
+            while True:
+                ticket, wait = self._try_acquire(conn, lane, ticket)
+                if ticket is None:
+                    break
+                time.sleep(wait)
+        except BaseException:
+            if ticket is not None:
+                conn.execute("DELETE FROM waiters WHERE ticket = ?", (ticket,))
+            raise
+        finally:
+            conn.close()
+        waited = time.monotonic() - started
+        with self._lock:
+            self.waited += waited
+            stats = self.stats.setdefault(lane, [0, 0.0, 0.0])
+            stats[0] += 1
+            stats[1] += waited
+            stats[2] = max(stats[2], waited)
+        return waited
+
+    def format_report(self):
+        with self._lock:
+            lanes = "，".join(f"{lane} {count} 次（平均等待 {total / count:.1f} 秒，最长 {longest:.1f} 秒）"
+                              for lane, (count, total, longest) in sorted(
+                                  self.stats.items(), key=lambda item: LANES.index(item[0])))
+        return f"限速 {self.rpm:g} 次/分钟: {lanes or '未发送请求'}"
+
+if __name__ == "__main__":
+    # 查看共享限速状态中正在等待的请求
+    db = get_rate_limit_db()
+    if not os.path.exists(db):
+        print(f"📭 限速状态库不存在: {db}")
+    else:
+        conn = sqlite3.connect(db)
+        for key, tokens, updated in conn.execute("SELECT key, tokens, updated FROM buckets"):
+            print(f"🚦 {key}: 剩余额度 {tokens:.2f}（{time.time() - updated:.0f} 秒前更新）")
+            for lane, count in conn.execute("SELECT lane, COUNT(*) FROM waiters WHERE key = ? AND seen_at > ? "
+                                            "GROUP BY lane", (key, time.time() - STALE_SECONDS)):
+                print(f"   {lane}: {count} 个请求等待中")
+        conn.close()
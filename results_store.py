@@ -0,0 +1,224 @@
+"""
+评审结果库
+把每次运行的评审结果写入带索引的 SQLite 数据库，支持跨运行的汇总查询，
+例如“上季度哪些 CHKI 条目失败最多”，无需再逐个打开历史工作簿。
+"""
+
+import os
+import time
+import sqlite3
+
+from review_parser import VERDICTS, parse_item_verdicts
+
+# 同一需求对照多份检查单时每份各有一行结果，需求数量只按主检查单的行计
+REQUIREMENT_COUNT_SQL = "SUM(CASE WHEN {prefix}checklist = '' THEN {prefix}requirement_count ELSE 0 END)"
+
+def get_default_store_path():
+    """默认结果库位置（RESULTS_DB 环境变量，默认与脚本同目录）"""
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    return os.getenv('RESULTS_DB') or os.path.join(script_dir, "评审结果库.db")
+
+def new_run_id():
+    """生成运行标识：时间戳-进程号"""
+    return f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}"
+
+class ResultsStore:
+    """评审结果库"""
+
+    def __init__(self, db_path=None, check_same_thread=True):
+        self.db_path = db_path or get_default_store_path()
+        # check_same_thread=False 时由调用方保证同一时刻只有一个线程使用连接
+        self.conn = sqlite3.connect(self.db_path, timeout=60, check_same_thread=check_same_thread)
+        self.conn.execute("PRAGMA foreign_keys = ON")
+        self._init_db()
+
+    def _init_db(self):
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS runs (
+                run_id TEXT PRIMARY KEY,
+                mode TEXT NOT NULL,
+                started_at TEXT NOT NULL,
+                finished_at TEXT,
+                provider TEXT,
+                model TEXT,
+                source TEXT
+            );
+            CREATE TABLE IF NOT EXISTS results (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                run_id TEXT NOT NULL REFERENCES runs(run_id),
+                interface TEXT NOT NULL DEFAULT '',
+                req_id TEXT NOT NULL DEFAULT '',
+                author TEXT,
+                requirement_count INTEGER,
+                fail INTEGER, uncertain INTEGER, not_applicable INTEGER,
+                pass INTEGER, extra_issues INTEGER,
+                review_seconds REAL,
+                review_text TEXT,
+                tier TEXT,
+                checklist TEXT NOT NULL DEFAULT ''
+            );
+            CREATE TABLE IF NOT EXISTS items (
+                run_id TEXT NOT NULL REFERENCES runs(run_id),
+                interface TEXT NOT NULL DEFAULT '',
+                req_id TEXT NOT NULL DEFAULT '',
+                item_id TEXT NOT NULL,
+                verdict TEXT NOT NULL,
+                reason TEXT,
+                checklist TEXT NOT NULL DEFAULT ''
+            );
+            CREATE INDEX IF NOT EXISTS idx_runs_started ON runs(started_at);
+            CREATE INDEX IF NOT EXISTS idx_results_run ON results(run_id);
+            CREATE INDEX IF NOT EXISTS idx_results_req ON results(req_id);
+            CREATE INDEX IF NOT EXISTS idx_results_interface ON results(interface);
+            CREATE INDEX IF NOT EXISTS idx_items_run ON items(run_id);
+            -- 覆盖索引：按检查条目汇总时只扫描索引
+            CREATE INDEX IF NOT EXISTS idx_items_item_run ON items(item_id, verdict, run_id);
+            CREATE INDEX IF NOT EXISTS idx_items_req ON items(req_id);
+            CREATE INDEX IF NOT EXISTS idx_items_interface ON items(interface);
+        """)
+        self._migrate()
+        self.conn.commit()
+
+    def _migrate(self):
+        """为旧版本创建的结果库补充新增的列"""
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(results)")}
+        if 'tier' not in columns:
+            self.conn.execute("ALTER TABLE results ADD COLUMN tier TEXT")
+        for table in ('results', 'items'):
+            columns = {row[1] for row in self.conn.execute(f"PRAGMA table_info({table})")}
+            if 'checklist' not in columns:
+                self.conn.execute(f"ALTER TABLE {table} ADD COLUMN checklist TEXT NOT NULL DEFAULT ''")
+
+    def close(self):
+        self.conn.close()
+
+    def start_run(self, mode, config=None, source=None, run_id=None):
+        """登记一次运行，返回运行标识"""
+        run_id = run_id or new_run_id()
+        self.conn.execute(
+            "INSERT OR IGNORE INTO runs(run_id, mode, started_at, provider, model, source) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (run_id, mode, time.strftime('%Y-%m-%d %H:%M:%S'),
+             config.get_provider() if config else None,
+             config.get_model_name() if config else None,
+             source))
+        self.conn.commit()
+        return run_id
+
+    def finish_run(self, run_id):
+        self.conn.execute(
+            "UPDATE runs SET finished_at = ? WHERE run_id = ?",
+            (time.strftime('%Y-%m-%d %H:%M:%S'), run_id))
+        self.conn.commit()
+
+    def add_result(self, run_id, result, interface='', review_text=None, review_seconds=None, checklist=''):
+        """
+        写入一条评审结果及其逐条检查项结论
+
+        Args:
+            result: 评审结果记录（单需求评审的结果行或批量评审的汇总行）
+            interface: 接口名称，单需求评审为空
+            review_text: 评审文本，默认取 result['评审结果']
+            checklist: 附加检查单名称，主检查单为空
+        """
+        review_text = result.get('评审结果', '') if review_text is None else review_text
+        req_id = result.get('标识', '') or ''
+        self.conn.execute(
+            "INSERT INTO results(run_id, interface, req_id, author, requirement_count, fail, uncertain, "
+            "not_applicable, pass, extra_issues, review_seconds, review_text, tier, checklist) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (run_id, interface or '', req_id, result.get('作者'), result.get('需求数量', 1),
+             result.get('失败', 0), result.get('不确定', 0), result.get('不适用', 0),
+             result.get('通过', 0), result.get('额外问题', 0),
+             review_seconds if review_seconds is not None else result.get('评审耗时(秒)'),
+             review_text, result.get('评审层级'), checklist or ''))
+        self.conn.executemany(
+            "INSERT INTO items(run_id, interface, req_id, item_id, verdict, reason, checklist) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [(run_id, interface or '', req_id, item_id, verdict, reason, checklist or '')
+             for item_id, verdict, reason in parse_item_verdicts(review_text)])
+        self.conn.commit()
+
+    def _run_filter(self, since=None, until=None, run_id=None):
+        """按运行时间/运行标识过滤的 SQL 片段"""
+        clauses, params = [], []
+        if since:
+            clauses.append("started_at >= ?")
+            params.append(since)
+        if until:
+            clauses.append("started_at < ?")
+            params.append(until)
+        if run_id:
+            clauses.append("run_id = ?")
+            params.append(run_id)
+        if not clauses:
+            return "", []
+        return f"run_id IN (SELECT run_id FROM runs WHERE {' AND '.join(clauses)})", params
+
+    def query(self, by='item', since=None, until=None, run_id=None, interface=None,
+              verdict='失败', top=None):
+        """
+        汇总查询
+
+        Args:
+            by: 汇总维度，'item'（检查条目）/ 'interface'（接口）/ 'requirement'（需求标识）/ 'run'（运行）
+            since, until: 运行开始时间范围（'YYYY-MM-DD' 或 'YYYY-MM-DD HH:MM:SS'）
+            verdict: 按检查条目汇总时的排序结论
+            top: 只返回前 N 行
+
+        Returns:
+            (列名列表, 行列表)
+        """
+        where, params = self._run_filter(since, until, run_id)
+        if interface:
+            where = f"{where} AND interface = ?" if where else "interface = ?"
+            params.append(interface)
+        where_sql = f"WHERE {where}" if where else ""
+        limit_sql = f"LIMIT {int(top)}" if top else ""
+
+        if by == 'item':
+            order = verdict if verdict in VERDICTS else '失败'
+            verdict_cols = ", ".join(f"SUM(verdict = '{v}') AS {v}" for v in VERDICTS)
+            # 附加检查单的条目编号可能与主检查单重复，显示为“检查单名称/条目ID”
+            sql = (f"SELECT CASE WHEN checklist = '' THEN item_id ELSE checklist || '/' || item_id END AS 检查条目, "
+                   f"{verdict_cols}, COUNT(*) AS 评审次数, COUNT(DISTINCT run_id) AS 运行次数, "
+                   f"ROUND(100.0 * SUM(verdict = '{order}') / COUNT(*), 1) AS '{order}率(%)' "
+                   f"FROM items {where_sql} GROUP BY checklist, item_id ORDER BY {order} DESC, 检查条目 {limit_sql}")
+        elif by in ('interface', 'requirement'):
+            key = 'interface' if by == 'interface' else 'req_id'
+            label = '接口名称' if by == 'interface' else '标识'
+            # 单需求评审没有接口名称，批量评审的结果没有需求标识
+            empty_label = '(单需求评审)' if by == 'interface' else '(接口整体)'
+            sql = (f"SELECT COALESCE(NULLIF({key}, ''), '{empty_label}') AS {label}, COUNT(DISTINCT run_id) AS 运行次数, "
+                   f"{REQUIREMENT_COUNT_SQL.format(prefix='')} AS 需求数量, SUM(fail) AS 失败, SUM(uncertain) AS 不确定, "
+                   f"SUM(not_applicable) AS 不适用, SUM(pass) AS 通过, SUM(extra_issues) AS 额外问题, "
+                   f"ROUND(AVG(review_seconds), 2) AS '平均评审耗时(秒)' "
+                   f"FROM results {where_sql} GROUP BY {key} ORDER BY 失败 DESC, {key} {limit_sql}")
+        elif by == 'run':
+            sql = (f"SELECT r.run_id AS 运行标识, r.mode AS 模式, r.started_at AS 开始时间, r.model AS 模型, "
+                   f"COUNT(res.id) AS 结果数, {REQUIREMENT_COUNT_SQL.format(prefix='res.')} AS 需求数量, SUM(res.fail) AS 失败, "
+                   f"SUM(res.uncertain) AS 不确定, SUM(res.not_applicable) AS 不适用, SUM(res.pass) AS 通过, "
+                   f"SUM(res.extra_issues) AS 额外问题 "
+                   f"FROM runs r LEFT JOIN (SELECT * FROM results {where_sql}) res ON res.run_id = r.run_id "
+                   f"GROUP BY r.run_id HAVING COUNT(res.id) > 0 ORDER BY r.started_at DESC {limit_sql}")
+        else:
+            raise ValueError(f"不支持的汇总维度: {by}")
+
+        cursor = self.conn.execute(sql, params)
+        columns = [d[0] for d in cursor.description]
+        return columns, cursor.fetchall()
+
+def format_table(columns, rows):
+    """把查询结果格式化为对齐的文本表格"""
+    def width(text):
+        # 中文字符按两个字符宽度计算
+        return sum(2 if ord(ch) > 0x2E80 else 1 for ch in text)
+
+    cells = [[str(c) for c in columns]] + [["" if v is None else str(v) for v in row] for row in rows]
+    widths = [max(width(row[i]) for row in cells) for i in range(len(columns))]
+    lines = []
+    for n, row in enumerate(cells):
+        lines.append("  ".join(value + " " * (widths[i] - width(value)) for i, value in enumerate(row)))
+        if n == 0:
+            lines.append("  ".join("-" * w for w in widths))
+    return "\n".join(lines)
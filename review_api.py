@@ -0,0 +1,485 @@
+"""
+评审库接口
+供其他服务在进程内评审需求，不经由 requirements.xlsx 等中间文件：
+
+    from review_api import ReviewSession, JsonlSink
+
+    with ReviewSession(concurrency=4, cache=True, sinks=[JsonlSink('评审结果.jsonl')]) as session:
+        for result in session.review(requirements):    # dict / DataFrame，或二者组成的可迭代对象
+            print(result.index, result.config_id, result.counts)
+
+        async for result in session.review_async(requirements):
+            ...
+
+结果按完成顺序产出（result.index 为需求在输入中的位置）。模型配置、限速、熔断、请求对冲与预算控制
+与命令行评审相同（请求默认走限速的 interactive 通道）；提示模板与检查单默认使用脚本目录下的 prompt.txt / checklist.txt。
+"""
+
+import os
+import json
+import time
+import queue
+import hashlib
+import threading
+from collections.abc import Mapping
+
+from cascade import is_failed_review, TIER_REASONER
+
+# 结果队列结束标记
+_DONE = object()
+
+class ReviewResult:
+    """
+    一条需求的评审结果
+
+    Attributes:
+        index: 需求在输入中的位置（从 0 开始）
+        config_id: 需求标识
+        author: 作者
+        requirement: 输入的需求记录（dict）
+        review_text: 评审文本（已去除思考过程）；调用失败时为 "Error: ..." 文本
+        tier: 评审层级（reasoner / fast / fast+reasoner / mixed）
+        escalated: 级联评审中由推理模型复核的条目ID列表
+        seconds: 评审耗时（秒）
+        cached: 是否来自评审缓存
+    """
+
+    def __init__(self, index, requirement, review_text, tier=TIER_REASONER, escalated=None,
+                 seconds=0.0, cached=False):
+        from reviewer import safe_get_value
+
+        self.index = index
+        self.requirement = requirement
+        self.config_id = safe_get_value(requirement, '标识')
+        self.author = safe_get_value(requirement, '作者')
+        self.review_text = review_text
+        self.tier = tier
+        self.escalated = list(escalated or [])
+        self.seconds = seconds
+        self.cached = cached
+
+    @property
+    def ok(self):
+        return not is_failed_review(self.review_text)
+
+    @property
+    def error(self):
+        return None if self.ok else self.review_text
+
+    @property
+    def counts(self):
+        """{'失败', '不确定', '不适用', '通过', '额外问题'} 出现次数（与评审结果工作簿的统计一致）"""
+        from reviewer import count_verdicts
+        return count_verdicts(self.review_text)
+
+    @property
+    def verdicts(self):
+        """[(条目ID, 结论, 理由), ...]"""
+        from review_parser import parse_item_verdicts
+        return parse_item_verdicts(self.review_text)
+
+    @property
+    def agreement(self):
+        """投票评审的一致度（0~1），未投票时为 None"""
+        from review_parser import parse_agreement
+        vote = parse_agreement(self.review_text)
+        return vote[0] if vote else None
+
+    @property
+    def extra_issues(self):
+        from review_parser import extract_extra_issues
+        return extract_extra_issues(self.review_text)
+
+    def to_row(self):
+        """评审结果工作簿的一行（列见 reviewer.RESULT_COLUMNS）"""
+        return {'标识': self.config_id, '作者': self.author, **self.counts,
+                '评审层级': self.tier, '评审结果': self.review_text}
+
+    def to_dict(self):
+        return {
+            'index': self.index, 'config_id': self.config_id, 'author': self.author, 'ok': self.ok,
+            'tier': self.tier, 'escalated': self.escalated, 'seconds': self.seconds, 'cached': self.cached,
+            'counts': self.counts, 'agreement': self.agreement,
+            'verdicts': [{'item_id': item_id, 'verdict': verdict, 'reason': reason}
+                         for item_id, verdict, reason in self.verdicts],
+            'review_text': self.review_text,
+        }
+
+    def __repr__(self):
+        state = "ok" if self.ok else "error"
+        return f"ReviewResult(index={self.index}, config_id={self.config_id!r}, {state}, tier={self.tier!r})"
+
+def iter_requirements(requirements):
+    """展开需求来源：dict、DataFrame，或由二者（及 pandas.Series）组成的可迭代对象"""
+    import pandas as pd
+
+    if isinstance(requirements, (pd.DataFrame, Mapping)):
+        requirements = [requirements]
+    for entry in requirements:
+        if isinstance(entry, pd.DataFrame):
+            yield from entry.to_dict('records')
+        elif isinstance(entry, pd.Series):
+            yield entry.to_dict()
+        elif isinstance(entry, Mapping):
+            yield dict(entry)
+        else:
+            raise TypeError(f"不支持的需求类型: {type(entry).__name__}（应为 dict 或 DataFrame）")
+
+def get_default_cache_dir():
+    """默认评审缓存目录（REVIEW_CACHE_DIR 环境变量，默认与脚本同目录的 评审缓存/）"""
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    return os.getenv('REVIEW_CACHE_DIR') or os.path.join(script_dir, "评审缓存")
+
+class ReviewCache:
+    """
+    评审结果缓存
+
+    以 模型 + 评审方式 + 完整提示 的哈希为键存放评审文本（JSON 文件，先写临时文件再原子替换），
+    相同需求在相同配置下不重复调用大模型；失败的评审不缓存。
+    """
+
+    def __init__(self, cache_dir=None):
+        self.cache_dir = cache_dir or get_default_cache_dir()
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(*parts):
+        return hashlib.sha256(json.dumps(parts, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], key[2:] + '.json')
+
+    def get(self, key):
+        try:
+            with open(self._path(key), 'r', encoding='utf-8') as f:
+                record = json.load(f)
+        except (OSError, ValueError):
+            record = None
+        with self._lock:
+            if record is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return record
+
+    def put(self, key, record):
+        path = self._path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(record, f, ensure_ascii=False)
+            os.replace(temp_path, path)
+        except OSError as e:
+            print(f"⚠️ 写入评审缓存失败: {str(e)}")
+
+    def format_report(self):
+        return f"评审缓存: 命中 {self.hits} 条，调用模型 {self.misses} 条 ({self.cache_dir})"
+
+class JsonlSink:
+    """把评审结果逐条追加到 JSON Lines 文件"""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'a', encoding='utf-8')
+
+    def write(self, result):
+        self._file.write(json.dumps(result.to_dict(), ensure_ascii=False, default=str) + "\n")
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+class XlsxSink:
+    """把评审结果流式写入工作簿（列与 评审结果-cot.xlsx 相同，关闭时落盘）"""
+
+    def __init__(self, path):
+        from reviewer import RESULT_COLUMNS
+        from xlsx_stream import StreamingXlsxWriter
+
+        self.path = path
+        self._writer = StreamingXlsxWriter(path, RESULT_COLUMNS)
+
+    def write(self, result):
+        self._writer.write_row(result.to_row())
+
+    def close(self):
+        self._writer.close()
+
+    @property
+    def paths(self):
+        return self._writer.paths
+
+class ResultsStoreSink:
+    """
+    把评审结果写入评审结果库（登记为 mode='api' 的一次运行，可用 main.py report 查询）
+
+    结果在收集线程中写入、在调用方线程中关闭，连接不限定线程（两者不会同时使用连接）。
+    """
+
+    def __init__(self, db_path=None, source=None):
+        from results_store import ResultsStore
+
+        self.store = ResultsStore(db_path, check_same_thread=False)
+        self.source = source
+        self.run_id = None
+
+    def write(self, result):
+        if self.run_id is None:
+            from reviewer import get_reviewer_config
+            self.run_id = self.store.start_run('api', get_reviewer_config(), source=self.source)
+        self.store.add_result(self.run_id, result.to_row(), review_text=result.review_text,
+                              review_seconds=result.seconds)
+
+    def close(self):
+        if self.run_id is not None:
+            self.store.finish_run(self.run_id)
+        self.store.close()
+
+class _CallableSink:
+    def __init__(self, func):
+        self.write = func
+
+def _as_sink(sink):
+    if hasattr(sink, 'write'):
+        return sink
+    if callable(sink):
+        return _CallableSink(sink)
+    raise TypeError(f"sink 应为可调用对象或具有 write(result) 方法: {sink!r}")
+
+def _iter_async(requirements, loop):
+    """在工作线程中逐个取出异步可迭代对象的元素"""
+    import asyncio
+
+    iterator = requirements.__aiter__()
+    while True:
+        try:
+            yield asyncio.run_coroutine_threadsafe(iterator.__anext__(), loop).result()
+        except StopAsyncIteration:
+            return
+
+class ReviewSession:
+    """
+    进程内评审会话
+
+    Args:
+        concurrency: 并发评审的需求数，默认读取 REVIEW_CONCURRENCY
+        cascade: 是否启用两级模型级联评审，默认读取 REVIEW_CASCADE
+        fanout: 每条需求的检查条目分组数，默认读取 REVIEW_FANOUT
+        cache: True 使用默认缓存目录，字符串为缓存目录，也可传入 ReviewCache；None/False 不缓存
+        sinks: 结果输出列表，元素为可调用对象或具有 write(result)（及可选 close()）的对象，
+            如 JsonlSink / XlsxSink / ResultsStoreSink；每条结果完成时在收集线程中依次写入，
+            会话关闭（close() 或退出 with 块）时关闭
+        prompt_template: 提示模板文本，默认读取 prompt.txt
+        checklist: 检查单（checklist.Checklist、文本或文件路径），默认读取 checklist.txt
+        prompt_format: 提示格式（markdown / compact），默认读取 PROMPT_FORMAT
+        lane: 本会话请求的限速通道（interactive / normal / bulk），默认 interactive，REVIEW_LANE 环境变量优先；
+            设置 REVIEW_RPM 后交互式评审优先于同一端点上的批量评审发送。只作用于本会话的调用，
+            同一进程中的其他评审仍使用各自的通道
+    """
+
+    def __init__(self, concurrency=None, cascade=None, fanout=None, cache=None, sinks=None,
+                 prompt_template=None, checklist=None, prompt_format=None, lane='interactive'):
+        from reviewer import get_concurrency, get_fanout, is_cascade_enabled
+        from checklist import Checklist
+        from prompt_format import get_prompt_format
+        from rate_lanes import check_lane
+
+        self.lane = check_lane(lane)
+
+        script_dir = os.path.dirname(os.path.abspath(__file__))
+        if prompt_template is None:
+            with open(os.path.join(script_dir, "prompt.txt"), 'r', encoding='utf-8') as f:
+                prompt_template = f.read()
+        if checklist is None:
+            checklist = os.path.join(script_dir, "checklist.txt")
+        if isinstance(checklist, str):
+            checklist = Checklist.from_file(checklist) if os.path.isfile(checklist) else Checklist(checklist)
+
+        self.prompt_template = prompt_template
+        self.checklist = checklist
+        self.prompt_format = prompt_format or get_prompt_format()
+        self.concurrency = concurrency or get_concurrency()
+        self.cascade = is_cascade_enabled() if cascade is None else cascade
+        self.fanout = min(fanout or get_fanout(), max(1, len(checklist.items)))
+        if cache is True or isinstance(cache, str):
+            cache = ReviewCache(cache if isinstance(cache, str) else None)
+        self.cache = cache or None
+        self.sinks = [_as_sink(sink) for sink in (sinks or [])]
+        self.pipeline = None
+
+    def render_prompt(self, requirement_text, checklist_text):
+        from prompt_format import render_review_prompt
+        return render_review_prompt(self.prompt_template, checklist_text, requirement_text, self.prompt_format)
+
+    def _cache_key(self, requirement_text):
+        from reviewer import get_reviewer_config, get_fast_config
+        from model_config import get_vote_count
+        from structured_output import is_structured
+
+        models = [get_reviewer_config().model_name] + ([get_fast_config().model_name] if self.cascade else [])
+        # 投票评审、JSON 输出的结果与默认设置的结果分开缓存（默认设置的键保持不变）
+        votes = get_vote_count()
+        if votes > 1:
+            models.append(f"votes={votes}")
+        if is_structured():
+            models.append("output=json")
+        return ReviewCache.make_key(models, self.cascade, self.fanout,
+                                    self.render_prompt(requirement_text, self.checklist.text))
+
+    def review_one(self, requirement, index=0):
+        """评审一条需求（同步，调用异常时返回失败结果）"""
+        from reviewer import build_requirement_text, review_requirement
+        from rate_lanes import use_lane
+
+        start = time.time()
+        try:
+            requirement_text = build_requirement_text(requirement, self.prompt_format)
+            key = self._cache_key(requirement_text) if self.cache is not None else None
+            record = self.cache.get(key) if key else None
+            if record is not None:
+                return ReviewResult(index, requirement, record['review_text'], record['tier'],
+                                    record['escalated'], round(time.time() - start, 2), cached=True)
+            with use_lane(self.lane):
+                review_text, tier, escalated = review_requirement(
+                    requirement_text, self.render_prompt, self.checklist, self.cascade, self.fanout)
+            if key and not is_failed_review(review_text):
+                self.cache.put(key, {'review_text': review_text, 'tier': tier, 'escalated': escalated})
+        except Exception as e:
+            review_text, tier, escalated = f"Error: {str(e)}", TIER_REASONER, []
+        return ReviewResult(index, requirement, review_text, tier, escalated, round(time.time() - start, 2))
+
+    def _write_sinks(self, result):
+        for sink in self.sinks:
+            try:
+                sink.write(result)
+            except Exception as e:
+                print(f"⚠️ 写入结果输出失败 ({type(sink).__name__}): {str(e)}")
+
+    def close(self):
+        """关闭 sinks（XlsxSink 在此时落盘）"""
+        for sink in self.sinks:
+            close = getattr(sink, 'close', None)
+            if close is not None:
+                try:
+                    close()
+                except Exception as e:
+                    print(f"⚠️ 关闭结果输出失败 ({type(sink).__name__}): {str(e)}")
+
+    def review(self, requirements):
+        """
+        评审需求，按完成顺序逐条产出 ReviewResult（同步生成器）
+
+        提前结束迭代时不再开始新的评审，已在评审中的需求完成后仍写入 sinks；运行预算用尽时停止送入。
+        """
+        from pipeline import Stage, StagedPipeline
+        from budget import get_budget_governor
+        from reviewer import get_reviewer_config, get_fast_config
+
+        # 在启动工作线程前初始化模型配置，避免并发初始化
+        get_reviewer_config()
+        if self.cascade:
+            get_fast_config()
+        governor = get_budget_governor()
+        results = queue.Queue(maxsize=max(2, self.concurrency * 2))
+        stop = threading.Event()
+        errors = []
+
+        def load():
+            try:
+                for index, requirement in enumerate(iter_requirements(requirements)):
+                    if stop.is_set() or governor.should_stop():
+                        return
+                    yield {'index': index, 'requirement': requirement}
+            except Exception as e:
+                errors.append(e)
+
+        # 消费方已退出时跳过队列中尚未开始评审的需求
+        def call(item):
+            if stop.is_set():
+                return None
+            return self.review_one(item['requirement'], item['index'])
+
+        # 消费方处理不过来时阻塞收集线程（背压），消费方已退出时丢弃
+        def put(result):
+            while not stop.is_set():
+                try:
+                    results.put(result, timeout=0.2)
+                    return
+                except queue.Full:
+                    continue
+
+        def deliver(result):
+            self._write_sinks(result)
+            put(result)
+
+        self.pipeline = StagedPipeline([Stage('call', call, workers=self.concurrency)],
+                                       queue_size=max(2, self.concurrency * 2))
+
+        def run():
+            try:
+                self.pipeline.run(load(), on_result=deliver, collect=False)
+            finally:
+                put(_DONE)
+
+        worker = threading.Thread(target=run, name='review-session', daemon=True)
+        worker.start()
+        try:
+            while True:
+                result = results.get()
+                if result is _DONE:
+                    break
+                yield result
+        finally:
+            stop.set()
+            worker.join()
+        if errors:
+            raise errors[0]
+
+    async def review_async(self, requirements):
+        """
+        review 的异步版本（异步生成器），requirements 也可以是异步可迭代对象
+
+        评审在线程中进行，不阻塞事件循环。
+        """
+        import asyncio
+
+        loop = asyncio.get_running_loop()
+        if hasattr(requirements, '__aiter__'):
+            requirements = _iter_async(requirements, loop)
+        iterator = self.review(requirements)
+        try:
+            while True:
+                result = await loop.run_in_executor(None, next, iterator, _DONE)
+                if result is _DONE:
+                    break
+                yield result
+        finally:
+            try:
+                await loop.run_in_executor(None, iterator.close)
+            except ValueError:
+                # 取消时生成器仍在另一线程中等待结果，由其自行结束
+                pass
+
+    def review_all(self, requirements):
+        """评审全部需求，返回按输入顺序排列的结果列表"""
+        return sorted(self.review(requirements), key=lambda result: result.index)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def review_requirements(requirements, **options):
+    """评审需求并逐条产出结果（结束后关闭 sinks），options 见 ReviewSession"""
+    with ReviewSession(**options) as session:
+        yield from session.review(requirements)
+
+async def review_requirements_async(requirements, **options):
+    """review_requirements 的异步版本"""
+    with ReviewSession(**options) as session:
+        async for result in session.review_async(requirements):
+            yield result
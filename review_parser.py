@@ -0,0 +1,234 @@
+"""
+评审结果解析模块
+从大模型返回的评审文本中提取逐条检查项结论
+"""
+
+import re
+
+# 评审结论取值
+VERDICTS = ['失败', '不确定', '不适用', '通过']
+
+# 检查条目结果行，例如：- CHKI_01: 通过 - 理由 / - [CHKI_01]：**失败** —— 理由
+ITEM_LINE_PATTERN = re.compile(
+    r'^\s*[-*]?\s*\[?\**(CHKI_\d+)\**\]?\s*[:：]\s*\[?\**(通过|失败|不适用|不确定)\**\]?\s*(?:[-–—:：]+\s*)?(.*)$',
+    re.MULTILINE
+)
+
+def parse_item_verdicts(review_text):
+    """
+    解析逐条检查项结论
+
+    Returns:
+        [(条目ID, 结论, 理由), ...]，同一条目出现多次时只保留第一次
+    """
+    verdicts = []
+    seen = set()
+    for match in ITEM_LINE_PATTERN.finditer(review_text or ''):
+        item_id, verdict, reason = match.group(1), match.group(2), match.group(3).strip()
+        if item_id in seen:
+            continue
+        seen.add(item_id)
+        verdicts.append((item_id, verdict, reason))
+    return verdicts
+
+# 额外问题小节标题
+EXTRA_ISSUES_HEADING = '## 额外问题'
+
+# 小节结束位置：下一个标题或评审结果结束标记
+_SECTION_END_PATTERN = re.compile(r'^(#{1,3} |\[/评审结果\])', re.MULTILINE)
+
+def _extra_issues_span(review_text):
+    """额外问题小节正文的 (起始, 结束) 位置，不存在时返回 None"""
+    start = review_text.find(EXTRA_ISSUES_HEADING)
+    if start == -1:
+        return None
+    body_start = review_text.find('\n', start)
+    body_start = len(review_text) if body_start == -1 else body_start + 1
+    end_match = _SECTION_END_PATTERN.search(review_text, body_start)
+    return body_start, end_match.start() if end_match else len(review_text)
+
+def extract_extra_issues(review_text):
+    """提取额外问题小节中的条目（以 - 开头的行）"""
+    span = _extra_issues_span(review_text or '')
+    if span is None:
+        return []
+    body = review_text[span[0]:span[1]]
+    return [line.strip() for line in body.splitlines() if line.strip().startswith('-')]
+
+def append_extra_issues(review_text, issues):
+    """把额外问题条目追加到额外问题小节末尾（没有该小节时新建）"""
+    issues = [issue for issue in issues if issue]
+    if not issues:
+        return review_text
+    lines = "\n".join(issues) + "\n"
+    span = _extra_issues_span(review_text)
+    if span is not None:
+        insert_at = span[1]
+        prefix = review_text[:insert_at]
+        if not prefix.endswith('\n'):
+            prefix += '\n'
+        return prefix + lines + review_text[insert_at:]
+    section = f"\n{EXTRA_ISSUES_HEADING}\n{lines}"
+    close_pos = review_text.find('[/评审结果]')
+    if close_pos != -1:
+        return review_text[:close_pos].rstrip('\n') + "\n" + section + review_text[close_pos:]
+    return review_text.rstrip('\n') + "\n" + section
+
+def format_item_line(item_id, verdict, reason):
+    """按提示模板要求的格式输出一行检查条目结果"""
+    return f"- {item_id}: {verdict} - {reason}" if reason else f"- {item_id}: {verdict}"
+
+def replace_item_lines(review_text, replacements):
+    """
+    用新的结论替换评审文本中对应检查条目的结果行
+
+    Args:
+        replacements: {条目ID: (结论, 理由)}；文本中不存在的条目追加在额外问题小节之前
+
+    Returns:
+        替换后的评审文本
+    """
+    pending = dict(replacements)
+
+    def substitute(match):
+        item_id = match.group(1)
+        if item_id not in pending:
+            return match.group(0)
+        verdict, reason = pending.pop(item_id)
+        return format_item_line(item_id, verdict, reason)
+
+    merged = ITEM_LINE_PATTERN.sub(substitute, review_text)
+    if not pending:
+        return merged
+
+    missing = "\n".join(format_item_line(item_id, *value) for item_id, value in pending.items()) + "\n"
+    heading_pos = merged.find(EXTRA_ISSUES_HEADING)
+    if heading_pos != -1:
+        return merged[:heading_pos] + missing + "\n" + merged[heading_pos:]
+    close_pos = merged.find('[/评审结果]')
+    if close_pos != -1:
+        return merged[:close_pos].rstrip('\n') + "\n" + missing + merged[close_pos:]
+    return merged.rstrip('\n') + "\n" + missing
+
+# 合并多段评审时的结论优先级（靠前者优先）
+VERDICT_SEVERITY = ['失败', '不确定', '通过', '不适用']
+
+def merge_reviews(review_texts, labels):
+    """
+    合并对同一检查单、不同需求分段的评审结果
+
+    每个检查条目取各段中最严重的结论，理由按分段标注后合并；额外问题去重后合并。
+
+    Args:
+        review_texts: 各分段的评审文本
+        labels: 各分段的标注，例如 "需求 1-40"
+
+    Returns:
+        标准格式的评审文本
+    """
+    merged = {}
+    order = []
+    for text, label in zip(review_texts, labels):
+        for item_id, verdict, reason in parse_item_verdicts(text):
+            if item_id not in merged:
+                merged[item_id] = (verdict, [])
+                order.append(item_id)
+            current, reasons = merged[item_id]
+            if VERDICT_SEVERITY.index(verdict) < VERDICT_SEVERITY.index(current):
+                current = verdict
+            if reason:
+                reasons.append(f"[{label}] {reason}")
+            merged[item_id] = (current, reasons)
+
+    lines = [format_item_line(item_id, merged[item_id][0], "；".join(merged[item_id][1])) for item_id in order]
+    issues = []
+    for text in review_texts:
+        issues.extend(issue for issue in extract_extra_issues(text) if issue not in issues)
+    body = "[评审结果]\n" + "\n".join(lines) + "\n"
+    if issues:
+        body += f"\n{EXTRA_ISSUES_HEADING}\n" + "\n".join(issues) + "\n"
+    return body + "[/评审结果]"
+
+def merge_item_groups(review_texts, groups):
+    """
+    合并对同一需求、不同检查条目分组的评审结果
+
+    每组只采用本组条目的结论（模型多输出的其他条目忽略），按分组顺序输出；
+    组内缺少结论的条目记为 不确定。额外问题去重后合并。
+
+    Args:
+        review_texts: 各组的评审文本
+        groups: 各组的条目ID列表
+
+    Returns:
+        标准格式的评审文本
+    """
+    lines = []
+    issues = []
+    for text, item_ids in zip(review_texts, groups):
+        verdicts = {item_id: (verdict, reason) for item_id, verdict, reason in parse_item_verdicts(text)}
+        for item_id in item_ids:
+            verdict, reason = verdicts.get(item_id, ('不确定', '分组评审未给出该条目的结论'))
+            lines.append(format_item_line(item_id, verdict, reason))
+        issues.extend(issue for issue in extract_extra_issues(text) if issue not in issues)
+    body = "[评审结果]\n" + "\n".join(lines) + "\n"
+    if issues:
+        body += f"\n{EXTRA_ISSUES_HEADING}\n" + "\n".join(issues) + "\n"
+    return body + "[/评审结果]"
+
+# 推理模型回复中的思考过程
+_THINK_PATTERN = re.compile(r'<think>.*?</think>', re.DOTALL)
+
+# 投票评审在条目结果后追加的一致度行
+_AGREEMENT_PATTERN = re.compile(r'^投票一致度: ([\d.]+)（(\d+) 个样本）', re.MULTILINE)
+# 一致度低于该值的评审结论不稳定，建议人工复核
+LOW_AGREEMENT = 0.67
+
+def vote_reviews(review_texts):
+    """
+    对同一提示的多个评审样本按检查条目多数投票
+
+    每个条目取得票最多的结论（平票时取更严重的结论），理由取第一个投出该结论的样本并注明票数；
+    一致度为各条目多数票占样本数比例的平均值（未给出该条目结论的样本计为不一致）。额外问题去重后合并。
+
+    Args:
+        review_texts: 各样本的评审文本
+
+    Returns:
+        (标准格式的评审文本, 一致度)
+    """
+    from collections import Counter
+
+    texts = [_THINK_PATTERN.sub('', text or '') for text in review_texts]
+    votes = {}
+    order = []
+    for text in texts:
+        for item_id, verdict, reason in parse_item_verdicts(text):
+            if item_id not in votes:
+                votes[item_id] = []
+                order.append(item_id)
+            votes[item_id].append((verdict, reason))
+
+    lines = []
+    scores = []
+    for item_id in order:
+        counts = Counter(verdict for verdict, _ in votes[item_id])
+        verdict = min(counts, key=lambda v: (-counts[v], VERDICT_SEVERITY.index(v)))
+        reason = next(reason for v, reason in votes[item_id] if v == verdict)
+        tally = f"（投票 {counts[verdict]}/{len(texts)}）"
+        lines.append(format_item_line(item_id, verdict, f"{reason} {tally}" if reason else tally))
+        scores.append(counts[verdict] / len(texts))
+    agreement = sum(scores) / len(scores) if scores else 0.0
+
+    issues = []
+    for text in texts:
+        issues.extend(issue for issue in extract_extra_issues(text) if issue not in issues)
+    body = "[评审结果]\n" + "\n".join(lines) + "\n" + f"投票一致度: {agreement:.2f}（{len(texts)} 个样本）\n"
+    if issues:
+        body += f"\n{EXTRA_ISSUES_HEADING}\n" + "\n".join(issues) + "\n"
+    return body + "[/评审结果]", agreement
+
+def parse_agreement(review_text):
+    """读取投票评审的一致度，返回 (一致度, 样本数)；未投票时返回 None"""
+    match = _AGREEMENT_PATTERN.search(review_text or '')
+    return (float(match.group(1)), int(match.group(2))) if match else None
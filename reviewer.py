@@ -1,20 +1,55 @@
-from openai import OpenAI
-import httpx
-import pandas as pd
 import os
 import time
 import re
-from openpyxl import load_workbook
 import sys
-from model_config import get_model_config, review_with_llm
+import threading
+from model_config import get_model_config, get_fast_model_name, load_env, review_with_llm, review_with_llm_result, \
+    get_vote_count
+from cascade import cascade_review, is_failed_review, TIER_REASONER
+from llm_client import get_hedger, get_rate_limiters
+from cassette import get_cassette
+from structured_output import is_structured, get_structured_stats
+from profiler import span, get_tracer, traced, merge_item_spans
 
-# 初始化模型配置
-model_config = get_model_config()
-print(f"✅ 已加载模型配置: {model_config.get_provider()} - {model_config.get_model_name()}")
+# 评审结果工作簿的列
+RESULT_COLUMNS = ['标识', '作者', '失败', '不确定', '不适用', '通过', '额外问题', '评审层级', '评审结果']
+# 附加检查单在结果表中各占一组列，列名前加检查单名称，例如“项目检查单-失败”
+CHECKLIST_RESULT_FIELDS = ['失败', '不确定', '不适用', '通过', '额外问题', '评审层级', '评审结果']
 
-def reviewer(prompt: str) -> str:
-    """使用配置的大模型进行评审"""
-    return review_with_llm(prompt, model_config)
+# 模型配置在首次评审时才初始化，避免导入本模块即加载 openai/httpx
+model_config = None
+
+def get_reviewer_config():
+    """获取（并在首次调用时初始化）评审使用的模型配置"""
+    global model_config
+    if model_config is None:
+        model_config = get_model_config()
+        print(f"✅ 已加载模型配置: {model_config.get_provider()} - {model_config.get_model_name()}")
+    return model_config
+
+# 级联评审第一级使用的快速模型配置，同样在首次使用时初始化
+fast_model_config = None
+
+def get_fast_config():
+    """获取（并在首次调用时初始化）级联评审的快速模型配置"""
+    global fast_model_config
+    if fast_model_config is None:
+        fast_model_config = get_model_config(get_fast_model_name())
+        print(f"✅ 已加载快速模型配置: {fast_model_config.get_provider()} - {fast_model_config.get_model_name()}")
+    return fast_model_config
+
+def is_cascade_enabled():
+    """是否启用两级模型级联评审（REVIEW_CASCADE 环境变量）"""
+    load_env()
+    return os.getenv('REVIEW_CASCADE', '').lower() in ('1', 'true', 'yes', 'on')
+
+def reviewer(prompt: str, config=None) -> str:
+    """使用配置的大模型进行评审，config 为空时使用默认（推理）模型"""
+    return review_with_llm(prompt, config or get_reviewer_config())
+
+def reviewer_result(prompt: str, config=None):
+    """同 reviewer，返回 llm_client.LLMResult（含 finish_reason、usage 与错误分类）"""
+    return review_with_llm_result(prompt, config or get_reviewer_config())
 
 def extract_valid_content(input_str):
     start_marker = "<think>"
@@ -32,6 +67,8 @@ def extract_valid_content(input_str):
 
 def safe_get_value(row, key, default='无'):
     """安全获取并格式化字段值"""
+    import pandas as pd
+
     value = row.get(key, None)
     
     if pd.isna(value) or value is None:
@@ -52,6 +89,9 @@ def safe_save_to_excel(df, filepath, sheet_name='Sheet1'):
     """
     修复版保存函数 - 解决属性设置问题
     """
+    import pandas as pd
+    from openpyxl import load_workbook
+
     max_retries = 3
     retry_delay = 2
     
@@ -115,6 +155,8 @@ def alternative_save_method(df, filepath, sheet_name='Sheet1'):
     """
     替代保存方法 - 当标准方法失败时使用
     """
+    import pandas as pd
+
     try:
         if not os.path.exists(filepath):
             df.to_excel(filepath, index=False, sheet_name=sheet_name)
@@ -146,36 +188,356 @@ def format_elapsed_time(seconds):
     else:
         return f"{seconds/3600:.1f}小时"
 
-if __name__ == "__main__":
+def build_requirement_text(row, prompt_format=None):
+    """构建单条需求的提示文本（prompt_format 默认读取 PROMPT_FORMAT）"""
+    from prompt_format import REQUIREMENT_FIELDS, format_fields
+
+    values = {name: safe_get_value(row, name) for name in REQUIREMENT_FIELDS}
+    return format_fields(values, REQUIREMENT_FIELDS, prompt_format)
+
+def call_reviewer(full_prompt, max_retries=3, config=None):
+    """
+    调用评审服务，返回去除思考过程后的评审文本
+
+    只有可重试的传输错误（限流、超时、连接、服务端错误、熔断）和空回复才会重试；
+    截断的输出已在 llm_client 中续写，不会整体重发；调用失败时返回 "Error: ..." 文本。
+    """
+    review_result = ""
+    for retry in range(max_retries):
+        with span('llm_call', model=getattr(config, 'model_name', None)):
+            result = reviewer_result(full_prompt, config)
+        if result.ok and result.text.strip():
+            if result.truncated:
+                print(f"⚠️ 评审输出续写 {result.continuations} 次后仍被截断，保留已输出内容")
+            with span('extract_valid_content'):
+                return extract_valid_content(result.text)
+
+        review_result = f"Error: {result.error}" if not result.ok else "Error: 无返回结果"
+        if not result.ok and not result.retryable:
+            print(f"❌ 评审服务错误（{result.error_class}，不重试）: {result.error}")
+            break
+        if retry < max_retries - 1:
+            # 熔断时等待冷却结束，其余错误指数退避
+            delay = result.retry_after if result.error_class == 'circuit_open' else 2 ** (retry + 1)
+            reason = result.error_class or '空回复'
+            print(f"⚠️ 评审返回异常（{reason}），{delay:.0f}秒后重试 ({retry+1}/{max_retries})...")
+            time.sleep(max(delay, 1))
+    return review_result
+
+def count_verdicts(review_result):
+    """统计评审文本中各类结论与额外问题出现的次数"""
+    return {
+        key: len(re.findall(rf'\b{key}\b', review_result))
+        for key in ['失败', '不确定', '不适用', '通过', '额外问题']
+    }
+
+def parse_review(item):
+    """解析评审文本，统计各类结果数量（流水线 parse 阶段，在进程池中执行）"""
+    review_result = item['review_result']
+    with span('regex_count'):
+        item['result'] = {
+            '标识': item['config_id'],
+            '作者': item['author'],
+            **count_verdicts(review_result),
+            '评审层级': item.get('tier', TIER_REASONER),
+            '评审结果': review_result
+        }
+        # 附加检查单的结果写入带名称前缀的列
+        for name, text, tier in item.pop('extra_reviews', []):
+            item['result'].update({checklist_column(name, key): count for key, count in count_verdicts(text).items()})
+            item['result'][checklist_column(name, '评审层级')] = tier
+            item['result'][checklist_column(name, '评审结果')] = text
+    del item['review_result']
+    return item
+
+def get_progress_path(output_path):
+    """逐条追加的进度文件（最终导出成功后删除）"""
+    return output_path.replace(".xlsx", "_进度.csv")
+
+def append_progress_row(path, row):
+    """向进度 CSV 追加一行（只追加，不重读已有内容），返回是否成功"""
+    import csv
+
+    try:
+        write_header = not os.path.exists(path)
+        with open(path, 'a', encoding='utf-8-sig', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=list(row), extrasaction='ignore')
+            if write_header:
+                writer.writeheader()
+            writer.writerow(row)
+        return True
+    except OSError as e:
+        print(f"❌ 写入进度文件失败: {str(e)}")
+        return False
+
+def persist_result(item):
+    """
+    追加保存单条评审结果，失败时写入紧急备份（流水线 persist 阶段，在进程池中执行）
+
+    运行中只向进度 CSV 追加一行，结果工作簿在运行结束时一次性流式导出，
+    每条需求的保存耗时与内存不随已完成的行数增长。
+    """
+    import pandas as pd
+
+    output_path = item['output_path']
+    with span('append_progress'):
+        item['saved'] = append_progress_row(get_progress_path(output_path), item['result'])
+    if not item['saved']:
+        print(f"❌ 保存失败: 需求 {item['config_id']}")
+        
+        # 写入紧急备份
+        backup_path = output_path.replace(".xlsx", "_紧急备份.csv")
+        temp_df = pd.DataFrame([item['result']])
+        temp_df.to_csv(backup_path, mode='a', header=not os.path.exists(backup_path), index=False)
+        print(f"⚠️ 已创建紧急备份: {backup_path}")
+    
+    # 评审文本写入文本库，返回主进程的条目与结果列表只保留引用
+    from blob_store import BlobStore
+    try:
+        with span('blob_spill'):
+            blobs = BlobStore(item['blob_dir'])
+            for column in [column for column in item['result'] if is_review_text_column(column)]:
+                item['result'][column] = blobs.put(item['result'][column])
+    except OSError as e:
+        print(f"⚠️ 评审文本写入文本库失败，保留在内存中: {str(e)}")
+    return item
+
+def review_requirement(requirement, render_prompt, checklist, cascade=False, fanout=1, slots=None):
+    """
+    评审一条需求
+
+    Args:
+        requirement: 需求提示文本（build_requirement_text 的结果）
+        render_prompt: 函数，接收 (需求文本, 检查单文本)，返回完整提示
+        checklist: checklist.Checklist 实例
+        cascade: 是否两级模型级联评审
+        fanout: 检查条目分组数，大于 1 时各组并行评审后合并
+        slots: 可选的 threading.Semaphore，每次调用评审服务前取得一个名额（见 get_max_inflight）
+
+    Returns:
+        (评审文本, 评审层级, 复核的条目ID列表)
+    """
+    from fanout import fanout_review
+
+    def limited(prompt, config=None):
+        if slots is None:
+            return call_reviewer(prompt, config=config)
+        with slots:
+            return call_reviewer(prompt, config=config)
+
+    def review_checklist(sub_checklist):
+        if cascade:
+            return cascade_review(
+                lambda checklist_text: render_prompt(requirement, checklist_text),
+                sub_checklist,
+                lambda prompt: limited(prompt, config=get_fast_config()),
+                limited
+            )
+        return limited(render_prompt(requirement, sub_checklist.text)), TIER_REASONER, []
+
+    if fanout > 1:
+        return fanout_review(checklist, fanout, review_checklist)
+    return review_checklist(checklist)
+
+def review_checklists(requirement, render_prompt, checklists, cascade=False, fanout=1, slots=None):
+    """
+    对照多份检查单评审同一条需求
+
+    需求文本只构造一次，各检查单并行调用；提示模板中需求位于检查单之前，
+    同一需求的各个提示共享“模板 + 需求”前缀，可命中服务端的提示前缀缓存。
+    传入 slots 时各检查单、各分组的调用共用这些名额，同时进行的请求数不随检查单数成倍增长。
+
+    Args:
+        checklists: [(检查单名称, Checklist), ...]
+        其余参数同 review_requirement
+
+    Returns:
+        [(评审文本, 评审层级, 复核的条目ID列表), ...]，与 checklists 顺序一致
+    """
+    if len(checklists) == 1:
+        return [review_requirement(requirement, render_prompt, checklists[0][1], cascade, fanout, slots)]
+
+    import contextvars
+    from concurrent.futures import ThreadPoolExecutor
+
+    with ThreadPoolExecutor(max_workers=len(checklists), thread_name_prefix='checklist') as executor:
+        futures = [executor.submit(contextvars.copy_context().run, review_requirement,
+                                   requirement, render_prompt, checklist, cascade, fanout, slots)
+                   for _, checklist in checklists]
+        return [future.result() for future in futures]
+
+def checklist_column(name, field):
+    """附加检查单的结果列名"""
+    return f"{name}-{field}"
+
+def get_result_columns(checklist_names):
+    """结果表的列：主检查单使用原有列，每份附加检查单追加一组带名称前缀的列"""
+    return RESULT_COLUMNS + [checklist_column(name, field)
+                             for name in checklist_names[1:] for field in CHECKLIST_RESULT_FIELDS]
+
+def checklist_result(result, name):
+    """从结果行中取出附加检查单的结果（列名与主检查单相同）"""
+    return {'标识': result['标识'], '作者': result['作者'],
+            **{field: result.get(checklist_column(name, field)) for field in CHECKLIST_RESULT_FIELDS}}
+
+def is_review_text_column(column):
+    return column == '评审结果' or column.endswith('-评审结果')
+
+def get_checklist_files(script_dir):
+    """
+    评审使用的检查单文件（REVIEW_CHECKLISTS 环境变量，逗号分隔，相对路径基于脚本目录）
+
+    第一份为主检查单，结果写入原有列；未设置时只使用 checklist.txt。
+    """
+    load_env()
+    names = [name.strip() for name in os.getenv('REVIEW_CHECKLISTS', '').split(',') if name.strip()]
+    return [os.path.join(script_dir, name) for name in names or ['checklist.txt']]
+
+def get_concurrency():
+    """评审并发数（REVIEW_CONCURRENCY 环境变量，默认 1）"""
+    load_env()
+    try:
+        return max(1, int(os.getenv('REVIEW_CONCURRENCY', '1')))
+    except ValueError:
+        return 1
+
+def get_max_inflight(concurrency, fanout=1):
+    """
+    同时进行的评审请求数上限（REVIEW_MAX_INFLIGHT 环境变量，默认 并发数 × 分组数）
+
+    多检查单与分组评审的调用共用这一上限，避免请求数达到 并发数 × 检查单数 × 分组数。
+    """
+    load_env()
+    try:
+        limit = int(os.getenv('REVIEW_MAX_INFLIGHT', '0') or 0)
+    except ValueError:
+        limit = 0
+    return limit if limit > 0 else concurrency * fanout
+
+def get_fanout():
+    """每条需求的检查条目分组数（REVIEW_FANOUT 环境变量，默认 1 即不分组）"""
+    load_env()
+    try:
+        return max(1, int(os.getenv('REVIEW_FANOUT', '1')))
+    except ValueError:
+        return 1
+
+def main(concurrency=None, cascade=None, fanout=None, checklists=None):
+    """
+    运行评审（由 main.py 进程内调用或直接执行本脚本）
+    
+    Args:
+        concurrency: 并发评审的需求数，默认读取 REVIEW_CONCURRENCY
+        cascade: 是否启用两级模型级联评审，默认读取 REVIEW_CASCADE
+        fanout: 每条需求的检查条目分组数，各组并行评审后合并，默认读取 REVIEW_FANOUT
+        checklists: 检查单文件路径列表（第一份为主检查单），默认读取 REVIEW_CHECKLISTS
+    """
+    import pandas as pd
+    from checklist import load_checklists
+    from pipeline import Stage, StagedPipeline
+    from xlsx_stream import write_rows_streaming
+    from results_store import ResultsStore
+    from blob_store import BlobStore
+    from run_logger import RunLogger, ProgressRenderer
+    from budget import get_budget_governor, project_run_cost, format_projection, \
+        load_checkpoint, save_checkpoint, clear_checkpoint
+    from prompt_format import get_prompt_format, render_review_prompt, measure_savings, format_savings
+    from review_parser import parse_agreement, LOW_AGREEMENT
+
     script_dir = os.path.dirname(os.path.abspath(__file__))
     requirements_path = os.path.join(script_dir, "requirements.xlsx")  # 待评审的需求集合
     output_path = os.path.join(script_dir, "评审结果-cot.xlsx")  # 评审结果
     prompt_file = os.path.join(script_dir, "prompt.txt")
-    checklist_file = os.path.join(script_dir, "checklist.txt")
+    checklist_files = checklists or get_checklist_files(script_dir)
+    checkpoint_path = os.path.join(script_dir, "review_checkpoint.json")  # 预算用尽时的检查点
 
     # 文件存在性检查
-    for path in [requirements_path, prompt_file]:
+    for path in [requirements_path, prompt_file] + checklist_files:
         if not os.path.exists(path):
             raise FileNotFoundError(f"必要文件缺失: {path}")
 
     # 读取需求文件
-    df_requirements = pd.read_excel(requirements_path, engine='openpyxl')
+    with span('read_sheet'):
+        df_requirements = pd.read_excel(requirements_path, engine='openpyxl')
     
     # 读取提示模板
     with open(prompt_file, 'r', encoding='utf-8') as f:
-        base_prompt = f.read()
+        prompt_template = f.read()
 
-    # 读取检查单
-    with open(checklist_file, 'r', encoding='utf-8') as f:
-        checklist = f.read()
+    # 读取检查单（多份检查单时每条需求只读取与构造一次，依次对照各检查单评审）
+    checklists = load_checklists(checklist_files)
+    checklist_names = [name for name, _ in checklists]
+    checklist = checklists[0][1]
+    result_columns = get_result_columns(checklist_names)
+    prompt_format = get_prompt_format()
+    votes = get_vote_count()
 
-    base_prompt = base_prompt.replace("[CHECKLIST]", checklist)
+    def render_prompt(requirement, checklist_text):
+        with span('render_prompt'):
+            return render_review_prompt(prompt_template, checklist_text, requirement, prompt_format)
     
     # 获取总需求数量
     total_requirements = len(df_requirements)
     if total_requirements == 0:
         print("警告：需求表格为空！")
-        exit()
+        return
+
+    concurrency = concurrency or get_concurrency()
+    cascade = is_cascade_enabled() if cascade is None else cascade
+    fanout = min(fanout or get_fanout(), max(1, max(len(c.items) for _, c in checklists)))
+    # 各需求、各检查单、各分组的调用共用的请求名额
+    max_inflight = get_max_inflight(concurrency, fanout)
+    call_slots = threading.BoundedSemaphore(max_inflight)
+    # 在启动工作线程前初始化模型配置，避免并发初始化
+    config = get_reviewer_config()
+    if cascade:
+        get_fast_config()
+    tier_counts = {}
+    # 多样本投票评审时各需求的投票一致度
+    agreements = []
+
+    # 上次运行因预算用尽停止时，跳过检查点中已完成的需求
+    governor = get_budget_governor()
+    checkpoint = load_checkpoint(checkpoint_path)
+    resumed = {}
+    if checkpoint and checkpoint.get('source') == requirements_path \
+            and checkpoint.get('checklists', checklist_names[:1]) == checklist_names:
+        resumed = {int(index): row for index, row in checkpoint['completed'].items()}
+        print(f"⏯️ 从检查点继续: 已完成 {len(resumed)}/{total_requirements} 条（删除 {checkpoint_path} 可重新开始）")
+    pending_total = total_requirements - len(resumed)
+
+    # 运行前估算费用（级联评审按全部由推理模型评审估算，为上限；分组评审时每组一次调用，每份检查单分别调用）
+    group_texts = [c.subset_text(ids) for _, c in checklists for ids in c.split_groups(fanout)] \
+        if fanout > 1 else [c.text for _, c in checklists]
+    with span('cost_projection'):
+        projection = project_run_cost(
+            (render_prompt(build_requirement_text(row, prompt_format), group_text)
+             for idx, row in df_requirements.iterrows() if idx not in resumed
+             for group_text in group_texts),
+            config.model_name, max(-(-len(c.items) // fanout) for _, c in checklists))
+    print(format_projection(projection, config.model_name, governor))
+    savings = None
+    if prompt_format == 'compact':
+        # 与原有 markdown 模板对比本次运行的提示 token
+        with span('prompt_savings'):
+            savings = measure_savings(
+                prompt_template, checklist.text,
+                lambda fmt: (build_requirement_text(row, fmt)
+                             for idx, row in df_requirements.iterrows() if idx not in resumed))
+        print(format_savings(savings))
+    budget_stopped = False
+    completed_rows = dict(resumed)
+
+    # 登记到评审结果库
+    store = ResultsStore()
+    run_id = store.start_run('single', config, source=requirements_path)
+    
+    # 较长的评审文本溢写到文本库，导出时再逐条读取
+    blobs = BlobStore()
+    # 上次运行残留的进度文件（已完成的需求由检查点或结果工作簿记录）
+    progress_path = get_progress_path(output_path)
+    if os.path.exists(progress_path):
+        os.remove(progress_path)
 
     # 初始化进度统计变量
     start_time = time.time()
@@ -183,137 +545,258 @@ if __name__ == "__main__":
     success_count = 0
     failed_count = 0
 
-    # 创建日志文件
+    # 创建日志文件（文本日志 + JSON Lines 事件，由后台线程批量落盘）
     log_file = os.path.join(script_dir, "review_log.txt")
-    with open(log_file, 'w', encoding='utf-8') as log:
-        log.write(f"评审开始时间: {time.strftime('%Y-%m-%d %H:%M:%S')}\n")
-        log.write(f"总需求数量: {total_requirements}\n")
-        log.write("-"*50 + "\n")
+    logger = RunLogger(jsonl_path=os.path.join(script_dir, "review_log.jsonl"))
+    logger.start_file(logger.jsonl_path)
+    logger.start_file(
+        log_file,
+        f"评审开始时间: {time.strftime('%Y-%m-%d %H:%M:%S')}\n"
+        f"总需求数量: {total_requirements}\n"
+        + "-"*50 + "\n"
+    )
+    logger.event('run_start', mode='single', run_id=run_id, total=total_requirements,
+                 concurrency=concurrency, cascade=bool(cascade), fanout=fanout, resumed=len(resumed),
+                 checklists=checklist_names,
+                 projected_cost=round(projection['cost'], 4), prompt_format=prompt_format, votes=votes,
+                 prompt_tokens_saved=savings and savings['markdown'] - savings['compact'])
+    progress = ProgressRenderer(pending_total)
 
-    # 结果列表
-    all_results = []
+    # load 阶段：逐行读取需求，运行预算用尽后不再送入新的需求
+    def load_rows():
+        nonlocal budget_stopped
+        for idx, row in df_requirements.iterrows():
+            if idx in resumed:
+                continue
+            if governor.should_stop():
+                budget_stopped = True
+                return
+            yield {'index': idx, 'row': row.to_dict()}
 
-    for idx, row in df_requirements.iterrows():
+    # render 阶段：构造完整提示
+    def render(item):
+        row = item['row']
+        item['config_id'] = safe_get_value(row, '标识')
+        item['author'] = safe_get_value(row, '作者')
+        with span('build_requirement_text'):
+            item['requirement'] = build_requirement_text(row, prompt_format)
+        item['output_path'] = output_path
+        item['blob_dir'] = blobs.root
+        del item['row']
+        return item
+
+    # render / call 阶段出错：记为评审失败，后续阶段照常生成结果行与备份（不计入检查点，继续运行时重新评审）
+    def review_failed(item, error):
+        row = item.pop('row', None)
+        if row is not None and 'config_id' not in item:
+            item['config_id'] = safe_get_value(row, '标识')
+            item['author'] = safe_get_value(row, '作者')
+        item.setdefault('config_id', '无')
+        item.setdefault('author', '无')
+        item.pop('requirement', None)
+        item['output_path'] = output_path
+        item['blob_dir'] = blobs.root
+        error_text = f"Error: {str(error)}"
+        item['review_result'], item['tier'], item['escalated'] = error_text, TIER_REASONER, []
+        item['extra_reviews'] = [(name, error_text, TIER_REASONER) for name in checklist_names[1:]]
+        item.setdefault('call_seconds', 0.0)
+        return item
+
+    # parse 阶段出错（例如进程池失效）：在当前线程重新统计，仍失败时记为评审失败
+    def parse_failed(item, error):
+        try:
+            return parse_review(item)
+        except Exception:
+            return parse_review(review_failed(item, f"解析失败: {str(error)}"))
+
+    # persist 阶段出错：在当前线程重新保存，仍失败时写入紧急备份，评审文本保留在内存中
+    def persist_failed(item, error):
+        try:
+            return persist_result(item)
+        except Exception as e:
+            print(f"❌ 保存失败: 需求 {item['config_id']}（{str(e)}）")
+            backup_path = output_path.replace(".xlsx", "_紧急备份.csv")
+            append_progress_row(backup_path, item['result'])
+            item['saved'] = False
+            return item
+
+    # call 阶段：调用评审服务（多线程并发；分组评审时同一需求的各组再并行）
+    def call(item):
+        call_start = time.time()
+        progress.started()
+        if 'review_result' in item:
+            # render 阶段已记为失败
+            return item
+        requirement = item['requirement']
+        outcomes = review_checklists(requirement, render_prompt, checklists, cascade, fanout, call_slots)
+        del item['requirement']
+        item['review_result'], item['tier'], item['escalated'] = outcomes[0]
+        item['extra_reviews'] = [(name, text, tier)
+                                 for name, (text, tier, _) in zip(checklist_names[1:], outcomes[1:])]
+        item['call_seconds'] = round(time.time() - call_start, 2)
+        return item
+
+    # 每条需求保存完成后更新进度与日志
+    def on_result(item):
+        nonlocal processed_count, success_count, failed_count
+        merge_item_spans(item)
         processed_count += 1
-        config_id = safe_get_value(row, '标识')
-        
-        # 进度显示
-        elapsed_time = time.time() - start_time
-        avg_time_per_item = elapsed_time / processed_count if processed_count > 0 else 0
-        remaining_items = total_requirements - processed_count
-        estimated_remaining = remaining_items * avg_time_per_item
-        
-        progress_info = (
-            f"\n{'='*75}\n"
-            f"【处理进度】{processed_count}/{total_requirements} | "
-            f"成功率: {success_count}/{processed_count} ({success_count/processed_count*100:.1f}%) | "
-            f"耗时: {format_elapsed_time(elapsed_time)} | "
-            f"预估剩余: {format_elapsed_time(estimated_remaining)}\n"
-            f"当前处理: {config_id}\n"
-            f"{'='*75}\n"
-        )
-        
-        print("\033[H\033[J")  # ANSI清屏码
-        print(progress_info)
-
-        # 构建需求字符串
-        requirement = f"""**标识**
-{config_id}
-**标题**
-{safe_get_value(row, '标题')}
-**版本信息**
-{safe_get_value(row, '版本信息')}
-**需求类型**
-{safe_get_value(row, '需求类型')}
-**是否派生的需求**
-{safe_get_value(row, '是否派生的需求')}
-**派生理由**
-{safe_get_value(row, '派生理由')}
-**接口原型**
-{safe_get_value(row, '接口原型')}
-**需求描述**
-{safe_get_value(row, '需求描述')}
-**测试建议**
-{safe_get_value(row, '测试建议')}
-**注释**
-{safe_get_value(row, '注释')}
-"""
-
-        # 构造完整提示
-        full_prompt = base_prompt.replace("[REQUIREMENT]", requirement)
-        
-        # 调用评审服务
-        max_retries = 3
-        review_result = ""
-        for retry in range(max_retries):
-            try:
-                review_result = extract_valid_content(reviewer(full_prompt))
-                if "Error:" not in review_result and review_result.strip():
-                    break
-                else:
-                    print(f"⚠️ 评审返回异常，重试中 ({retry+1}/{max_retries})...")
-                    time.sleep(2)
-            except Exception as e:
-                review_result = f"❌ 评审服务异常: {str(e)}"
-                if retry < max_retries - 1:
-                    time.sleep(3)
-        
-        # 评审结果
-        result = {
-            '标识': config_id,
-            '作者': safe_get_value(row, '作者'),
-            '失败': len(re.findall(r'\b失败\b', review_result)),
-            '不确定': len(re.findall(r'\b不确定\b', review_result)),
-            '不适用': len(re.findall(r'\b不适用\b', review_result)),
-            '通过': len(re.findall(r'\b通过\b', review_result)),
-            '额外问题': len(re.findall(r'\b额外问题\b', review_result)),
-            '评审结果': review_result
-        }
-        
-        # 添加到结果列表
-        all_results.append(result)
+        if item['saved']:
+            success_count += 1
+        else:
+            failed_count += 1
+        result = item['result']
+        tier_counts[result['评审层级']] = tier_counts.get(result['评审层级'], 0) + 1
+        review_text = blobs.resolve(result['评审结果'])
+        extra_results = [(name, checklist_result(result, name)) for name in checklist_names[1:]]
+        extra_texts = [blobs.resolve(extra['评审结果']) for _, extra in extra_results]
+        vote = parse_agreement(review_text)
+        if vote:
+            agreements.append(vote[0])
         
         # 记录日志
-        with open(log_file, 'a', encoding='utf-8') as log:
-            log.write(f"需求 {config_id} 处理完成\n")
-            log.write(f"评审摘要: 失败={result['失败']}, 通过={result['通过']}, 额外问题={result['额外问题']}\n")
-            log.write("-"*50 + "\n")
+        with span('log_write'):
+            logger.write(
+                log_file,
+                f"需求 {item['config_id']} 处理完成\n"
+                f"评审摘要: 失败={result['失败']}, 通过={result['通过']}, 额外问题={result['额外问题']}\n"
+                + (f"复核条目: {', '.join(item['escalated'])}\n" if item.get('escalated') else "")
+                + "".join(f"{name}: 失败={extra['失败']}, 通过={extra['通过']}, 额外问题={extra['额外问题']}\n"
+                          for name, extra in extra_results)
+                + "-"*50 + "\n"
+            )
+            logger.event(
+                'requirement_done', index=int(item['index']), config_id=item['config_id'],
+                saved=item['saved'], tier=result['评审层级'], call_seconds=item['call_seconds'],
+                fail=result['失败'], uncertain=result['不确定'], not_applicable=result['不适用'],
+                passed=result['通过'], extra_issues=result['额外问题'],
+                escalated=item.get('escalated') or [],
+                agreement=vote[0] if vote else None,
+                checklists={name: {'fail': extra['失败'], 'uncertain': extra['不确定'], 'passed': extra['通过'],
+                                   'extra_issues': extra['额外问题']} for name, extra in extra_results} or None
+            )
         
-        # 每处理完一个需求就尝试保存
-        temp_df = pd.DataFrame([result])
+        # 评审失败（包括预算用尽被拒绝）的需求不计入检查点，继续运行时重新评审
+        if not any(is_failed_review(text) for text in [review_text] + extra_texts):
+            completed_rows[int(item['index'])] = result
+        try:
+            with span('results_store'):
+                store.add_result(run_id, result, review_text=review_text,
+                                 review_seconds=item['call_seconds'])
+                for (name, extra), text in zip(extra_results, extra_texts):
+                    store.add_result(run_id, extra, review_text=text,
+                                     review_seconds=item['call_seconds'], checklist=name)
+        except Exception as e:
+            print(f"⚠️ 写入评审结果库失败: {str(e)}")
         
-        # 尝试保存
-        if safe_save_to_excel(temp_df, output_path):
-            success_count += 1
-        else:
-            failed_count += 1
-            print(f"❌ 保存失败: 需求 {config_id}")
-            
-            # 写入紧急备份
-            backup_path = output_path.replace(".xlsx", "_紧急备份.csv")
-            temp_df.to_csv(backup_path, mode='a', header=not os.path.exists(backup_path), index=False)
-            print(f"⚠️ 已创建紧急备份: {backup_path}")
+        # 进度显示（限频刷新）
+        progress.finished(success=item['saved'])
+        progress.render(latest=item['config_id'])
+
+    pipeline = StagedPipeline([
+        Stage('render', render, on_error=review_failed),
+        Stage('call', call, workers=concurrency, on_error=review_failed),
+        Stage('parse', traced(parse_review), workers=2, use_process=True, on_error=parse_failed),
+        # 单线程写入，保证同一工作簿不会被并发追加
+        Stage('persist', traced(persist_result), use_process=True, on_error=persist_failed),
+    ], queue_size=max(2, concurrency * 2), process_workers=2)
+    completed = pipeline.run(load_rows(), on_result=on_result)
+    budget_stopped = budget_stopped or (governor.should_stop() and len(completed_rows) < total_requirements)
+    logger.event('run_end', run_id=run_id, processed=processed_count, saved=success_count,
+                 failed=failed_count, seconds=round(time.time() - start_time, 2),
+                 budget_stopped=budget_stopped, cost=round(governor.report()['cost'], 4))
+    logger.close()
 
-    # 最终保存所有结果
+    store.finish_run(run_id)
+    store.close()
+
+    # 预算用尽时写出检查点，全部完成后删除
+    if budget_stopped:
+        save_checkpoint(checkpoint_path, {
+            'source': requirements_path,
+            'checklists': checklist_names,
+            'run_id': run_id,
+            'saved_at': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'completed': {str(index): row for index, row in sorted(completed_rows.items())},
+            'spent': governor.report(),
+        })
+    elif len(completed_rows) == total_requirements:
+        clear_checkpoint(checkpoint_path)
+
+    # 结果列表（按原始需求顺序，包括检查点中已完成的需求），评审文本为文本库引用
+    results_by_index = dict(resumed)
+    results_by_index.update((int(item['index']), item['result']) for item in completed)
+    all_results = [results_by_index[index] for index in sorted(results_by_index)]
+
+    def export_rows():
+        """逐条读取评审文本，导出时驻留内存的只有当前一行"""
+        for result in all_results:
+            yield blobs.resolve_row(result)
+
+    # 最终保存所有结果（流式写入，超出 Excel 行数/单元格上限时自动拆分）
     try:
-        final_df = pd.DataFrame(all_results)
-        final_df.to_excel(output_path, index=False)
-        print(f"✅ 最终结果已保存至: {output_path}")
+        with span('final_export'):
+            output_paths = write_rows_streaming(output_path, result_columns, export_rows())
+        print(f"✅ 最终结果已保存至: {', '.join(output_paths)}")
+        if os.path.exists(progress_path):
+            os.remove(progress_path)
     except Exception as e:
         print(f"❌ 最终保存失败: {str(e)}")
         # 尝试保存为CSV
+        import csv
         csv_path = output_path.replace('.xlsx', '.csv')
-        pd.DataFrame(all_results).to_csv(csv_path, index=False)
+        with open(csv_path, 'w', encoding='utf-8', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=result_columns, extrasaction='ignore')
+            writer.writeheader()
+            writer.writerows(export_rows())
         print(f"⚠️ 结果已保存为CSV: {csv_path}")
+        print(f"📄 运行中逐条保存的结果: {progress_path}")
 
     # 最终统计
     total_time = time.time() - start_time
     print("\n" + "="*70)
-    print(f"✅ 处理完成! 总计: {total_requirements} 条需求")
+    print(f"✅ 处理完成! 总计: {total_requirements} 条需求" + (f"（其中 {len(resumed)} 条来自检查点）" if resumed else ""))
     print(f"✔️ 成功保存: {success_count} 条")
     print(f"❌ 失败保存: {failed_count} 条")
     print(f"⏱️ 总耗时: {format_elapsed_time(total_time)}")
-    print(f"📊 平均速度: {total_time/total_requirements:.2f} 秒/条")
-    print(f"📝 日志文件: {log_file}")
+    print(f"📊 平均速度: {total_time/max(processed_count, 1):.2f} 秒/条")
+    tracer = get_tracer()
+    if tracer is not None:
+        print("⏲️ 各步骤耗时（并发执行时累计值可超过总耗时）:")
+        print(tracer.format_totals())
+    print(f"🔀 评审并发: {concurrency}" + (f"（每条需求分 {fanout} 组并行评审）" if fanout > 1 else "")
+          + f"，同时进行的请求不超过 {max_inflight} 个")
+    if len(checklists) > 1:
+        print(f"📑 检查单: {', '.join(checklist_names)}（每条需求对照 {len(checklists)} 份检查单并行评审，"
+              f"附加检查单的结果写入带名称前缀的列）")
+    if cascade:
+        print(f"🪜 级联评审: " + ", ".join(f"{tier} {count} 条" for tier, count in sorted(tier_counts.items())))
+    if votes > 1:
+        print(f"🗳️ 投票评审: 每次 {votes} 个样本" + (
+            f"，平均一致度 {sum(agreements)/len(agreements):.2f}，"
+            f"一致度低于 {LOW_AGREEMENT:.2f} 的需求 {sum(1 for a in agreements if a < LOW_AGREEMENT)} 条"
+            if agreements else ""))
+    cassette = get_cassette()
+    if cassette is not None:
+        print(f"📼 {cassette.format_report()}")
+    hedger = get_hedger()
+    if hedger is not None:
+        print(f"🛡️ {hedger.format_report()}")
+    for limiter in get_rate_limiters():
+        print(f"🚦 {limiter.format_report()}")
+    if is_structured():
+        print(f"🧾 {get_structured_stats().format_report()}")
+    print(f"💰 {governor.format_report()}")
+    if budget_stopped:
+        print(f"⏸️ 运行预算已用尽，已完成 {len(completed_rows)}/{total_requirements} 条，"
+              f"检查点: {checkpoint_path}（再次运行将从检查点继续）")
+    print("🧮 阶段利用率:")
+    print(pipeline.format_report())
+    print(f"📝 日志文件: {log_file}（结构化事件: {logger.jsonl_path}）")
     print(f"💾 结果文件: {output_path}")
+    print(f"🗄️ 结果库: {store.db_path} (运行标识 {run_id})")
+    print(f"🗜️ 评审文本库: {blobs.root}")
     print("="*70)
+
+if __name__ == "__main__":
+    main()
@@ -1,20 +1,55 @@
-from openai import OpenAI
-import httpx
-import pandas as pd
 import os
 import time
 import re
-from openpyxl import load_workbook
 import sys
-from model_config import get_model_config, review_with_llm
+from model_config import get_model_config, get_fast_model_name, load_env, review_with_llm, review_with_llm_result
+from cascade import cascade_review, is_failed_review, TIER_REASONER, TIER_MIXED
+from review_parser import merge_reviews, parse_agreement, LOW_AGREEMENT
+from llm_client import get_hedger, get_rate_limiters
+from cassette import get_cassette
+from structured_output import is_structured, get_structured_stats
+from rate_lanes import set_default_lane
+from budget import get_budget_governor
+from profiler import span, get_tracer
+from prompt_format import render_review_prompt
 
-# 初始化模型配置
-model_config = get_model_config()
-print(f"✅ 已加载模型配置: {model_config.get_provider()} - {model_config.get_model_name()}")
+# 接口评审汇总工作簿的列
+SUMMARY_COLUMNS = ['接口名称', '需求数量', '失败', '不确定', '不适用', '通过', '额外问题', '评审耗时(秒)', '评审层级']
 
-def reviewer(prompt: str) -> str:
-    """使用配置的大模型进行评审"""
-    return review_with_llm(prompt, model_config)
+# 模型配置在首次评审时才初始化，避免导入本模块即加载 openai/httpx
+model_config = None
+
+def get_reviewer_config():
+    """获取（并在首次调用时初始化）评审使用的模型配置"""
+    global model_config
+    if model_config is None:
+        model_config = get_model_config()
+        print(f"✅ 已加载模型配置: {model_config.get_provider()} - {model_config.get_model_name()}")
+    return model_config
+
+# 级联评审第一级使用的快速模型配置，同样在首次使用时初始化
+fast_model_config = None
+
+def get_fast_config():
+    """获取（并在首次调用时初始化）级联评审的快速模型配置"""
+    global fast_model_config
+    if fast_model_config is None:
+        fast_model_config = get_model_config(get_fast_model_name())
+        print(f"✅ 已加载快速模型配置: {fast_model_config.get_provider()} - {fast_model_config.get_model_name()}")
+    return fast_model_config
+
+def is_cascade_enabled():
+    """是否启用两级模型级联评审（REVIEW_CASCADE 环境变量）"""
+    load_env()
+    return os.getenv('REVIEW_CASCADE', '').lower() in ('1', 'true', 'yes', 'on')
+
+def reviewer(prompt: str, config=None) -> str:
+    """使用配置的大模型进行评审，config 为空时使用默认（推理）模型"""
+    return review_with_llm(prompt, config or get_reviewer_config())
+
+def reviewer_result(prompt: str, config=None):
+    """同 reviewer，返回 llm_client.LLMResult（含 finish_reason、usage 与错误分类）"""
+    return review_with_llm_result(prompt, config or get_reviewer_config())
 
 def extract_valid_content(input_str):
     start_marker = "<think>"
@@ -32,6 +67,8 @@ def extract_valid_content(input_str):
 
 def safe_get_value(row, key, default='无'):
     """安全获取并格式化字段值"""
+    import pandas as pd
+
     value = row.get(key, None)
     
     if pd.isna(value) or value is None:
@@ -52,6 +89,9 @@ def safe_save_to_excel(df, filepath, sheet_name='Sheet1'):
     """
     修复版保存函数 - 解决属性设置问题
     """
+    import pandas as pd
+    from openpyxl import load_workbook
+
     max_retries = 3
     retry_delay = 2
     
@@ -115,6 +155,8 @@ def alternative_save_method(df, filepath, sheet_name='Sheet1'):
     """
     替代保存方法 - 当标准方法失败时使用
     """
+    import pandas as pd
+
     try:
         if not os.path.exists(filepath):
             df.to_excel(filepath, index=False, sheet_name=sheet_name)
@@ -146,40 +188,968 @@ def format_elapsed_time(seconds):
     else:
         return f"{seconds/3600:.1f}小时"
 
-if __name__ == "__main__":
+def get_batch_paths():
+    """获取批量评审使用的目录与模板路径"""
     script_dir = os.path.dirname(os.path.abspath(__file__))
+    return {
+        'interfaces_dir': os.path.join(script_dir, "接口需求集合"),  # 存放所有接口需求Excel文件的文件夹
+        'results_dir': os.path.join(script_dir, "评审结果"),        # 存放所有评审结果的文件夹
+        'prompt_file': os.path.join(script_dir, "prompt_batch.txt"),
+        'checklist_file': os.path.join(script_dir, "checklist.txt"),
+    }
+
+def load_prompt_template(prompt_file, checklist_file):
+    """读取提示模板与检查单，返回 (提示模板, Checklist)"""
+    from checklist import Checklist
+
+    with open(prompt_file, 'r', encoding='utf-8') as f:
+        prompt_template = f.read()
+
+    return prompt_template, Checklist.from_file(checklist_file)
+
+def call_reviewer(full_prompt, max_retries=3, config=None):
+    """
+    调用评审服务，返回去除思考过程后的评审文本
+
+    只有可重试的传输错误（限流、超时、连接、服务端错误、熔断）和空回复才会重试；
+    截断的输出已在 llm_client 中续写，不会整体重发；调用失败时返回 "Error: ..." 文本。
+    """
+    review_result = ""
+    for retry in range(max_retries):
+        print(f"🔄 第 {retry+1} 次尝试调用评审服务...")
+        with span('llm_call', model=getattr(config, 'model_name', None)):
+            result = reviewer_result(full_prompt, config)
+        if result.ok and result.text.strip():
+            print("✅ 评审服务调用成功")
+            if result.truncated:
+                print(f"⚠️ 评审输出续写 {result.continuations} 次后仍被截断，保留已输出内容")
+            with span('extract_valid_content'):
+                return extract_valid_content(result.text)
+
+        review_result = f"Error: {result.error}" if not result.ok else "Error: 无返回结果"
+        if not result.ok and not result.retryable:
+            print(f"❌ 评审服务错误（{result.error_class}，不重试）: {result.error}")
+            break
+        if retry < max_retries - 1:
+            # 熔断时等待冷却结束，其余错误指数退避
+            delay = result.retry_after if result.error_class == 'circuit_open' else 2 ** (retry + 1)
+            reason = result.error_class or '空回复'
+            print(f"⚠️ 评审返回异常（{reason}），{delay:.0f}秒后重试 ({retry+1}/{max_retries})...")
+            time.sleep(max(delay, 1))
+    return review_result
+
+def split_requirement_blocks(requirement_blocks, render_prompt, checklist, cascade=False):
+    """
+    按模型上下文预算把接口需求分段
+
+    Returns:
+        分段后的需求文本块列表，提示不超出预算（或未启用自适应预算）时只有一段
+    """
+    import token_budget
+    from model_config import build_review_messages
+
+    if not token_budget.is_adaptive_enabled():
+        return [requirement_blocks]
+    model_names = [get_reviewer_config().model_name]
+    if cascade:
+        model_names.append(get_fast_config().model_name)
+    return token_budget.split_to_fit(
+        requirement_blocks,
+        lambda requirement_text: build_review_messages(render_prompt(checklist.text, requirement_text)),
+        model_names,
+        len(checklist.items)
+    )
+
+def merge_segment_outcomes(outcomes, segments):
+    """
+    合并分段评审结果
+
+    Returns:
+        (合并后的评审文本, 评审层级, 复核的条目ID列表)；任一分段评审失败时返回该分段的错误信息
+    """
+    labels, start = [], 1
+    for segment in segments:
+        end = start + len(segment) - 1
+        labels.append(f"需求 {start}-{end}" if end > start else f"需求 {start}")
+        start += len(segment)
+
+    for (review_result, _, _), label in zip(outcomes, labels):
+        if is_failed_review(review_result):
+            return f"{label} 评审失败: {review_result}", TIER_REASONER, []
+
+    tiers = {tier for _, tier, _ in outcomes}
+    escalated = sorted({item_id for _, _, ids in outcomes for item_id in ids})
+    merged = merge_reviews([review_result for review_result, _, _ in outcomes], labels)
+    return merged, tiers.pop() if len(tiers) == 1 else TIER_MIXED, escalated
+
+def build_requirement_blocks(df_requirements, show_progress=False, prompt_format=None, fields=None):
+    """逐条构建接口需求文本块（prompt_format 默认读取 PROMPT_FORMAT，fields 默认为全部 BLOCK_FIELDS）"""
+    from prompt_format import BLOCK_FIELDS, format_fields, is_compact
+
+    compact = is_compact(prompt_format)
+    fields = fields or BLOCK_FIELDS
+    total_requirements = len(df_requirements)
+    requirement_blocks = []
     
-    # 文件夹路径配置
-    interfaces_dir = os.path.join(script_dir, "接口需求集合")  # 存放所有接口需求Excel文件的文件夹
-    results_dir = os.path.join(script_dir, "评审结果")        # 存放所有评审结果的文件夹
-    prompt_file = os.path.join(script_dir, "prompt_batch.txt")
-    checklist_file = os.path.join(script_dir, "checklist.txt")
+    # 收集所有需求
+    for idx, row in df_requirements.iterrows():
+        config_id = safe_get_value(row, '标识')
+        
+        # 显示进度
+        if show_progress:
+            progress = f"正在收集需求 {idx+1}/{total_requirements}: {config_id}"
+            print(f"\r{progress}", end="", flush=True)
+        
+        values = {name: safe_get_value(row, name) for name in fields}
+        field_text = format_fields(values, fields, prompt_format)
+        if compact:
+            requirement_blocks.append(f"\n[需求 {idx+1}] 标识: {config_id}\n{field_text}")
+        else:
+            requirement_blocks.append(f"\n**需求 {idx+1} - 标识: {config_id}**\n{field_text}\n")
+    return requirement_blocks
+
+def prepare_interface(df_requirements, show_progress=False, prompt_format=None, use_facts=None):
+    """
+    构建接口的需求文本块与接口事实表
+
+    启用事实表时（use_facts 默认读取 INTERFACE_FACTS），接口原型汇总在事实表中，需求文本块不再逐条重复。
+
+    Returns:
+        (需求文本块列表, interface_facts.InterfaceFacts；未启用时为 None)
+    """
+    from prompt_format import BLOCK_FIELDS
+    from interface_facts import analyze_interface, is_facts_enabled, RANGE_FIELDS
+
+    if use_facts is None:
+        use_facts = is_facts_enabled()
+    if not use_facts:
+        return build_requirement_blocks(df_requirements, show_progress, prompt_format), None
+    with span('interface_facts'):
+        facts = analyze_interface(
+            (idx + 1, {name: safe_get_value(row, name) for name in ('标识', '接口原型') + RANGE_FIELDS})
+            for idx, row in df_requirements.iterrows())
+    fields = [name for name in BLOCK_FIELDS if name != '接口原型']
+    return build_requirement_blocks(df_requirements, show_progress, prompt_format, fields), facts
+
+# 运行前估算时实际解析的接口数，其余接口按文件大小外推
+ESTIMATE_SAMPLE_SIZE = 3
+
+def sample_interface_paths(interface_paths, sample_size=ESTIMATE_SAMPLE_SIZE):
+    """在接口列表中均匀抽取 sample_size 个（不足时全部返回）"""
+    if len(interface_paths) <= sample_size:
+        return list(interface_paths)
+    if sample_size <= 1:
+        return list(interface_paths[:sample_size])
+    step = (len(interface_paths) - 1) / (sample_size - 1)
+    return [interface_paths[round(i * step)] for i in range(sample_size)]
+
+def _file_size(path):
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+def project_interfaces_cost(interface_paths, prompt_template, checklist, loader, sample_size=ESTIMATE_SAMPLE_SIZE):
+    """
+    运行前估算批量评审的用量（每个接口按一次推理模型调用估算）
+
+    只解析均匀抽取的 sample_size 个接口（读取失败的跳过），其余接口的提示 token 按
+    “固定部分 + 抽样得到的每字节 token 数 × 文件大小”外推，不在首次调用前完整解析全部接口。
+    """
+    from budget import project_run_cost, estimate_cost
+
+    model_name = get_reviewer_config().model_name
+    item_count = len(checklist.items)
+    sample = sample_interface_paths(interface_paths, sample_size)
+    parsed = []
+
+    def prompts():
+        for path in sample:
+            try:
+                df_requirements = loader(path)
+            except Exception:
+                continue
+            if len(df_requirements):
+                parsed.append(path)
+                requirement_blocks, facts = prepare_interface(df_requirements)
+                yield render_review_prompt(prompt_template, checklist.text, "".join(requirement_blocks),
+                                           facts=facts and facts.format())
+
+    projection = project_run_cost(prompts(), model_name, item_count)
+    rest = [path for path in interface_paths if path not in sample]
+    sample_bytes = sum(_file_size(path) for path in parsed)
+    if not rest or not parsed or not sample_bytes:
+        return projection, model_name
+
+    # 每次调用的固定部分（模板与检查单）与输出，再按需求文本的字节数外推
+    base = project_run_cost([render_review_prompt(prompt_template, checklist.text, "")], model_name, item_count)
+    per_byte = max(0, projection['prompt_tokens'] - projection['calls'] * base['prompt_tokens']) / sample_bytes
+    prompt_tokens = projection['prompt_tokens'] + len(rest) * base['prompt_tokens'] + round(
+        per_byte * sum(_file_size(path) for path in rest))
+    completion_tokens = projection['completion_tokens'] + len(rest) * base['completion_tokens']
+    return {
+        'calls': projection['calls'] + len(rest),
+        'prompt_tokens': prompt_tokens,
+        'completion_tokens': completion_tokens,
+        'cost': estimate_cost(model_name, prompt_tokens, completion_tokens),
+        'sampled': len(parsed),
+    }, model_name
+
+def measure_interfaces_savings(interface_paths, prompt_template, checklist, loader, sample_size=ESTIMATE_SAMPLE_SIZE):
+    """
+    紧凑提示相对 markdown 模板的 token 节省
+
+    只测量均匀抽取的 sample_size 个接口（None 表示全部，读取失败的跳过），逐个读取并渲染两种格式，
+    只保留渲染后的需求文本，不保留需求表格。
+    """
+    from prompt_format import measure_savings, PROMPT_FORMATS
+
+    sample = list(interface_paths) if sample_size is None else sample_interface_paths(interface_paths, sample_size)
+    texts = {prompt_format: [] for prompt_format in PROMPT_FORMATS}
+    for path in sample:
+        try:
+            df_requirements = loader(path)
+        except Exception:
+            continue
+        if len(df_requirements):
+            for prompt_format in PROMPT_FORMATS:
+                texts[prompt_format].append("".join(prepare_interface(df_requirements, prompt_format=prompt_format)[0]))
+    savings = measure_savings(prompt_template, checklist.text, lambda prompt_format: texts[prompt_format])
+    if len(sample) < len(interface_paths):
+        savings['sampled'] = len(interface_paths)
+    return savings
+
+def list_interface_files(interfaces_dir):
+    """列出接口需求集合目录下的所有Excel文件"""
+    return [f for f in os.listdir(interfaces_dir) if f.endswith('.xlsx')]
+
+def review_interface(interface_path, results_dir, prompt_template, checklist, main_log_file,
+                     store=None, run_id=None, cascade=False, logger=None, loader=None, lease_check=None):
+    """
+    评审单个接口需求文件（logger 为空时使用临时的缓冲日志，返回前落盘）
     
-    # 创建结果目录（如果不存在）
+    loader 为读取需求表格的函数（例如 ReadAhead.get），默认经由输入缓存读取；
+    lease_check 为写入结果前调用的函数，返回 False 时不写入结果（队列 worker 的租约已被回收）
+    
+    Returns:
+        (状态, 汇总记录)，见 _review_interface
+    """
+    from run_logger import RunLogger
+    from input_cache import load_requirements
+
+    loader = loader or load_requirements
+    if logger is not None:
+        return _review_interface(interface_path, results_dir, prompt_template, checklist, main_log_file,
+                                 store, run_id, cascade, logger, loader, lease_check)
+    with RunLogger() as own_logger:
+        return _review_interface(interface_path, results_dir, prompt_template, checklist, main_log_file,
+                                 store, run_id, cascade, own_logger, loader, lease_check)
+
+def _review_interface(interface_path, results_dir, prompt_template, checklist, main_log_file,
+                      store, run_id, cascade, logger, loader, lease_check=None):
+    """
+    评审单个接口需求文件
+    
+    如果提供 store 与 run_id，评审结果同时写入评审结果库；
+    cascade 为 True 时先由快速模型评审，只把失败/不确定的检查条目交给推理模型复核
+    
+    Returns:
+        (状态, 汇总记录)，状态为 'success' / 'save_failed' / 'read_failed' / 'empty' / 'budget_exceeded' /
+        'lease_lost'，汇总记录在未完成评审时为 None
+    """
+    import pandas as pd
+
+    interface_file = os.path.basename(interface_path)
+    interface_name = os.path.splitext(interface_file)[0]
+    output_file = f"评审结果-{interface_name}.xlsx"
+    output_path = os.path.join(results_dir, output_file)
+    
+    # 为每个接口创建单独的日志文件
+    interface_log_file = os.path.join(results_dir, f"评审日志-{interface_name}.txt")
+    
+    # 读取需求文件
+    try:
+        with span('read_sheet', interface=interface_name):
+            df_requirements = loader(interface_path)
+    except Exception as e:
+        error_msg = f"❌ 读取接口文件失败: {interface_file}, 错误: {str(e)}"
+        print(error_msg)
+        logger.write(main_log_file, f"{error_msg}\n")
+        logger.event('interface_read_failed', interface=interface_name, error=str(e))
+        return 'read_failed', None
+    
+    # 获取需求数量
+    total_requirements = len(df_requirements)
+    if total_requirements == 0:
+        warning_msg = f"⚠️ 接口 {interface_name} 的需求表格为空！跳过处理。"
+        print(warning_msg)
+        logger.write(main_log_file, f"{warning_msg}\n")
+        logger.event('interface_empty', interface=interface_name)
+        return 'empty', None
+    
+    # 记录接口处理开始
+    interface_start_time = time.time()
+    logger.start_file(
+        interface_log_file,
+        f"接口需求集合评审开始时间: {time.strftime('%Y-%m-%d %H:%M:%S')}\n"
+        f"接口名称: {interface_name}\n"
+        f"需求数量: {total_requirements}\n"
+        + "-"*50 + "\n"
+    )
+    logger.event('interface_start', interface=interface_name, requirements=total_requirements)
+    
+    # 逐条构建接口需求文本，并在本地分析原型与数值范围生成接口事实表
+    requirement_blocks, facts = prepare_interface(df_requirements, show_progress=True)
+    facts_text = facts and facts.format()
+    
+    print(f"\n\n✅ 需求收集完成，共 {total_requirements} 条需求")
+    if facts:
+        print(f"🔎 接口事实表: {len(facts.prototypes)} 个函数原型，{len(facts.ranges)} 项数值范围，"
+              + (f"发现 {len(facts.issues)} 处一致性问题" if facts.issues else "未发现一致性问题"))
+    
+    # 构造完整提示（分段评审时每段都附带完整接口的事实表）
+    def render_prompt(checklist_text, requirement_text):
+        with span('render_prompt'):
+            return render_review_prompt(prompt_template, checklist_text, requirement_text, facts=facts_text)
+    
+    # 超出上下文预算的接口按需求分段评审
+    with span('token_budget'):
+        segments = split_requirement_blocks(requirement_blocks, render_prompt, checklist, cascade)
+    if len(segments) > 1:
+        print(f"✂️ 接口提示超出上下文预算，拆分为 {len(segments)} 段评审")
+    
+    # 记录开始评审时间
+    review_start_time = time.time()
+    print("🚀 开始调用评审服务...")
+    
+    # 调用评审服务（按接口累计用量，接口预算用尽后的调用被拒绝）
+    governor = get_budget_governor()
+    governor.begin_interface(interface_name)
+    outcomes = []
+    try:
+        for segment in segments:
+            requirement_text = "".join(segment)
+            escalated = []
+            if cascade:
+                review_result, tier, escalated = cascade_review(
+                    lambda checklist_text: render_prompt(checklist_text, requirement_text),
+                    checklist,
+                    lambda prompt: call_reviewer(prompt, config=get_fast_config()),
+                    call_reviewer
+                )
+                print(f"🪜 级联评审层级: {tier}" + (f"，复核条目: {', '.join(escalated)}" if escalated else ""))
+            else:
+                review_result, tier = call_reviewer(render_prompt(checklist.text, requirement_text)), TIER_REASONER
+            outcomes.append((review_result, tier, escalated))
+    finally:
+        usage = governor.end_interface()
+    
+    # 预算用尽导致评审不完整：不保存结果，留待下次运行
+    if usage['refused']:
+        budget_msg = (f"⏸️ 接口 {interface_name} 因预算用尽未完成评审"
+                      f"（已用 {usage['tokens']} token，约 ¥{usage['cost']:.2f}）")
+        print(budget_msg)
+        logger.write(main_log_file, f"{budget_msg}\n")
+        logger.event('interface_budget_exceeded', interface=interface_name,
+                     tokens=usage['tokens'], cost=round(usage['cost'], 4))
+        return 'budget_exceeded', None
+    
+    # 投票评审的一致度（分段评审合并后不保留一致度行，取各段平均值）
+    votes = [vote for vote in (parse_agreement(outcome[0]) for outcome in outcomes) if vote]
+    agreement = round(sum(vote[0] for vote in votes) / len(votes), 2) if votes else None
+    
+    if len(outcomes) == 1:
+        review_result, tier, escalated = outcomes[0]
+    else:
+        review_result, tier, escalated = merge_segment_outcomes(outcomes, segments)
+    
+    # 计算评审耗时
+    review_time = time.time() - review_start_time
+    
+    # 提取评审结果中的关键信息
+    result_match = re.search(r'\[评审结果\](.*?)(?=\[\/评审结果\]|$)', review_result, re.DOTALL)
+    if result_match:
+        review_content = result_match.group(1).strip()
+    else:
+        review_content = review_result
+    
+    # 统计各类结果数量
+    with span('regex_count'):
+        failure_count = len(re.findall(r'\b失败\b', review_content))
+        uncertain_count = len(re.findall(r'\b不确定\b', review_content))
+        not_applicable_count = len(re.findall(r'\b不适用\b', review_content))
+        pass_count = len(re.findall(r'\b通过\b', review_content))
+        extra_issues_count = len(re.findall(r'\b额外问题\b', review_content))
+    
+    # 汇总记录
+    summary = {
+        '接口名称': interface_name,
+        '需求数量': total_requirements,
+        '失败': failure_count,
+        '不确定': uncertain_count,
+        '不适用': not_applicable_count,
+        '通过': pass_count,
+        '额外问题': extra_issues_count,
+        '评审耗时(秒)': round(review_time, 2),
+        '评审层级': tier
+    }
+    
+    # 创建评审结果记录
+    result = dict(summary, 评审结果=review_content)
+    
+    # 记录接口日志
+    with span('log_write'):
+        logger.write(
+            interface_log_file,
+            f"接口评审完成时间: {time.strftime('%Y-%m-%d %H:%M:%S')}\n"
+            f"评审耗时: {review_time:.2f}秒\n"
+            f"评审摘要: 失败={failure_count}, 不确定={uncertain_count}, "
+            f"不适用={not_applicable_count}, 通过={pass_count}, 额外问题={extra_issues_count}\n"
+            + (f"评审层级: {tier}，复核条目: {', '.join(escalated)}\n" if escalated else "")
+            + (f"接口事实表:\n{facts_text}\n" if facts_text else "")
+            + "-"*50 + "\n"
+            f"详细评审结果:\n{review_content}\n"
+            + "="*80 + "\n"
+        )
+    
+    if lease_check is not None and not lease_check():
+        print(f"⚠️ 接口 {interface_name} 的租约已被回收，不写入评审结果")
+        logger.event('interface_lease_lost', interface=interface_name)
+        return 'lease_lost', None
+    
+    if store is not None:
+        try:
+            with span('results_store'):
+                store.add_result(run_id, result, interface=interface_name, review_text=review_content)
+        except Exception as e:
+            print(f"⚠️ 写入评审结果库失败: {str(e)}")
+    
+    # 保存评审结果
+    result_df = pd.DataFrame([result])
+    
+    # 尝试保存
+    save_success = False
+    for save_retry in range(3):
+        try:
+            with span('safe_save_to_excel'):
+                saved = safe_save_to_excel(result_df, output_path)
+            if saved:
+                save_success = True
+                break
+            else:
+                print(f"保存失败，{2}秒后重试 ({save_retry+1}/3)...")
+                time.sleep(2)
+        except Exception as e:
+            print(f"保存异常: {str(e)}，{2}秒后重试...")
+            time.sleep(2)
+    
+    if save_success:
+        print(f"✅ 接口 {interface_name} 评审结果已保存")
+    else:
+        print(f"❌ 接口 {interface_name} 保存失败，创建紧急备份...")
+        # 写入紧急备份
+        backup_path = output_path.replace(".xlsx", "_紧急备份.csv")
+        result_df.to_csv(backup_path, index=False)
+        print(f"⚠️ 已创建紧急备份: {backup_path}")
+    
+    # 计算接口处理耗时
+    interface_time = time.time() - interface_start_time
+    
+    # 记录到主日志
+    with span('log_write'):
+        logger.write(
+            main_log_file,
+            f"接口 {interface_name} 处理完成\n"
+            f"  需求数量: {total_requirements}\n"
+            f"  处理耗时: {interface_time:.2f}秒\n"
+            f"  评审结果: 失败={failure_count}, 不确定={uncertain_count}, "
+            f"不适用={not_applicable_count}, 通过={pass_count}, 额外问题={extra_issues_count}\n"
+            + "-"*50 + "\n"
+        )
+        logger.event(
+            'interface_done', interface=interface_name, requirements=total_requirements,
+            saved=save_success, tier=tier, escalated=escalated, segments=len(segments),
+            review_seconds=round(review_time, 2), seconds=round(interface_time, 2),
+            tokens=usage['tokens'], cost=round(usage['cost'], 4),
+            fail=failure_count, uncertain=uncertain_count, not_applicable=not_applicable_count,
+            passed=pass_count, extra_issues=extra_issues_count, agreement=agreement,
+            facts_issues=len(facts.issues) if facts else None
+        )
+    
+    # 显示接口处理摘要
+    print(f"\n📋 接口 {interface_name} 处理完成!")
+    print(f"⏱️ 处理耗时: {format_elapsed_time(interface_time)}")
+    print(f"💰 用量: {usage['tokens']} token，约 ¥{usage['cost']:.2f}")
+    if agreement is not None:
+        print(f"🗳️ 投票一致度: {agreement:.2f}" + ("（结论不稳定，建议人工复核）" if agreement < LOW_AGREEMENT else ""))
+    print(f"📈 评审结果:")
+    print(f"   ❌ 失败: {failure_count}")
+    print(f"   ❓ 不确定: {uncertain_count}")
+    print(f"   ➖ 不适用: {not_applicable_count}")
+    print(f"   ✅ 通过: {pass_count}")
+    print(f"   ⚠️ 额外问题: {extra_issues_count}")
+    print(f"📝 日志文件: {interface_log_file}")
+    print(f"💾 结果文件: {output_path}")
+    
+    # 显示简短评审结果摘要
+    print("\n📋 评审结果摘要:")
+    print("-"*50)
+    short_review = review_content[:500] + "..." if len(review_content) > 500 else review_content
+    print(short_review)
+    
+    return ('success' if save_success else 'save_failed'), summary
+
+def save_summary(summary_results, results_dir):
+    """保存接口评审汇总（流式写入临时文件再替换，多个 worker 同时合并也不会写坏文件）"""
+    from xlsx_stream import write_rows_streaming
+
+    summary_path = os.path.join(results_dir, "接口评审汇总.xlsx")
+    temp_path = os.path.join(results_dir, f".接口评审汇总-{os.getpid()}.xlsx")
+    temp_root, summary_root = os.path.splitext(temp_path)[0], os.path.splitext(summary_path)[0]
+    # 写出的每个文件（拆分时为 _part2 等）都替换到对应的正式文件名
+    for path in write_rows_streaming(temp_path, SUMMARY_COLUMNS, summary_results):
+        os.replace(path, summary_root + path[len(temp_root):])
+    return summary_path
+
+def get_default_queue_path(results_dir):
+    """默认任务队列数据库位置（与评审结果放在同一共享目录）"""
+    return os.path.join(results_dir, "评审队列.db")
+
+def merge_queue_summary(queue, results_dir):
+    """把队列中所有已完成任务的汇总合并写入 接口评审汇总.xlsx"""
+    summary_results = [r['summary'] for r in queue.results() if r.get('summary')]
+    if not summary_results:
+        return None
+    return save_summary(summary_results, results_dir)
+
+def run_worker(queue_path=None, worker_id=None, lease_seconds=600, poll_interval=10, cascade=None, requeue=False):
+    """
+    以队列 worker 身份运行批量评审
+    
+    多个主机/进程可同时对同一个共享目录运行本函数：每个 worker 以租约领取接口，
+    处理期间后台续约；进程崩溃后租约过期，接口会被其他 worker 重新领取。
+    队列清空后由完成最后一个任务的 worker 合并生成 接口评审汇总.xlsx。
+    cascade 为空时读取 REVIEW_CASCADE 环境变量。
+    任务按接口文件名登记并记录内容哈希，内容变化的接口重新排队；requeue 为 True 时全部重新评审。
+    """
+    from job_queue import JobQueue, LeaseKeeper, default_worker_id
+    from input_cache import file_sha256
+    from results_store import ResultsStore
+    from run_logger import RunLogger
+
+    # 批量评审使用 bulk 通道，不挤占交互式评审的限速额度
+    set_default_lane('bulk')
+    paths = get_batch_paths()
+    interfaces_dir = paths['interfaces_dir']
+    results_dir = paths['results_dir']
     os.makedirs(results_dir, exist_ok=True)
     
-    # 文件存在性检查
-    for path in [interfaces_dir, prompt_file, checklist_file]:
+    for path in [interfaces_dir, paths['prompt_file'], paths['checklist_file']]:
         if not os.path.exists(path):
             raise FileNotFoundError(f"必要文件/文件夹缺失: {path}")
 
-    # 读取提示模板
-    with open(prompt_file, 'r', encoding='utf-8') as f:
-        base_prompt = f.read()
+    prompt_template, checklist = load_prompt_template(paths['prompt_file'], paths['checklist_file'])
+    cascade = is_cascade_enabled() if cascade is None else cascade
+    worker_id = worker_id or default_worker_id()
+    queue_path = queue_path or get_default_queue_path(results_dir)
+    queue = JobQueue(queue_path, lease_seconds=lease_seconds)
+    
+    # 每个 worker 都可以安全地登记任务，内容未变的已有接口保持原状态（哈希在登记事务外计算）
+    jobs = [(f, {'file': f, 'sha256': file_sha256(os.path.join(interfaces_dir, f))})
+            for f in list_interface_files(interfaces_dir)]
+    added = queue.enqueue(jobs, reset=requeue)
+    
+    # 每个 worker 使用独立的主日志，避免互相覆盖
+    main_log_file = os.path.join(results_dir, f"评审总日志-{worker_id}.txt")
+    logger = RunLogger(jsonl_path=os.path.join(results_dir, f"评审总日志-{worker_id}.jsonl"))
+    logger.start_file(logger.jsonl_path)
+    logger.start_file(
+        main_log_file,
+        f"Worker {worker_id} 开始时间: {time.strftime('%Y-%m-%d %H:%M:%S')}\n"
+        f"任务队列: {queue_path}\n"
+        + "="*80 + "\n\n"
+    )
+    logger.event('run_start', mode='worker', worker_id=worker_id, queue=queue_path, added=added)
+
+    print(f"\n{'='*80}")
+    print(f"Worker {worker_id} 已连接任务队列: {queue_path}")
+    print(f"新登记接口: {added}，队列状态: {queue.counts()}")
+    print(f"{'='*80}\n")
+
+    start_time = time.time()
+    processed_count = 0
+    
+    # 每个 worker 作为一次独立运行登记到评审结果库
+    store = ResultsStore()
+    run_id = store.start_run('worker', get_reviewer_config(), source=queue_path)
+    
+    governor = get_budget_governor()
+    budget_stopped = False
+    while True:
+        # 运行预算用尽：不再领取任务，未领取的接口留在队列中
+        if governor.should_stop():
+            budget_stopped = True
+            print("⏸️ 运行预算已用尽，停止领取任务")
+            break
+        job = queue.claim(worker_id)
+        if job is None:
+            if queue.is_drained():
+                break
+            # 其他 worker 仍持有租约，等待其完成或租约过期后回收
+            time.sleep(poll_interval)
+            continue
+        
+        interface_file = job.payload['file']
+        print(f"\n{'='*80}")
+        print(f"领取接口: {os.path.splitext(interface_file)[0]} (第 {job.attempts} 次尝试)")
+        print(f"{'='*80}")
+        
+        with LeaseKeeper(queue, job, worker_id) as keeper:
+            # 写入结果前同步续约一次：租约已被回收（或接口内容变化后重新排队）时不写入结果文件与结果库
+            def lease_check():
+                return not keeper.lost and queue.heartbeat(job.job_id, worker_id)
+
+            try:
+                status, summary = review_interface(
+                    os.path.join(interfaces_dir, interface_file), results_dir, prompt_template, checklist,
+                    main_log_file, store=store, run_id=run_id, cascade=cascade, logger=logger,
+                    lease_check=lease_check
+                )
+            except Exception as e:
+                print(f"❌ 接口 {interface_file} 处理异常: {str(e)}")
+                logger.event('interface_error', interface=interface_file, error=str(e))
+                queue.fail(job.job_id, worker_id, str(e))
+                continue
+            finally:
+                # 每个任务结束后落盘，worker 中途退出时日志不丢失
+                logger.flush()
+        
+        if keeper.lost or status == 'lease_lost':
+            print(f"⚠️ 接口 {interface_file} 的租约已被回收，结果不计入汇总")
+            continue
+        
+        if status in ('read_failed', 'save_failed'):
+            # 保存失败的接口回到队列重试，超过最大尝试次数后记为最终失败
+            queue.fail(job.job_id, worker_id, status)
+        elif status == 'budget_exceeded':
+            # 接口本身没有失败，放回队列由之后的运行处理
+            queue.release(job.job_id, worker_id, status)
+        else:
+            queue.complete(job.job_id, worker_id, {'status': status, 'summary': summary})
+            processed_count += 1
+
+    store.finish_run(run_id)
+    store.close()
+    summary_path = merge_queue_summary(queue, results_dir)
+    total_time = time.time() - start_time
+    logger.event('run_end', worker_id=worker_id, processed=processed_count, seconds=round(total_time, 2),
+                 budget_stopped=budget_stopped, cost=round(governor.report()['cost'], 4))
+    logger.close()
+    
+    print("\n" + "="*80)
+    print(f"✅ Worker {worker_id} 完成!")
+    print(f"✔️ 本 worker 处理接口: {processed_count}")
+    print(f"📋 队列状态: {queue.counts()}")
+    for key, error in queue.failures():
+        print(f"❌ 最终失败: {key} ({error})")
+    print(f"⏱️ 总耗时: {format_elapsed_time(total_time)}")
+    hedger = get_hedger()
+    if hedger is not None:
+        print(f"🛡️ {hedger.format_report()}")
+    for limiter in get_rate_limiters():
+        print(f"🚦 {limiter.format_report()}")
+    if is_structured():
+        print(f"🧾 {get_structured_stats().format_report()}")
+    print(f"💰 {governor.format_report()}")
+    if summary_path:
+        print(f"💾 合并汇总: {summary_path}")
+    print("="*80)
+
+def load_watch_state(state_path):
+    """读取监视状态：{接口文件名: {'sha256', 'size', 'mtime_ns', 'status', 'summary', 'reviewed_at'}}"""
+    import json
+    try:
+        with open(state_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_watch_state(state_path, state):
+    """原子写入监视状态"""
+    import json
+    temp_path = f"{state_path}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(state, f, ensure_ascii=False, indent=2, default=str)
+    os.replace(temp_path, state_path)
+
+def load_existing_summaries(results_dir):
+    """读取已有的 接口评审汇总.xlsx（例如之前批量评审的结果），按接口文件名索引"""
+    summary_path = os.path.join(results_dir, "接口评审汇总.xlsx")
+    if not os.path.exists(summary_path):
+        return {}
+    import pandas as pd
+    try:
+        df = pd.read_excel(summary_path, engine='openpyxl')
+    except Exception as e:
+        print(f"⚠️ 读取已有汇总失败，将重新生成: {str(e)}")
+        return {}
+    summaries = {}
+    for row in df.to_dict('records'):
+        summaries[f"{row['接口名称']}.xlsx"] = {column: row.get(column) for column in SUMMARY_COLUMNS}
+    return summaries
+
+def run_watch(debounce=10.0, poll_interval=5.0, rescan_interval=600.0, force_polling=False,
+              cascade=None, skip_existing=False, once=False):
+    """
+    监视 接口需求集合/，只评审新增或内容变化的接口文件
+    
+    文件在 debounce 秒内大小与修改时间都不再变化、且是完整的 xlsx（zip）后才评审，避免读到写了一半的文件；
+    修改时间变化但内容哈希未变的文件不会重新评审。每评审完一个接口即更新 接口评审汇总.xlsx，
+    已评审文件的哈希与汇总保存在 评审结果/监视状态.json，重启后不会重复评审。
+    
+    Args:
+        debounce: 文件稳定多少秒后开始评审
+        poll_interval: 轮询模式的扫描间隔（秒）
+        rescan_interval: inotify 模式下的全量扫描间隔（秒），防止遗漏事件
+        force_polling: 不使用 inotify
+        cascade: 是否启用两级模型级联评审，默认读取 REVIEW_CASCADE
+        skip_existing: 把启动时已存在的文件记为已评审（不调用大模型），只处理之后的变化
+        once: 处理完启动时发现的变化后退出（适合定时任务）
+    """
+    import zipfile
+    from folder_watch import create_watcher, is_temporary_file, file_signature
+    from input_cache import file_sha256
+    from results_store import ResultsStore
+    from run_logger import RunLogger
+
+    set_default_lane('bulk')
+
+    paths = get_batch_paths()
+    interfaces_dir = paths['interfaces_dir']
+    results_dir = paths['results_dir']
+    os.makedirs(results_dir, exist_ok=True)
+    
+    for path in [interfaces_dir, paths['prompt_file'], paths['checklist_file']]:
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"必要文件/文件夹缺失: {path}")
+
+    prompt_template, checklist = load_prompt_template(paths['prompt_file'], paths['checklist_file'])
+    cascade = is_cascade_enabled() if cascade is None else cascade
+    
+    # 已评审文件的状态与各接口汇总（首次运行时沿用已有的汇总工作簿）
+    state_path = os.path.join(results_dir, "监视状态.json")
+    state = load_watch_state(state_path)
+    summaries = load_existing_summaries(results_dir)
+    summaries.update({name: entry['summary'] for name, entry in state.items() if entry.get('summary')})
+    
+    def is_interface_file(name):
+        return name.endswith('.xlsx') and not is_temporary_file(name)
+    
+    def current_files():
+        return {name for name in os.listdir(interfaces_dir) if is_interface_file(name)}
+    
+    def remember(name, sha256, signature, status, summary=None):
+        state[name] = {
+            'sha256': sha256, 'size': signature[0], 'mtime_ns': signature[1], 'status': status,
+            'summary': summary, 'reviewed_at': time.strftime('%Y-%m-%d %H:%M:%S'),
+        }
+        save_watch_state(state_path, state)
+    
+    if skip_existing:
+        for name in sorted(current_files() - set(state)):
+            path = os.path.join(interfaces_dir, name)
+            remember(name, file_sha256(path), file_signature(path), 'baseline', summaries.get(name))
+        print(f"📌 已把 {len(state)} 个现有接口文件记为已评审")
+    
+    main_log_file = os.path.join(results_dir, "评审监视日志.txt")
+    logger = RunLogger(jsonl_path=os.path.join(results_dir, "评审监视日志.jsonl"))
+    store = ResultsStore()
+    run_id = store.start_run('watch', get_reviewer_config(), source=interfaces_dir)
+    watcher = create_watcher(interfaces_dir, poll_interval, force_polling)
+    governor = get_budget_governor()
+    logger.write(main_log_file, f"监视开始时间: {time.strftime('%Y-%m-%d %H:%M:%S')}（{watcher.kind}）\n")
+    logger.event('watch_start', run_id=run_id, watcher=watcher.kind, known=len(state), cascade=bool(cascade))
+    
+    print(f"\n{'='*80}")
+    print(f"👀 正在监视: {interfaces_dir}（{'inotify' if watcher.kind == 'inotify' else f'每 {poll_interval:g} 秒轮询'}，"
+          f"写入稳定 {debounce:g} 秒后评审）")
+    print(f"已评审接口: {len(state)}，按 Ctrl+C 停止")
+    print(f"{'='*80}\n")
+    
+    reviewed_count = 0
+    unchanged_count = 0
+    candidates = current_files() | set(state)
+    pending = {}          # 文件名 -> (签名, 签名最近变化的时间)
+    last_rescan = time.time()
+    start_time = time.time()
+    
+    def handle_removed(name):
+        known = state.pop(name, None)
+        summary = summaries.pop(name, None)
+        if known is not None or summary is not None:
+            save_watch_state(state_path, state)
+            save_summary(list(summaries.values()), results_dir)
+            print(f"🗑️ 接口文件已删除，已从汇总中移除: {name}")
+            logger.event('interface_removed', interface=name)
+    
+    def review_ready(name):
+        nonlocal reviewed_count, unchanged_count
+        path = os.path.join(interfaces_dir, name)
+        signature = file_signature(path)
+        sha256 = file_sha256(path)
+        known = state.get(name)
+        if known and known['sha256'] == sha256:
+            # 只是修改时间变化（例如重新导出了相同内容），不重新评审
+            if (known['size'], known['mtime_ns']) != signature:
+                remember(name, sha256, signature, known['status'], known.get('summary'))
+                unchanged_count += 1
+                print(f"⏭️ 内容未变化，跳过: {name}")
+                logger.event('interface_unchanged', interface=name)
+            return
+        
+        print(f"\n{'='*80}")
+        print(f"{'🆕 新增' if known is None else '✏️ 变化'}接口: {os.path.splitext(name)[0]}")
+        print(f"{'='*80}")
+        logger.event('change_detected', interface=name, new=known is None)
+        try:
+            status, summary = review_interface(
+                path, results_dir, prompt_template, checklist, main_log_file,
+                store=store, run_id=run_id, cascade=cascade, logger=logger
+            )
+        except Exception as e:
+            print(f"❌ 接口 {name} 处理异常: {str(e)}")
+            logger.event('interface_error', interface=name, error=str(e))
+            status, summary = 'error', None
+        finally:
+            logger.flush()
+        if status == 'budget_exceeded':
+            # 未完成评审，不记录状态，下次启动时重新评审
+            return
+        # 同一内容读取或评审失败后不再重试，文件再次变化时才重新评审
+        remember(name, sha256, signature, status, summary)
+        if summary is not None:
+            summaries[name] = summary
+            with span('save_summary'):
+                summary_path = save_summary(list(summaries.values()), results_dir)
+            reviewed_count += 1
+            print(f"📊 汇总已更新: {summary_path}")
+        elif summaries.pop(name, None) is not None:
+            # 旧版本的汇总已不代表当前文件
+            save_summary(list(summaries.values()), results_dir)
+    
+    def reject_invalid(name, signature):
+        # 写入稳定后仍不是完整的 xlsx（文件损坏或改了扩展名）：记为读取失败，文件再次变化时才重新处理
+        path = os.path.join(interfaces_dir, name)
+        print(f"❌ 不是有效的 xlsx 文件，跳过: {name}（文件再次变化后重新处理）")
+        logger.event('interface_read_failed', interface=name, error='not a valid xlsx (zip) file')
+        remember(name, file_sha256(path), signature, 'read_failed')
+        if summaries.pop(name, None) is not None:
+            save_summary(list(summaries.values()), results_dir)
+    
+    try:
+        while True:
+            now = time.time()
+            for name in candidates:
+                if not is_interface_file(name):
+                    continue
+                signature = file_signature(os.path.join(interfaces_dir, name))
+                if signature is None:
+                    pending.pop(name, None)
+                    handle_removed(name)
+                    continue
+                known = state.get(name)
+                if known and (known['size'], known['mtime_ns']) == signature:
+                    continue
+                if name not in pending or pending[name][0] != signature:
+                    # 稳定时间从最后修改时刻算起，启动时已写完的文件无需再等待
+                    pending[name] = (signature, min(now, signature[1] / 1e9))
+            candidates = set()
+            
+            # 签名在去抖时间内保持不变且是完整的 xlsx 才评审
+            for name, (signature, since) in sorted(pending.items()):
+                path = os.path.join(interfaces_dir, name)
+                current = file_signature(path)
+                if current != signature:
+                    if current is None:
+                        pending.pop(name)
+                        handle_removed(name)
+                    else:
+                        pending[name] = (current, time.time())
+                    continue
+                if time.time() - since < debounce:
+                    continue
+                pending.pop(name)
+                if not zipfile.is_zipfile(path):
+                    reject_invalid(name, signature)
+                    continue
+                review_ready(name)
+                if governor.should_stop():
+                    break
+            
+            if governor.should_stop():
+                print("⏸️ 运行预算已用尽，停止监视")
+                break
+            if once and not pending:
+                break
+            
+            # 有待稳定的文件时按去抖间隔唤醒，否则等到下次全量扫描
+            if pending:
+                timeout = max(0.5, min(since + debounce for _, since in pending.values()) - time.time())
+            else:
+                timeout = max(0.5, last_rescan + rescan_interval - time.time())
+            candidates = watcher.wait(timeout)
+            if watcher.overflowed or time.time() - last_rescan >= rescan_interval:
+                watcher.overflowed = False
+                last_rescan = time.time()
+                candidates |= current_files() | set(state)
+    except KeyboardInterrupt:
+        print("\n⏹️ 已停止监视")
+    finally:
+        watcher.close()
+        store.finish_run(run_id)
+        store.close()
+        logger.event('watch_end', run_id=run_id, reviewed=reviewed_count, unchanged=unchanged_count,
+                     seconds=round(time.time() - start_time, 2))
+        logger.close()
+    
+    print("\n" + "="*80)
+    print(f"✔️ 本次评审接口: {reviewed_count}，内容未变化跳过: {unchanged_count}")
+    print(f"⏱️ 监视时长: {format_elapsed_time(time.time() - start_time)}")
+    print(f"💰 {governor.format_report()}")
+    print(f"📝 监视日志: {main_log_file}（结构化事件: {logger.jsonl_path}）")
+    print(f"💾 结果目录: {results_dir}")
+    print("="*80)
 
-    # 读取检查单
-    with open(checklist_file, 'r', encoding='utf-8') as f:
-        checklist = f.read()
+def main(cascade=None):
+    """
+    运行评审（由 main.py 进程内调用或直接执行本脚本）
+    
+    Args:
+        cascade: 是否启用两级模型级联评审，默认读取 REVIEW_CASCADE
+    """
+    set_default_lane('bulk')
+    paths = get_batch_paths()
+    interfaces_dir = paths['interfaces_dir']
+    results_dir = paths['results_dir']
+    
+    # 创建结果目录（如果不存在）
+    os.makedirs(results_dir, exist_ok=True)
+    
+    # 文件存在性检查
+    for path in [interfaces_dir, paths['prompt_file'], paths['checklist_file']]:
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"必要文件/文件夹缺失: {path}")
 
-    base_prompt = base_prompt.replace("[CHECKLIST]", checklist)
+    prompt_template, checklist = load_prompt_template(paths['prompt_file'], paths['checklist_file'])
+    cascade = is_cascade_enabled() if cascade is None else cascade
     
     # 获取所有接口文件
-    interface_files = [f for f in os.listdir(interfaces_dir) if f.endswith('.xlsx')]
+    interface_files = list_interface_files(interfaces_dir)
     total_interfaces = len(interface_files)
     
     if total_interfaces == 0:
         print("警告：接口需求文件夹中没有Excel文件！")
-        exit()
+        return
 
     # 初始化进度统计
     start_time = time.time()
@@ -190,13 +1160,62 @@ if __name__ == "__main__":
     # 创建汇总结果列表
     summary_results = []
     
-    # 创建主日志文件
+    # 登记到评审结果库
+    from results_store import ResultsStore
+    from run_logger import RunLogger, ProgressRenderer
+    from input_cache import ReadAhead, load_requirements, get_input_cache
+    from budget import format_projection, load_checkpoint, save_checkpoint, clear_checkpoint
+    from prompt_format import is_compact, format_savings
+    
+    # 上次运行因预算用尽停止时，跳过检查点中已完成的接口
+    checkpoint_path = os.path.join(results_dir, "预算检查点.json")
+    checkpoint = load_checkpoint(checkpoint_path)
+    resumed = {}
+    if checkpoint and checkpoint.get('source') == interfaces_dir:
+        resumed = {f: summary for f, summary in checkpoint['completed'].items() if f in interface_files}
+        summary_results.extend(resumed.values())
+        print(f"⏯️ 从检查点继续: 已完成 {len(resumed)}/{total_interfaces} 个接口（删除 {checkpoint_path} 可重新开始）")
+    pending_files = [f for f in interface_files if f not in resumed]
+    completed_summaries = dict(resumed)
+    budget_stopped = False
+    governor = get_budget_governor()
+    
+    # 运行前估算解析过的抽样接口直接交给评审循环，不再重复读取（输入缓存的命中统计也不会重复计数）
+    pending_paths = [os.path.join(interfaces_dir, f) for f in pending_files]
+    preloaded = {}
+
+    def load_sample(path):
+        if path not in preloaded:
+            preloaded[path] = load_requirements(path)
+        return preloaded[path]
+
+    # 运行前估算费用（级联评审按全部由推理模型评审估算，为上限）
+    with span('cost_projection'):
+        projection, model_name = project_interfaces_cost(pending_paths, prompt_template, checklist, load_sample)
+    print(format_projection(projection, model_name, governor))
+    if is_compact():
+        with span('prompt_savings'):
+            savings = measure_interfaces_savings(pending_paths, prompt_template, checklist, load_sample)
+        print(format_savings(savings))
+    
+    store = ResultsStore()
+    run_id = store.start_run('batch', get_reviewer_config(), source=interfaces_dir)
+    
+    # 创建主日志文件（文本日志 + JSON Lines 事件，由后台线程批量落盘）
     main_log_file = os.path.join(results_dir, "评审总日志.txt")
-    with open(main_log_file, 'w', encoding='utf-8') as log:
-        log.write(f"接口需求集合批量评审开始时间: {time.strftime('%Y-%m-%d %H:%M:%S')}\n")
-        log.write(f"接口总数: {total_interfaces}\n")
-        log.write(f"接口列表: {', '.join(interface_files)}\n")
-        log.write("="*80 + "\n\n")
+    logger = RunLogger(jsonl_path=os.path.join(results_dir, "评审总日志.jsonl"))
+    logger.start_file(logger.jsonl_path)
+    logger.start_file(
+        main_log_file,
+        f"接口需求集合批量评审开始时间: {time.strftime('%Y-%m-%d %H:%M:%S')}\n"
+        f"接口总数: {total_interfaces}\n"
+        f"接口列表: {', '.join(interface_files)}\n"
+        + "="*80 + "\n\n"
+    )
+    logger.event('run_start', mode='batch', run_id=run_id, total=total_interfaces, cascade=bool(cascade),
+                 resumed=len(resumed), projected_cost=round(projection['cost'], 4))
+    # 评审过程中还有其他输出，进度逐行打印
+    progress = ProgressRenderer(len(pending_files), unit='个接口', min_interval=0, inplace=False)
 
     print(f"\n{'='*80}")
     print(f"开始批量处理接口需求集合")
@@ -204,231 +1223,75 @@ if __name__ == "__main__":
     print(f"接口列表: {', '.join(interface_files)}")
     print(f"{'='*80}\n")
 
+    # 后台预读后续接口的需求表格，评审当前接口时下一个接口已解析完成（抽样时已读取的接口除外）
+    prefetch = ReadAhead([path for path in pending_paths if path not in preloaded], load_requirements).start()
+
+    def load_interface(path):
+        return preloaded.pop(path) if path in preloaded else prefetch.get(path)
+
     # 处理每个接口文件
-    for interface_file in interface_files:
+    for interface_file in pending_files:
+        # 运行预算用尽：在接口边界停止，写出检查点
+        if governor.should_stop():
+            budget_stopped = True
+            break
         processed_count += 1
-        interface_path = os.path.join(interfaces_dir, interface_file)
         interface_name = os.path.splitext(interface_file)[0]
-        output_file = f"评审结果-{interface_name}.xlsx"
-        output_path = os.path.join(results_dir, output_file)
-        
-        # 为每个接口创建单独的日志文件
-        interface_log_file = os.path.join(results_dir, f"评审日志-{interface_name}.txt")
         
         print(f"\n{'='*80}")
-        print(f"处理接口 {processed_count}/{total_interfaces}: {interface_name}")
+        print(f"处理接口 {processed_count + len(resumed)}/{total_interfaces}: {interface_name}")
         print(f"{'='*80}")
         
-        # 读取需求文件
-        try:
-            df_requirements = pd.read_excel(interface_path, engine='openpyxl')
-        except Exception as e:
-            error_msg = f"❌ 读取接口文件失败: {interface_file}, 错误: {str(e)}"
-            print(error_msg)
-            with open(main_log_file, 'a', encoding='utf-8') as log:
-                log.write(f"{error_msg}\n")
-            failed_count += 1
-            continue
-        
-        # 获取需求数量
-        total_requirements = len(df_requirements)
-        if total_requirements == 0:
-            warning_msg = f"⚠️ 接口 {interface_name} 的需求表格为空！跳过处理。"
-            print(warning_msg)
-            with open(main_log_file, 'a', encoding='utf-8') as log:
-                log.write(f"{warning_msg}\n")
-            continue
-        
-        # 记录接口处理开始
-        interface_start_time = time.time()
-        with open(interface_log_file, 'w', encoding='utf-8') as log:
-            log.write(f"接口需求集合评审开始时间: {time.strftime('%Y-%m-%d %H:%M:%S')}\n")
-            log.write(f"接口名称: {interface_name}\n")
-            log.write(f"需求数量: {total_requirements}\n")
-            log.write("-"*50 + "\n")
-        
-        # 构建接口需求集合字符串
-        requirement_text = ""
-        
-        # 收集所有需求
-        for idx, row in df_requirements.iterrows():
-            config_id = safe_get_value(row, '标识')
-            
-            # 显示进度
-            progress = f"正在收集需求 {idx+1}/{total_requirements}: {config_id}"
-            print(f"\r{progress}", end="", flush=True)
-            
-            requirement_text += f"""\n**需求 {idx+1} - 标识: {config_id}**
-**标题**
-{safe_get_value(row, '标题')}
-**版本信息**
-{safe_get_value(row, '版本信息')}
-**需求类型**
-{safe_get_value(row, '需求类型')}
-**是否派生的需求**
-{safe_get_value(row, '是否派生的需求')}
-**派生理由**
-{safe_get_value(row, '派生理由')}
-**接口原型**
-{safe_get_value(row, '接口原型')}
-**需求描述**
-{safe_get_value(row, '需求描述')}
-**测试建议**
-{safe_get_value(row, '测试建议')}
-**注释**
-{safe_get_value(row, '注释')}
-**作者**
-{safe_get_value(row, '作者')}\n
-"""
-        
-        print(f"\n\n✅ 需求收集完成，共 {total_requirements} 条需求")
-        
-        # 构造完整提示
-        full_prompt = base_prompt.replace("[REQUIREMENT]", requirement_text)
-        
-        # 记录开始评审时间
-        review_start_time = time.time()
-        print("🚀 开始调用评审服务...")
-        
-        # 调用评审服务
-        max_retries = 3
-        review_result = ""
-        for retry in range(max_retries):
-            try:
-                print(f"🔄 第 {retry+1} 次尝试调用评审服务...")
-                review_result = extract_valid_content(reviewer(full_prompt))
-                if "Error:" not in review_result and review_result.strip():
-                    print("✅ 评审服务调用成功")
-                    break
-                else:
-                    print(f"⚠️ 评审返回异常，{2}秒后重试 ({retry+1}/{max_retries})...")
-                    time.sleep(2)
-            except Exception as e:
-                review_result = f"❌ 评审服务异常: {str(e)}"
-                print(f"❌ 评审服务异常: {str(e)}")
-                if retry < max_retries - 1:
-                    time.sleep(3)
-        
-        # 计算评审耗时
-        review_time = time.time() - review_start_time
-        
-        # 提取评审结果中的关键信息
-        result_match = re.search(r'\[评审结果\](.*?)(?=\[\/评审结果\]|$)', review_result, re.DOTALL)
-        if result_match:
-            review_content = result_match.group(1).strip()
-        else:
-            review_content = review_result
-        
-        # 统计各类结果数量
-        failure_count = len(re.findall(r'\b失败\b', review_content))
-        uncertain_count = len(re.findall(r'\b不确定\b', review_content))
-        not_applicable_count = len(re.findall(r'\b不适用\b', review_content))
-        pass_count = len(re.findall(r'\b通过\b', review_content))
-        extra_issues_count = len(re.findall(r'\b额外问题\b', review_content))
-        
-        # 创建评审结果记录
-        result = {
-            '接口名称': interface_name,
-            '需求数量': total_requirements,
-            '失败': failure_count,
-            '不确定': uncertain_count,
-            '不适用': not_applicable_count,
-            '通过': pass_count,
-            '额外问题': extra_issues_count,
-            '评审耗时(秒)': round(review_time, 2),
-            '评审结果': review_content
-        }
-        
-        # 添加到汇总结果
-        summary_results.append({
-            '接口名称': interface_name,
-            '需求数量': total_requirements,
-            '失败': failure_count,
-            '不确定': uncertain_count,
-            '不适用': not_applicable_count,
-            '通过': pass_count,
-            '额外问题': extra_issues_count,
-            '评审耗时(秒)': round(review_time, 2)
-        })
-        
-        # 记录接口日志
-        with open(interface_log_file, 'a', encoding='utf-8') as log:
-            log.write(f"接口评审完成时间: {time.strftime('%Y-%m-%d %H:%M:%S')}\n")
-            log.write(f"评审耗时: {review_time:.2f}秒\n")
-            log.write(f"评审摘要: 失败={failure_count}, 不确定={uncertain_count}, ")
-            log.write(f"不适用={not_applicable_count}, 通过={pass_count}, 额外问题={extra_issues_count}\n")
-            log.write("-"*50 + "\n")
-            log.write(f"详细评审结果:\n{review_content}\n")
-            log.write("="*80 + "\n")
-        
-        # 保存评审结果
-        result_df = pd.DataFrame([result])
-        
-        # 尝试保存
-        save_success = False
-        for save_retry in range(3):
-            try:
-                if safe_save_to_excel(result_df, output_path):
-                    save_success = True
-                    break
-                else:
-                    print(f"保存失败，{2}秒后重试 ({save_retry+1}/3)...")
-                    time.sleep(2)
-            except Exception as e:
-                print(f"保存异常: {str(e)}，{2}秒后重试...")
-                time.sleep(2)
-        
-        if save_success:
+        progress.started()
+        status, summary = review_interface(
+            os.path.join(interfaces_dir, interface_file), results_dir, prompt_template, checklist,
+            main_log_file, store=store, run_id=run_id, cascade=cascade, logger=logger,
+            loader=load_interface
+        )
+        progress.finished(success=status == 'success')
+        progress.render(latest=interface_name)
+        if status == 'success':
             success_count += 1
-            print(f"✅ 接口 {interface_name} 评审结果已保存")
-        else:
+        elif status in ('save_failed', 'read_failed'):
             failed_count += 1
-            print(f"❌ 接口 {interface_name} 保存失败，创建紧急备份...")
-            # 写入紧急备份
-            backup_path = output_path.replace(".xlsx", "_紧急备份.csv")
-            result_df.to_csv(backup_path, index=False)
-            print(f"⚠️ 已创建紧急备份: {backup_path}")
-        
-        # 计算接口处理耗时
-        interface_time = time.time() - interface_start_time
-        
-        # 记录到主日志
-        with open(main_log_file, 'a', encoding='utf-8') as log:
-            log.write(f"接口 {interface_name} 处理完成\n")
-            log.write(f"  需求数量: {total_requirements}\n")
-            log.write(f"  处理耗时: {interface_time:.2f}秒\n")
-            log.write(f"  评审结果: 失败={failure_count}, 不确定={uncertain_count}, ")
-            log.write(f"不适用={not_applicable_count}, 通过={pass_count}, 额外问题={extra_issues_count}\n")
-            log.write("-"*50 + "\n")
-        
-        # 显示接口处理摘要
-        print(f"\n📋 接口 {interface_name} 处理完成!")
-        print(f"⏱️ 处理耗时: {format_elapsed_time(interface_time)}")
-        print(f"📈 评审结果:")
-        print(f"   ❌ 失败: {failure_count}")
-        print(f"   ❓ 不确定: {uncertain_count}")
-        print(f"   ➖ 不适用: {not_applicable_count}")
-        print(f"   ✅ 通过: {pass_count}")
-        print(f"   ⚠️ 额外问题: {extra_issues_count}")
-        print(f"📝 日志文件: {interface_log_file}")
-        print(f"💾 结果文件: {output_path}")
-        
-        # 显示简短评审结果摘要
-        print("\n📋 评审结果摘要:")
-        print("-"*50)
-        short_review = review_content[:500] + "..." if len(review_content) > 500 else review_content
-        print(short_review)
+        if summary is not None:
+            summary_results.append(summary)
+            completed_summaries[interface_file] = summary
+        if status in ('read_failed', 'empty', 'budget_exceeded'):
+            continue
         
         # 添加处理间隔，避免API调用过于频繁
-        if processed_count < total_interfaces:
+        if processed_count < len(pending_files):
             print(f"\n⏳ 等待3秒后处理下一个接口...")
-            time.sleep(3)
+            with span('interval_sleep'):
+                time.sleep(3)
+
+    prefetch.close()
+    store.finish_run(run_id)
+    store.close()
+    
+    # 预算用尽（运行级停止或有接口因接口预算未完成）时写出检查点，全部完成后删除
+    unfinished = [f for f in interface_files if f not in completed_summaries]
+    budget_stopped = budget_stopped or (governor.should_stop() and bool(unfinished))
+    if budget_stopped or governor.report()['refused']:
+        save_checkpoint(checkpoint_path, {
+            'source': interfaces_dir,
+            'run_id': run_id,
+            'saved_at': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'completed': completed_summaries,
+            'spent': governor.report(),
+        })
+    elif not unfinished:
+        clear_checkpoint(checkpoint_path)
+    logger.event('run_end', run_id=run_id, processed=processed_count, succeeded=success_count,
+                 failed=failed_count, seconds=round(time.time() - start_time, 2),
+                 budget_stopped=budget_stopped, cost=round(governor.report()['cost'], 4))
+    logger.close()
 
     # 保存汇总结果
     if summary_results:
-        summary_df = pd.DataFrame(summary_results)
-        summary_path = os.path.join(results_dir, "接口评审汇总.xlsx")
-        summary_df.to_excel(summary_path, index=False)
+        with span('save_summary'):
+            summary_path = save_summary(summary_results, results_dir)
         print(f"\n✅ 接口评审汇总已保存: {summary_path}")
     
     # 最终统计
@@ -436,13 +1299,34 @@ if __name__ == "__main__":
     
     print("\n" + "="*80)
     print(f"✅ 批量处理完成!")
-    print(f"📋 接口总数: {total_interfaces}")
+    print(f"📋 接口总数: {total_interfaces}" + (f"（其中 {len(resumed)} 个来自检查点）" if resumed else ""))
     print(f"✔️ 成功处理: {success_count}")
     print(f"❌ 处理失败: {failed_count}")
     print(f"⏱️ 总耗时: {format_elapsed_time(total_time)}")
-    print(f"📊 平均速度: {total_time/total_interfaces:.2f} 秒/接口")
-    print(f"📝 主日志文件: {main_log_file}")
+    print(f"📊 平均速度: {total_time/max(processed_count, 1):.2f} 秒/接口")
+    input_cache = get_input_cache()
+    if input_cache is not None:
+        print(f"📦 {input_cache.format_report()}")
+    tracer = get_tracer()
+    if tracer is not None:
+        print("⏲️ 各步骤耗时:")
+        print(tracer.format_totals())
+    cassette = get_cassette()
+    if cassette is not None:
+        print(f"📼 {cassette.format_report()}")
+    hedger = get_hedger()
+    if hedger is not None:
+        print(f"🛡️ {hedger.format_report()}")
+    for limiter in get_rate_limiters():
+        print(f"🚦 {limiter.format_report()}")
+    if is_structured():
+        print(f"🧾 {get_structured_stats().format_report()}")
+    print(f"💰 {governor.format_report()}")
+    if unfinished and os.path.exists(checkpoint_path):
+        print(f"⏸️ 预算用尽，{len(unfinished)} 个接口未完成，检查点: {checkpoint_path}（再次运行将从检查点继续）")
+    print(f"📝 主日志文件: {main_log_file}（结构化事件: {logger.jsonl_path}）")
     print(f"💾 结果目录: {results_dir}")
+    print(f"🗄️ 结果库: {store.db_path} (运行标识 {run_id})")
     print("="*80)
     
     # 显示汇总统计
@@ -453,3 +1337,6 @@ if __name__ == "__main__":
             print(f"{result['接口名称']}: {result['需求数量']}需求, "
                   f"失败{result['失败']}, 通过{result['通过']}, "
                   f"耗时{result['评审耗时(秒)']}秒")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+"""
+运行日志与进度显示
+- RunLogger：缓冲的结构化日志，文本日志与 JSON Lines 事件先写入内存缓冲，由后台线程定期批量落盘，
+  文件句柄在运行期间保持打开；写入方法只在锁内追加缓冲，可在多线程或 asyncio 协程中直接调用
+- ProgressRenderer：限频刷新的进度显示，包含进行中数量、吞吐量与基于 EWMA 的预估剩余时间
+"""
+
+import os
+import sys
+import json
+import time
+import threading
+from collections import OrderedDict
+
+class RunLogger:
+    """
+    缓冲日志
+
+    Args:
+        jsonl_path: 结构化事件日志（JSON Lines）路径，为空时不记录事件
+        flush_interval: 后台落盘间隔（秒）
+        max_buffer: 缓冲条数超过该值时立即唤醒后台线程落盘
+        max_open_files: 同时保持打开的文本日志文件数（批量评审每个接口一个日志）
+    """
+
+    def __init__(self, jsonl_path=None, flush_interval=1.0, max_buffer=500, max_open_files=16):
+        self.jsonl_path = jsonl_path
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self.max_open_files = max_open_files
+        self._buffer = []
+        self._handles = OrderedDict()
+        self._cond = threading.Condition()
+        self._io_lock = threading.Lock()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name='run-logger', daemon=True)
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _append(self, entry):
+        with self._cond:
+            if self._closed:
+                raise ValueError("日志已关闭")
+            self._buffer.append(entry)
+            if len(self._buffer) >= self.max_buffer:
+                self._cond.notify()
+
+    def start_file(self, path, text=''):
+        """清空（新建）文本日志并写入开头内容"""
+        self._append(('truncate', path, text))
+
+    def write(self, path, text):
+        """追加文本日志"""
+        self._append(('write', path, text))
+
+    def event(self, kind, **fields):
+        """记录结构化事件"""
+        if self.jsonl_path:
+            record = {'ts': time.strftime('%Y-%m-%d %H:%M:%S'), 'event': kind}
+            record.update(fields)
+            self._append(('write', self.jsonl_path, json.dumps(record, ensure_ascii=False, default=str) + "\n"))
+
+    def _handle(self, path, mode='a'):
+        handle = self._handles.pop(path, None)
+        if handle is not None and mode == 'w':
+            handle.close()
+            handle = None
+        if handle is None:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            handle = open(path, mode, encoding='utf-8')
+        self._handles[path] = handle
+        while len(self._handles) > self.max_open_files:
+            _, oldest = self._handles.popitem(last=False)
+            oldest.close()
+        return handle
+
+    def flush(self):
+        """把缓冲写入文件"""
+        with self._cond:
+            entries, self._buffer = self._buffer, []
+        if not entries:
+            return
+        with self._io_lock:
+            touched = set()
+            for op, path, text in entries:
+                handle = self._handle(path, 'w' if op == 'truncate' else 'a')
+                handle.write(text)
+                touched.add(path)
+            for path in touched:
+                if path in self._handles:
+                    self._handles[path].flush()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if not self._closed and len(self._buffer) < self.max_buffer:
+                    self._cond.wait(self.flush_interval)
+                closed = self._closed
+            try:
+                self.flush()
+            except OSError as e:
+                print(f"⚠️ 写入日志失败: {str(e)}")
+            if closed:
+                return
+
+    def close(self):
+        """落盘剩余缓冲并关闭所有文件"""
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify()
+        self._thread.join()
+        with self._io_lock:
+            for handle in self._handles.values():
+                handle.close()
+            self._handles.clear()
+
+def format_elapsed_time(seconds):
+    """格式化耗时显示"""
+    if seconds < 60:
+        return f"{seconds:.1f}秒"
+    elif seconds < 3600:
+        return f"{seconds/60:.1f}分钟"
+    else:
+        return f"{seconds/3600:.1f}小时"
+
+class ProgressRenderer:
+    """
+    限频刷新的进度显示
+
+    Args:
+        total: 总数
+        unit: 单位（条 / 个接口）
+        min_interval: 两次刷新之间的最短间隔（秒），最后一条总会刷新
+        alpha: 完成间隔 EWMA 的平滑系数
+        inplace: 是否在终端中原地刷新同一行，默认在终端中启用；期间还有其他输出时应关闭
+    """
+
+    def __init__(self, total, unit='条', min_interval=0.5, alpha=0.3, inplace=None):
+        self.total = total
+        self.unit = unit
+        self.min_interval = min_interval
+        self.alpha = alpha
+        self.start_time = time.time()
+        self.in_flight = 0
+        self.processed = 0
+        self.succeeded = 0
+        self._ewma_interval = None
+        self._last_done = self.start_time
+        self._last_render = 0.0
+        self._lock = threading.Lock()
+        self._inplace = sys.stdout.isatty() if inplace is None else inplace
+
+    def started(self):
+        with self._lock:
+            self.in_flight += 1
+
+    def finished(self, success=True):
+        with self._lock:
+            now = time.time()
+            self.in_flight = max(0, self.in_flight - 1)
+            self.processed += 1
+            self.succeeded += 1 if success else 0
+            interval = now - self._last_done
+            self._last_done = now
+            self._ewma_interval = interval if self._ewma_interval is None else \
+                self.alpha * interval + (1 - self.alpha) * self._ewma_interval
+
+    def eta_seconds(self):
+        """按最近完成间隔的 EWMA 估算剩余时间"""
+        with self._lock:
+            if self._ewma_interval is None:
+                return None
+            return max(0, self.total - self.processed) * self._ewma_interval
+
+    def render(self, latest=None, force=False):
+        """刷新进度显示（距上次刷新不足 min_interval 时跳过）"""
+        now = time.time()
+        with self._lock:
+            done = self.processed >= self.total
+            if not force and not done and now - self._last_render < self.min_interval:
+                return
+            self._last_render = now
+            processed, succeeded, in_flight = self.processed, self.succeeded, self.in_flight
+        elapsed = now - self.start_time
+        throughput = processed / elapsed if elapsed > 0 else 0.0
+        eta = self.eta_seconds()
+        rate = succeeded / processed * 100 if processed else 0.0
+        line = (
+            f"【处理进度】{processed}/{self.total} | 进行中: {in_flight} | "
+            f"成功率: {succeeded}/{processed} ({rate:.1f}%) | "
+            f"吞吐: {throughput * 60:.1f} {self.unit}/分钟 | "
+            f"耗时: {format_elapsed_time(elapsed)} | "
+            f"预估剩余: {format_elapsed_time(eta) if eta is not None else '计算中'}"
+        )
+        if latest:
+            line += f" | 最近完成: {latest}"
+        if self._inplace:
+            # 终端中原地刷新当前行
+            print(f"\r\033[K{line}", end="" if not done else "\n", flush=True)
+        else:
+            print(line, flush=True)
@@ -0,0 +1,308 @@
+"""
+结构化评审输出
+JSON 模式下要求模型只返回紧凑的 JSON（每个检查条目一项 {id, result, reason}，外加额外问题列表），
+端点支持时同时发送 response_format（OpenAI 为严格的响应结构，DeepSeek 非推理模型为 JSON 模式）。
+回复在本地校验后转换为标准的 [评审结果] 文本，级联、分组、投票与结果统计无需改动；
+JSON 无效或缺少条目时回退到原有的文本格式提示重新评审。
+
+    REVIEW_OUTPUT_FORMAT=json               # 或命令行 --output-format json，默认 text
+    STRUCTURED_RESPONSE_FORMAT=auto         # auto / schema / json_object / none
+"""
+
+import os
+import re
+import json
+import time
+import threading
+
+from model_config import load_env
+from review_parser import VERDICTS, EXTRA_ISSUES_HEADING, format_item_line, parse_item_verdicts
+
+OUTPUT_FORMATS = ('text', 'json')
+RESPONSE_FORMAT_MODES = ('auto', 'schema', 'json_object', 'none')
+
+# 追加在评审提示末尾的输出要求
+JSON_INSTRUCTIONS = """
+
+**输出格式（本次以此为准，忽略上文的输出格式要求）**
+只输出一个 JSON 对象，不要输出 [评审结果] 标记、Markdown 代码块或其他说明：
+{"items": [{"id": "条目ID", "result": "结果", "reason": "理由"}], "extra": ["额外问题"]}
+- items：检查单中每个条目一项，不得遗漏；result 取 通过 / 失败 / 不适用 / 不确定 之一；
+  reason 用一句话（不超过 40 字）说明依据
+- extra：检查单未覆盖的额外问题，每项一句话；没有时为空数组
+"""
+
+# 严格的响应结构（OpenAI json_schema）
+RESPONSE_SCHEMA = {
+    'type': 'json_schema',
+    'json_schema': {
+        'name': 'review_result',
+        'strict': True,
+        'schema': {
+            'type': 'object',
+            'properties': {
+                'items': {
+                    'type': 'array',
+                    'items': {
+                        'type': 'object',
+                        'properties': {
+                            'id': {'type': 'string'},
+                            'result': {'type': 'string', 'enum': VERDICTS},
+                            'reason': {'type': 'string'},
+                        },
+                        'required': ['id', 'result', 'reason'],
+                        'additionalProperties': False,
+                    },
+                },
+                'extra': {'type': 'array', 'items': {'type': 'string'}},
+            },
+            'required': ['items', 'extra'],
+            'additionalProperties': False,
+        },
+    },
+}
+
+# 提示中的检查条目编号（markdown 检查单的 **CHKI_01** 与紧凑检查单的 CHKI_01|）
+_ITEM_ID_PATTERN = re.compile(r'\*\*(CHKI_\d+)\*\*|^(CHKI_\d+)\|', re.MULTILINE)
+_ID_PATTERN = re.compile(r'^CHKI_\d+$')
+_THINK_PATTERN = re.compile(r'<think>.*?</think>', re.DOTALL)
+
+class StructuredOutputError(ValueError):
+    """回复不是有效的结构化评审结果"""
+
+def get_output_format():
+    """评审输出格式（REVIEW_OUTPUT_FORMAT 环境变量，默认 text）"""
+    load_env()
+    output_format = os.getenv('REVIEW_OUTPUT_FORMAT', 'text').lower()
+    return output_format if output_format in OUTPUT_FORMATS else 'text'
+
+def set_output_format(output_format):
+    """命令行 --output-format：设置本次运行的输出格式"""
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"不支持的输出格式: {output_format}（可选 {', '.join(OUTPUT_FORMATS)}）")
+    os.environ['REVIEW_OUTPUT_FORMAT'] = output_format
+
+def is_structured(output_format=None):
+    return (output_format or get_output_format()) == 'json'
+
+def structured_prompt(prompt):
+    """JSON 模式的评审提示"""
+    return prompt + JSON_INSTRUCTIONS
+
+def expected_item_ids(prompt):
+    """提示中检查单的条目编号（按出现顺序去重）"""
+    ids = []
+    for match in _ITEM_ID_PATTERN.finditer(prompt or ''):
+        item_id = match.group(1) or match.group(2)
+        if item_id not in ids:
+            ids.append(item_id)
+    return ids
+
+# 拒绝过 response_format 参数的端点（base_url, 模型），之后只用提示约束输出
+_unsupported = set()
+_unsupported_lock = threading.Lock()
+
+def get_response_format(config):
+    """
+    按端点选择 response_format
+
+    auto：OpenAI 使用严格的响应结构，推理模型（如 deepseek-reasoner，不支持 JSON 输出参数）不发送，
+    其他模型使用 JSON 模式；端点拒绝过该参数时不再发送。
+    """
+    load_env()
+    mode = os.getenv('STRUCTURED_RESPONSE_FORMAT', 'auto').lower()
+    if mode not in RESPONSE_FORMAT_MODES:
+        mode = 'auto'
+    key = (getattr(config, 'base_url', None), getattr(config, 'model_name', None))
+    with _unsupported_lock:
+        if key in _unsupported:
+            return None
+    if mode == 'auto':
+        if getattr(config, 'provider', None) == 'openai':
+            mode = 'schema'
+        elif 'reasoner' in (getattr(config, 'model_name', None) or ''):
+            mode = 'none'
+        else:
+            mode = 'json_object'
+    if mode == 'schema':
+        return RESPONSE_SCHEMA
+    if mode == 'json_object':
+        return {'type': 'json_object'}
+    return None
+
+# 针对 response_format 参数的错误信息（其他参数错误，例如上下文超长，不应停用结构化输出）
+_FORMAT_ERROR_PATTERN = re.compile(r'response_format|json_schema|json_object', re.IGNORECASE)
+
+def rejects_response_format(error):
+    """调用失败是否因为端点不支持 response_format 参数"""
+    return bool(_FORMAT_ERROR_PATTERN.search(error or ''))
+
+def mark_unsupported(config):
+    with _unsupported_lock:
+        _unsupported.add((getattr(config, 'base_url', None), getattr(config, 'model_name', None)))
+
+def parse_structured(text, expected_ids=None):
+    """
+    解析并校验 JSON 评审结果
+
+    Args:
+        text: 模型回复（允许包含思考过程与 Markdown 代码块）
+        expected_ids: 提示中的条目编号；给出时缺少任一条目即无效，多出的条目忽略
+
+    Returns:
+        ([(条目ID, 结论, 理由), ...], [额外问题, ...])
+
+    Raises:
+        StructuredOutputError: 不是有效的 JSON 或不符合结构
+    """
+    body = _THINK_PATTERN.sub('', text or '')
+    data = None
+    error = "回复中没有 JSON"
+    # 先按对象解析，再按（直接返回的）条目数组解析
+    for open_char, close_char in (('{', '}'), ('[', ']')):
+        start, end = body.find(open_char), body.rfind(close_char)
+        if start == -1 or end <= start:
+            continue
+        try:
+            data = json.loads(body[start:end + 1])
+            break
+        except json.JSONDecodeError as e:
+            error = f"JSON 解析失败: {e}"
+    if not isinstance(data, (dict, list)):
+        raise StructuredOutputError(error)
+
+    raw_items, raw_extra = (data, []) if isinstance(data, list) else (data.get('items'), data.get('extra') or [])
+    if not isinstance(raw_items, list) or not isinstance(raw_extra, list):
+        raise StructuredOutputError("items / extra 不是数组")
+
+    items = {}
+    for entry in raw_items:
+        if not isinstance(entry, dict):
+            raise StructuredOutputError("条目不是对象")
+        item_id = str(entry.get('id', '')).strip().strip('[]')
+        verdict = str(entry.get('result', '')).strip()
+        if not _ID_PATTERN.match(item_id) or verdict not in VERDICTS:
+            raise StructuredOutputError(f"条目无效: {entry}")
+        if expected_ids and item_id not in expected_ids:
+            continue
+        # 结果行按行解析，理由中不能有换行
+        items.setdefault(item_id, (item_id, verdict, " ".join(str(entry.get('reason') or '').split())))
+    missing = [item_id for item_id in expected_ids or [] if item_id not in items]
+    if missing:
+        raise StructuredOutputError(f"缺少条目 {', '.join(missing)}")
+    order = expected_ids or list(items)
+    extra = [" ".join(str(issue).split()) for issue in raw_extra if str(issue).strip()]
+    return [items[item_id] for item_id in order], extra
+
+def to_review_text(items, extra):
+    """转换为标准格式的评审文本"""
+    body = "[评审结果]\n" + "\n".join(format_item_line(*item) for item in items) + "\n"
+    if extra:
+        body += f"\n{EXTRA_ISSUES_HEADING}\n" + "\n".join(f"- {issue}" for issue in extra) + "\n"
+    return body + "[/评审结果]"
+
+def normalize(text, expected_ids):
+    """
+    把 JSON 回复转换为标准评审文本
+
+    Returns:
+        (评审文本, 来源)，来源为 'json'，或模型仍按文本格式完整作答时为 'text'；无效时评审文本为 None
+    """
+    try:
+        return to_review_text(*parse_structured(text, expected_ids)), 'json'
+    except StructuredOutputError:
+        answered = {item_id for item_id, _, _ in parse_item_verdicts(text)}
+        if answered and answered.issuperset(expected_ids or []):
+            return text, 'text'
+        return None, None
+
+class StructuredStats:
+    """JSON 模式的调用统计：有效率、回退次数、输出 token、耗时与本地解析耗时"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.valid = 0
+        self.text_answers = 0
+        self.fallbacks = 0
+        self.completion_tokens = 0
+        self.seconds = 0.0
+        self.parse_seconds = 0.0
+
+    def record(self, source, completion_tokens, seconds, parse_seconds):
+        with self._lock:
+            self.calls += 1
+            if source == 'json':
+                self.valid += 1
+            elif source == 'text':
+                self.text_answers += 1
+            else:
+                self.fallbacks += 1
+            self.completion_tokens += completion_tokens
+            self.seconds += seconds
+            self.parse_seconds += parse_seconds
+
+    def format_report(self):
+        with self._lock:
+            if not self.calls:
+                return "结构化输出: 未调用"
+            return (f"结构化输出: {self.calls} 次评审，JSON 有效 {self.valid} 次，按文本格式作答 {self.text_answers} 次，"
+                    f"回退文本提示 {self.fallbacks} 次；平均输出 {self.completion_tokens / self.calls:.0f} token，"
+                    f"耗时 {self.seconds / self.calls:.1f} 秒，本地解析 {self.parse_seconds / self.calls * 1000:.2f} 毫秒")
+
+_stats = StructuredStats()
+
+def get_structured_stats():
+    return _stats
+
+def complete_structured(config, prompt, max_tokens, votes, fallback):
+    """
+    以 JSON 模式评审，返回 LLMResult（评审文本已转换为标准格式）
+
+    Args:
+        prompt: 原评审提示（JSON 输出要求在此追加）
+        votes: 样本数，大于 1 时各样本分别校验，无效的样本不参与投票
+        fallback: 无参数的可调用对象，JSON 模式未得到有效结果时以文本格式提示重新评审
+    """
+    from llm_client import complete
+    from model_config import build_review_messages, vote_complete
+
+    expected = expected_item_ids(prompt)
+    messages = build_review_messages(structured_prompt(prompt))
+    start = time.time()
+    parse_seconds = [0.0]
+
+    def convert(text):
+        parse_start = time.perf_counter()
+        converted = normalize(text, expected)
+        parse_seconds[0] += time.perf_counter() - parse_start
+        return converted
+
+    def call(response_format):
+        if votes > 1:
+            return vote_complete(config, messages, votes, max_tokens, response_format=response_format,
+                                 normalize=lambda text: convert(text)[0])
+        return complete(config, messages, max_tokens=max_tokens, temperature=0.7, response_format=response_format)
+
+    response_format = get_response_format(config)
+    result = call(response_format)
+    if not result.ok and result.error_class == 'bad_request' and response_format and \
+            rejects_response_format(result.error):
+        # 端点不支持 response_format：记下后只用提示约束输出
+        mark_unsupported(config)
+        result = call(None)
+    source = 'json'
+    if votes > 1 and result.error_class == 'invalid_output':
+        source = None
+    elif not result.ok:
+        return result
+    elif votes <= 1:
+        text, source = convert(result.text)
+        if text is not None:
+            result.text = text
+    completion_tokens = (result.usage or {}).get('completion_tokens', 0)
+    if source is None:
+        result = fallback()
+        completion_tokens += (result.usage or {}).get('completion_tokens', 0)
+    _stats.record(source, completion_tokens, time.time() - start, parse_seconds[0])
+    return result
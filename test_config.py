@@ -1,7 +1,7 @@
 #!/usr/bin/env python3
 """
 模型配置测试脚本
-用于验证大模型配置是否正确
+用于验证大模型配置是否正确；--probe 时逐级提高并发探测端点容量，推荐并发与限速设置
 """
 
 import os
@@ -76,22 +76,87 @@ DEEPSEEK_URL=https://api.deepseek.com/v1
 # DEEPSEEK_MODEL=deepseek-reasoner"""
     print(template)
 
-if __name__ == "__main__":
+def run_load_probe(mock=False, max_concurrency=16, requests_per_level=None, write_env=False):
+    """并发负载探测，返回是否成功"""
+    import load_probe
+    import token_budget
+
+    print("📈 并发负载探测...")
+    print("="*50)
+    try:
+        config = load_probe.get_config(mock)
+        messages, item_count = load_probe.build_probe_messages()
+        prompt_tokens, max_tokens = token_budget.plan_max_tokens(messages, config.model_name, item_count)
+    except Exception as e:
+        print(f"❌ 探测准备失败: {str(e)}")
+        return False
+
+    levels = load_probe.ramp_levels(max_concurrency)
+    planned = sum(load_probe.requests_for_level(level, requests_per_level) for level in levels)
+    print(f"🎯 端点: {config.base_url}（模型 {config.model_name}）")
+    print(f"📝 探测提示: 约 {prompt_tokens} token，{item_count} 个检查条目，max_tokens={max_tokens}")
+    print(f"🔀 并发级别: {', '.join(str(level) for level in levels)}（最多 {planned} 次调用）")
+    if not mock:
+        print("⚠️  探测会向真实端点发送请求并计费，出现过载后立即停止加压")
+    print()
+    print(load_probe.LEVEL_HEADER)
+    results = load_probe.run_probe(
+        config, messages, max_tokens, max_concurrency, requests_per_level,
+        on_level=lambda level: print(load_probe.format_level(level), flush=True))
+
+    if all(level['ok'] == 0 for level in results):
+        print(f"\n❌ 探测请求全部失败: {results[0]['sample_error']}")
+        return False
+
+    settings, reason = load_probe.recommend(results)
+    print(f"\n💡 推荐设置: {reason}")
+    for key, value in settings.items():
+        print(f"   {key}={value}")
+    if write_env:
+        load_probe.update_env_file('.env', settings)
+        print("✅ 已写入 .env")
+    else:
+        print("   （加 --write-env 写入 .env）")
+    return True
+
+def main(probe=False, mock=False, max_concurrency=16, requests_per_level=None, write_env=False):
+    """运行配置测试，返回进程退出码"""
     print("🚀 大模型配置测试工具")
     print("="*50)
     
+    # 本地模拟端点不需要 API 配置
+    if probe and mock:
+        return 0 if run_load_probe(True, max_concurrency, requests_per_level, write_env) else 1
+    
     # 检查.env文件是否存在
     if not os.path.exists('.env'):
         print("⚠️  .env 文件不存在!")
         show_env_template()
         print("\n请创建 .env 文件并配置相应的API密钥")
-        sys.exit(1)
+        return 1
     
     # 运行测试
     success = test_model_config()
     
     if not success:
         show_env_template()
-        sys.exit(1)
+        return 1
+    
+    if probe:
+        print()
+        if not run_load_probe(False, max_concurrency, requests_per_level, write_env):
+            return 1
     
     print("\n✨ 配置验证完成，可以开始使用评审工具了!")
+    return 0
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description='大模型配置测试')
+    parser.add_argument('--probe', action='store_true', help='逐级提高并发探测端点容量，推荐并发与限速设置')
+    parser.add_argument('--mock', action='store_true', help='探测本地模拟端点（不发送真实请求）')
+    parser.add_argument('--max-concurrency', type=int, default=16, help='探测的最高并发')
+    parser.add_argument('--probe-requests', type=int, default=None, help='每一级发送的请求数（默认为并发数的 2 倍，至少 4 个）')
+    parser.add_argument('--write-env', action='store_true', help='把推荐设置写入 .env')
+    args = parser.parse_args()
+    sys.exit(main(args.probe, args.mock, args.max_concurrency, args.probe_requests, args.write_env))
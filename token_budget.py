@@ -0,0 +1,204 @@
+"""
+提示 token 预算
+在发送请求前本地估算提示 token 数，并按检查条目数与历史输出长度选择 max_tokens：
+- 安装了 tiktoken 时使用 cl100k_base 编码计数，否则按字符类别估算
+- 每次调用后用实际 usage 校准估算值，并记录每个检查条目的输出 token 数
+- 提示加上预期输出超过模型上下文窗口时，在发送前拒绝（或由调用方拆分）
+"""
+
+import os
+import re
+import threading
+from collections import deque
+
+from model_config import load_env
+
+# 各模型的 (上下文窗口, 最大输出 token)
+MODEL_LIMITS = {
+    'deepseek-reasoner': (65536, 32768),
+    'deepseek-chat': (65536, 8192),
+    'deepseek-coder': (65536, 8192),
+    'gpt-4o': (128000, 16384),
+    'gpt-4': (8192, 4096),
+    'gpt-3.5-turbo': (16385, 4096),
+}
+DEFAULT_LIMITS = (32768, 8192)
+
+# 推理模型的思考过程同样计入输出 token
+REASONING_MODELS = ('deepseek-reasoner',)
+
+# 历史样本不足时每个检查条目预计的输出 token（推理模型 / 普通模型）与固定开销
+DEFAULT_TOKENS_PER_ITEM = {'reasoning': 900, 'chat': 300}
+BASE_OUTPUT_TOKENS = 600
+
+# 最少输出 token 与上下文安全余量
+MIN_OUTPUT_TOKENS = 1024
+SAFETY_MARGIN = 256
+
+# 检查条目标记，例如：**CHKI_01**，紧凑格式为行首的 CHKI_01|
+_ITEM_PATTERN = re.compile(r'\*\*(CHKI_\d+)\*\*|^(CHKI_\d+)\|', re.MULTILINE)
+
+# 中日韩字符（按字符估算时约 0.8 token/字，其余约 0.3 token/字符）
+_CJK_PATTERN = re.compile(r'[\u3000-\u303f\u3400-\u4dbf\u4e00-\u9fff\uff00-\uffef]')
+
+class PromptTooLarge(Exception):
+    """提示超出模型上下文窗口"""
+
+_encoder = None
+_encoder_loaded = False
+
+def _get_encoder():
+    """tiktoken 编码器（未安装或加载失败时返回 None）"""
+    global _encoder, _encoder_loaded
+    if not _encoder_loaded:
+        _encoder_loaded = True
+        try:
+            import tiktoken
+            _encoder = tiktoken.get_encoding('cl100k_base')
+        except Exception:
+            _encoder = None
+    return _encoder
+
+def estimate_tokens(text):
+    """本地估算文本的 token 数（未经 usage 校准）"""
+    if not text:
+        return 0
+    encoder = _get_encoder()
+    if encoder is not None:
+        return len(encoder.encode(text, disallowed_special=()))
+    cjk = len(_CJK_PATTERN.findall(text))
+    return int(cjk * 0.8 + (len(text) - cjk) * 0.3) + 1
+
+def estimate_messages_tokens(messages):
+    """估算对话消息的 token 数（每条消息约 4 个格式 token）"""
+    return sum(estimate_tokens(message.get('content', '')) + 4 for message in messages) + 2
+
+def count_checklist_items(prompt):
+    """提示中包含的检查条目数（按条目编号去重，模板中重复出现的检查单只计一次）"""
+    return len({markdown_id or compact_id for markdown_id, compact_id in _ITEM_PATTERN.findall(prompt or '')})
+
+def get_model_limits(model_name):
+    """模型的 (上下文窗口, 最大输出 token)，可用 LLM_CONTEXT_WINDOW / LLM_MAX_OUTPUT 覆盖"""
+    load_env()
+    context, max_output = MODEL_LIMITS.get(model_name, DEFAULT_LIMITS)
+    context = int(os.getenv('LLM_CONTEXT_WINDOW', context))
+    max_output = int(os.getenv('LLM_MAX_OUTPUT', max_output))
+    return context, max_output
+
+def is_adaptive_enabled():
+    """是否按预算自动选择 max_tokens（LLM_ADAPTIVE_TOKENS，默认启用）"""
+    load_env()
+    return os.getenv('LLM_ADAPTIVE_TOKENS', '1').lower() not in ('0', 'false', 'no', 'off')
+
+class TokenHistory:
+    """
+    各模型的 token 统计
+
+    - 每个检查条目的输出 token（取滑动窗口内的 P95 再乘以余量作为预期输出）
+    - 实际提示 token 与本地估算值之比，用于校准估算
+    """
+
+    def __init__(self, window=200, min_samples=5, headroom=1.5):
+        self.window = window
+        self.min_samples = min_samples
+        self.headroom = headroom
+        self._per_item = {}
+        self._calibration = {}
+        self._lock = threading.Lock()
+
+    def record(self, model_name, item_count, estimated_prompt, usage):
+        """记录一次成功调用的 usage"""
+        usage = usage or {}
+        with self._lock:
+            if usage.get('completion_tokens') and item_count:
+                samples = self._per_item.setdefault(model_name, deque(maxlen=self.window))
+                samples.append(max(0, usage['completion_tokens'] - BASE_OUTPUT_TOKENS) / item_count)
+            if usage.get('prompt_tokens') and estimated_prompt:
+                ratio = usage['prompt_tokens'] / estimated_prompt
+                previous = self._calibration.get(model_name)
+                self._calibration[model_name] = ratio if previous is None else previous * 0.8 + ratio * 0.2
+
+    def calibration(self, model_name):
+        with self._lock:
+            return self._calibration.get(model_name, 1.0)
+
+    def tokens_per_item(self, model_name):
+        """每个检查条目预计的输出 token"""
+        with self._lock:
+            samples = sorted(self._per_item.get(model_name, ()))
+        if len(samples) < self.min_samples:
+            kind = 'reasoning' if model_name in REASONING_MODELS else 'chat'
+            return DEFAULT_TOKENS_PER_ITEM[kind]
+        return samples[int(0.95 * (len(samples) - 1))] * self.headroom
+
+    def expected_output(self, model_name, item_count):
+        return int(BASE_OUTPUT_TOKENS + self.tokens_per_item(model_name) * max(item_count, 1))
+
+_history = TokenHistory()
+
+def get_token_history():
+    return _history
+
+def count_prompt_tokens(messages, model_name):
+    """按历史 usage 校准后的提示 token 估算"""
+    return int(estimate_messages_tokens(messages) * _history.calibration(model_name))
+
+def required_output_tokens(model_name, item_count):
+    """预计需要的输出 token（不超过模型的最大输出）"""
+    _, max_output = get_model_limits(model_name)
+    return max(MIN_OUTPUT_TOKENS, min(_history.expected_output(model_name, item_count), max_output))
+
+def fits_context(messages, model_name, item_count):
+    """提示与预期输出能否放入模型上下文窗口"""
+    context, _ = get_model_limits(model_name)
+    return count_prompt_tokens(messages, model_name) + required_output_tokens(model_name, item_count) \
+        + SAFETY_MARGIN <= context
+
+def plan_max_tokens(messages, model_name, item_count):
+    """
+    为一次调用选择 max_tokens
+
+    Returns:
+        (估算的提示 token, max_tokens)
+
+    Raises:
+        PromptTooLarge: 上下文窗口放不下提示和最少的输出
+    """
+    context, _ = get_model_limits(model_name)
+    prompt_tokens = count_prompt_tokens(messages, model_name)
+    available = context - prompt_tokens - SAFETY_MARGIN
+    if available < MIN_OUTPUT_TOKENS:
+        raise PromptTooLarge(
+            f"提示约 {prompt_tokens} token，超出 {model_name} 的上下文窗口 {context} token")
+    return prompt_tokens, min(required_output_tokens(model_name, item_count), available)
+
+def split_to_fit(blocks, render_messages, model_names, item_count):
+    """
+    把文本块按原顺序分组，使每组渲染后的提示与预期输出都能放入所有模型的上下文窗口
+
+    Args:
+        blocks: 文本块列表（例如接口中的逐条需求）
+        render_messages: 函数，接收拼接后的文本，返回完整的对话消息
+        model_names: 会收到该提示的模型（级联评审时包括快速模型）
+
+    Returns:
+        分组后的文本块列表；单个文本块本身超出预算时单独成组（发送前会被拒绝）
+    """
+    base = {name: count_prompt_tokens(render_messages(""), name) for name in model_names}
+    limit = {
+        name: get_model_limits(name)[0] - required_output_tokens(name, item_count) - SAFETY_MARGIN
+        for name in model_names
+    }
+    groups, current, used = [], [], dict(base)
+    for block in blocks:
+        tokens = estimate_tokens(block)
+        cost = {name: int(tokens * _history.calibration(name)) for name in model_names}
+        if current and any(used[name] + cost[name] > limit[name] for name in model_names):
+            groups.append(current)
+            current, used = [], dict(base)
+        current.append(block)
+        for name in model_names:
+            used[name] += cost[name]
+    if current:
+        groups.append(current)
+    return groups
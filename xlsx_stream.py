@@ -0,0 +1,223 @@
+"""
+流式 xlsx 写入模块
+逐行写出结果/汇总工作簿，内存占用不随行数增长：
+优先使用 xlsxwriter 的 constant_memory 模式，未安装时退回 openpyxl 的 write_only 模式。
+达到 Excel 行数上限时自动切换到新工作表（可选按行数拆分为多个文件），
+超过单元格字符上限的文本截断写入原单元格，完整内容按片段写入“溢出内容”工作表。
+"""
+
+import os
+import re
+import math
+
+# Excel 格式限制
+EXCEL_MAX_ROWS = 1048576
+EXCEL_MAX_CELL_CHARS = 32767
+
+OVERFLOW_SHEET = '溢出内容'
+OVERFLOW_COLUMNS = ['工作表', '行号', '列名', '片段序号', '内容']
+
+# XML 不允许的控制字符（openpyxl 遇到会直接报错）
+_ILLEGAL_CHARS = re.compile(r'[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+def _cell_value(value):
+    """把 pandas/numpy 值转换为可写入的普通 Python 值"""
+    if value is None:
+        return None
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    if hasattr(value, 'item') and not isinstance(value, (str, bytes)):
+        try:
+            value = value.item()
+        except (ValueError, TypeError):
+            value = str(value)
+    if isinstance(value, str):
+        value = _ILLEGAL_CHARS.sub('', value)
+    return value
+
+class _XlsxWriterBackend:
+    """xlsxwriter constant_memory 后端"""
+
+    def __init__(self, path):
+        import xlsxwriter
+        self.book = xlsxwriter.Workbook(path, {
+            'constant_memory': True,
+            'strings_to_urls': False,
+            'strings_to_formulas': False,
+            'strings_to_numbers': False,
+        })
+
+    def add_sheet(self, name):
+        sheet = self.book.add_worksheet(name)
+        return [sheet, 0]
+
+    def append(self, handle, values):
+        sheet, row = handle
+        sheet.write_row(row, 0, values)
+        handle[1] = row + 1
+
+    def close(self):
+        self.book.close()
+
+class _OpenpyxlBackend:
+    """openpyxl write_only 后端"""
+
+    def __init__(self, path):
+        from openpyxl import Workbook
+        self.path = path
+        self.book = Workbook(write_only=True)
+
+    def add_sheet(self, name):
+        return self.book.create_sheet(name)
+
+    def append(self, handle, values):
+        handle.append(values)
+
+    def close(self):
+        self.book.save(self.path)
+
+def _open_backend(path):
+    try:
+        return _XlsxWriterBackend(path)
+    except ImportError:
+        return _OpenpyxlBackend(path)
+
+class StreamingXlsxWriter:
+    """
+    流式工作簿写入器
+
+    用法：
+        with StreamingXlsxWriter(path, columns) as writer:
+            for row in rows:
+                writer.write_row(row)
+        print(writer.paths)  # 实际写出的文件（拆分时有多个）
+
+    Args:
+        path: 输出文件路径
+        columns: 列名列表；write_row 接收字典（按列名取值）或按列顺序排列的序列
+        sheet_name: 工作表名称，行数超限时依次使用 “名称_2”、“名称_3” ...
+        max_rows_per_sheet: 每个工作表的最大数据行数（不含表头）
+        max_rows_per_file: 每个文件的最大数据行数，超过后写入 “文件名_part2.xlsx” 等新文件；None 表示不拆分文件
+    """
+
+    def __init__(self, path, columns, sheet_name='Sheet1',
+                 max_rows_per_sheet=EXCEL_MAX_ROWS - 1, max_rows_per_file=None):
+        self.base_path = path
+        self.columns = list(columns)
+        self.sheet_name = sheet_name
+        self.max_rows_per_sheet = max_rows_per_sheet
+        self.max_rows_per_file = max_rows_per_file
+        self.paths = []
+        self.rows_written = 0
+        self.overflow_cells = 0
+        self._backend = None
+        self._file_rows = 0
+        self._sheet = None
+        self._sheet_rows = 0
+        self._sheet_index = 0
+        self._current_sheet_name = None
+        self._overflow = None
+        self._overflow_rows = 0
+        self._overflow_index = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+    def _file_path(self, part):
+        if part == 1:
+            return self.base_path
+        root, ext = os.path.splitext(self.base_path)
+        return f"{root}_part{part}{ext}"
+
+    def _open_file(self):
+        if self._backend is not None:
+            self._backend.close()
+        path = self._file_path(len(self.paths) + 1)
+        self._backend = _open_backend(path)
+        self.paths.append(path)
+        self._file_rows = 0
+        self._sheet = None
+        self._sheet_index = 0
+        self._overflow = None
+        self._overflow_index = 0
+
+    def _new_sheet(self):
+        self._sheet_index += 1
+        name = self.sheet_name if self._sheet_index == 1 else f"{self.sheet_name}_{self._sheet_index}"
+        self._current_sheet_name = name
+        self._sheet = self._backend.add_sheet(name)
+        self._backend.append(self._sheet, self.columns)
+        self._sheet_rows = 0
+
+    def _new_overflow_sheet(self):
+        self._overflow_index += 1
+        name = OVERFLOW_SHEET if self._overflow_index == 1 else f"{OVERFLOW_SHEET}_{self._overflow_index}"
+        self._overflow = self._backend.add_sheet(name)
+        self._backend.append(self._overflow, OVERFLOW_COLUMNS)
+        self._overflow_rows = 0
+
+    def _write_overflow(self, row_number, column, text):
+        """把超长文本按片段写入溢出工作表，返回截断后写入原单元格的文本"""
+        chunks = [text[i:i + EXCEL_MAX_CELL_CHARS] for i in range(0, len(text), EXCEL_MAX_CELL_CHARS)]
+        for part, chunk in enumerate(chunks, 1):
+            if self._overflow is None or self._overflow_rows >= self.max_rows_per_sheet:
+                self._new_overflow_sheet()
+            self._backend.append(self._overflow, [self._current_sheet_name, row_number, column, part, chunk])
+            self._overflow_rows += 1
+        self.overflow_cells += 1
+        marker = f"...[内容过长，完整内容见“{OVERFLOW_SHEET}”工作表]"
+        return text[:EXCEL_MAX_CELL_CHARS - len(marker)] + marker
+
+    def write_row(self, row):
+        """写入一行数据"""
+        if self._backend is None or (
+                self.max_rows_per_file is not None and self._file_rows >= self.max_rows_per_file):
+            self._open_file()
+        if self._sheet is None or self._sheet_rows >= self.max_rows_per_sheet:
+            self._new_sheet()
+
+        if isinstance(row, dict):
+            values = [_cell_value(row.get(column)) for column in self.columns]
+        else:
+            values = [_cell_value(value) for value in row]
+
+        # 表头占第 1 行，数据行号从 2 开始（与 Excel 中看到的行号一致）
+        row_number = self._sheet_rows + 2
+        for i, value in enumerate(values):
+            if isinstance(value, str) and len(value) > EXCEL_MAX_CELL_CHARS:
+                values[i] = self._write_overflow(row_number, self.columns[i], value)
+
+        self._backend.append(self._sheet, values)
+        self._sheet_rows += 1
+        self._file_rows += 1
+        self.rows_written += 1
+
+    def write_rows(self, rows):
+        """写入多行数据"""
+        for row in rows:
+            self.write_row(row)
+
+    def close(self):
+        """结束写入并关闭文件；一行都未写入时仍生成只有表头的工作簿"""
+        if self._backend is None:
+            self._open_file()
+            self._new_sheet()
+        self._backend.close()
+        self._backend = None
+        return self.paths
+
+def write_rows_streaming(path, columns, rows, sheet_name='Sheet1', max_rows_per_file=None):
+    """
+    以流式方式把多行数据写入工作簿
+
+    Returns:
+        实际写出的文件路径列表
+    """
+    with StreamingXlsxWriter(path, columns, sheet_name=sheet_name,
+                             max_rows_per_file=max_rows_per_file) as writer:
+        writer.write_rows(rows)
+    return writer.paths